@@ -1,24 +1,26 @@
+from __future__ import annotations
+
 import json
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from os.path import basename
+from typing import TYPE_CHECKING
 
-from aws_cloudwatch_logs_url import create_url_log_events
-from aws_lambda_powertools.logging.types import (
-    PowertoolsLogRecord,
-    PowertoolsStackTrace,
-)
-from aws_lambda_powertools.utilities.data_classes import (
-    event_source,
-)
-from aws_lambda_powertools.utilities.data_classes.cloud_watch_logs_event import (
-    CloudWatchLogsEvent,
-    CloudWatchLogsLogEvent,
-)
-
-from utils.aws import create_client
+from utils.aws import get_client
 from utils.dataclasses import load_environments
-from utils.logger import create_logger, logging_function, logging_handler
+from utils.logger import create_logger, logging_function, logging_handler, metrics
+
+# the data classes tree and the URL helper are only needed once an event
+# arrives, so they stay out of the cold start
+if TYPE_CHECKING:
+    from aws_lambda_powertools.logging.types import (
+        PowertoolsLogRecord,
+        PowertoolsStackTrace,
+    )
+    from aws_lambda_powertools.utilities.data_classes.cloud_watch_logs_event import (
+        CloudWatchLogsEvent,
+        CloudWatchLogsLogEvent,
+    )
 
 
 @dataclass(frozen=True)
@@ -40,17 +42,20 @@ JST = timezone(offset=timedelta(hours=+9), name="JST")
 logger = create_logger(__name__)
 
 
-@event_source(data_class=CloudWatchLogsEvent)
-@logging_handler(logger)
-def handler(event: CloudWatchLogsEvent, context):
-    main(event=event)
+@logging_handler(logger, metrics=metrics)
+def handler(event: dict, context):
+    from aws_lambda_powertools.utilities.data_classes.cloud_watch_logs_event import (
+        CloudWatchLogsEvent,
+    )
+
+    main(event=CloudWatchLogsEvent(event))
 
 
 @logging_function(logger)
 def main(
     *,
     event: CloudWatchLogsEvent,
-    client_events=create_client("events"),
+    client_events=None,
 ):
     env = load_environments(class_dataclass=EnvironmentVariables)
     decompressed_log = event.parse_logs_data()
@@ -64,10 +69,13 @@ def main(
         )
         for log_event in decompressed_log.log_events
     ]
+    metrics.add("LogEventsParsed", len(messages))
     for i, m in enumerate(messages):
         logger.debug(f"log_event {i}", data={"index": i, "message": json.loads(m)})
     put_events(
-        messages=messages, event_bus_name=env.event_bus_name, client=client_events
+        messages=messages,
+        event_bus_name=env.event_bus_name,
+        client=get_client("events") if client_events is None else client_events,
     )
 
 
@@ -125,6 +133,8 @@ def create_url_logs(
     timestamp: int,
     function_request_id: str | None,
 ) -> str:
+    from aws_cloudwatch_logs_url import create_url_log_events
+
     if function_request_id is None:
         start = timestamp - 900_000  # 1000 ms/s * 60 s/m * 15 m = 900,000 ms
         end = timestamp + 10_000
@@ -272,12 +282,15 @@ def put_events(*, messages: list[str], event_bus_name: str, client):
             )
 
         resp = client.put_events(Entries=entries)
+        metrics.add("PutEventsBatches")
+        metrics.add("PutEventsEntries", len(entries))
         failed_keys = []
         for k, entry in zip(keys, resp["Entries"]):
             if "EventId" in entry:
                 union_succeeded.add(k)
             else:
                 failed_keys.append(k)
+        metrics.add("PutEventsFailedEntries", len(failed_keys))
 
         if len(failed_keys) > 0:
             logger.warning("failed to put events", data={"failed index": failed_keys})
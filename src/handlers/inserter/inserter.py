@@ -1,31 +1,82 @@
+from __future__ import annotations
+
 import json
+from collections import deque
+from collections.abc import Callable, Generator, Iterable
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
-from functools import cache
-from time import sleep
+from itertools import islice
+from threading import Event
+from time import monotonic, perf_counter
+from typing import TYPE_CHECKING, Literal
 from urllib.error import HTTPError
 from urllib.request import Request
 
-from mypy_boto3_s3 import S3Client
-from mypy_boto3_sns import SNSClient
-from mypy_boto3_ssm import SSMClient
-from pydantic_settings import BaseSettings
+from pydantic import BaseModel
+
+from utils.aws import get_client, parameter_cache
+from utils.dataclasses import load_environments
+from utils.http import (
+    client_contentful,
+    client_notion,
+    limiter_contentful,
+    limiter_notion,
+    retry_budget,
+)
+from utils.logger import create_logger, logging_function, logging_handler, metrics
+from utils.models import Article, Author, CachedData, Checkpointer, Codec, ResumePoint
 
-from utils.aws import create_client
-from utils.http import client_contentful, client_notion
-from utils.logger import create_logger, logging_function, logging_handler
-from utils.models import Article, Author, CachedData
+if TYPE_CHECKING:
+    from mypy_boto3_s3 import S3Client
+    from mypy_boto3_sns import SNSClient
+    from mypy_boto3_ssm import SSMClient
 
 jst = timezone(offset=timedelta(hours=+9), name="JST")
 logger = create_logger(__name__)
 
+URL_CONTENTFUL_SPACE = (
+    "https://api.contentful.com/spaces/ct0aopd36mqt/environments/master"
+)
+URL_NOTION_API = "https://api.notion.com/v1"
+NOTION_VERSION = "2022-06-28"
+PAGE_SIZE_NOTION = 100
+BATCH_SIZE_LINKED = 100
+LIMIT_LISTING = 100
+SyncMode = Literal["incremental", "full", "watermark"]
+QUERY_BLOG_POST = (
+    "fields.referenceCategory.en-US.sys.id=1DdS3IwWwqYx0N3Vwtn0e6&content_type=blogPost"
+)
+
 
-class EnvironmentVariables(BaseSettings):
+class EnvironmentVariables(BaseModel):
     ssm_parameter_name_token_contentful: str
     ssm_parameter_name_notion_database_id: str
     ssm_parameter_name_notion_token: str
     bucket_name_data: str
     sns_topic_arn: str
+    sync_mode: SyncMode = "incremental"
+    watermark_overlap_seconds: float = 86400.0
+    contentful_page_workers: int = 4
+    notion_insert_workers: int = 3
+    insert_queue_depth: int = 6
+    checkpoint_every_inserts: int = 20
+    checkpoint_every_seconds: float = 60.0
+    compaction_min_segments: int = 24
+    cached_data_codec: str = "json+gzip:6"
+    cached_data_spill_dir: str | None = None
+    notion_rebuild_workers: int = 3
+    notion_rebuild_partitions: int = 8
+    notion_rebuild_since: str = "2019-01-01T00:00:00+00:00"
+    deadline_margin_seconds: float = 60.0
+    self_invoke: bool = False
+    self_invoke_max_depth: int = 3
 
 
 @dataclass(frozen=True)
@@ -35,57 +86,233 @@ class SsmParameters:
     notion_token: str
 
 
-@logging_handler(logger)
+@dataclass(frozen=True)
+class InsertResult:
+    inserted: int
+    seconds: float
+    inserts_per_second: float
+    interrupted: bool = False
+
+
+@dataclass(frozen=True)
+class Partition:
+    after: datetime | None
+    before: datetime | None
+
+
+@dataclass
+class ListingState:
+    sync_cursor: str | None
+    watermark: str | None = None
+    partial: bool = False
+    # a newest first scan without a cursor, which can resume at position, the
+    # createdAt of the last item handed downstream
+    resumable: bool = False
+    position: str | None = None
+    pages: int = 0
+    items: int = 0
+    new_items: int = 0
+
+
+class InvalidSyncCursorError(Exception):
+    pass
+
+
+@logging_handler(logger, metrics=metrics)
 def handler(event, context):
-    main()
+    remaining_seconds = context.get_remaining_time_in_millis() / 1000
+    retry_budget.reset(remaining_seconds=remaining_seconds)
+    main(
+        deadline=monotonic() + remaining_seconds,
+        function_name=context.invoked_function_arn,
+        depth=event.get("ResumeDepth", 0) if isinstance(event, dict) else 0,
+    )
 
 
 @logging_function(logger)
 def main(
     *,
-    client_ssm: SSMClient = create_client("ssm"),
-    client_s3: S3Client = create_client("s3"),
-    client_sns: SNSClient = create_client("sns"),
+    client_ssm: SSMClient | None = None,
+    client_s3: S3Client | None = None,
+    client_sns: SNSClient | None = None,
+    client_lambda=None,
+    deadline: float | None = None,
+    function_name: str | None = None,
+    depth: int = 0,
 ):
-    # noinspection PyArgumentList
-    env = EnvironmentVariables()
+    # clients come from the shared registry on first use unless injected
+    client_ssm = get_client("ssm") if client_ssm is None else client_ssm
+    client_s3 = get_client("s3") if client_s3 is None else client_s3
+    env = load_environments(class_dataclass=EnvironmentVariables)
     params = get_ssm_parameters(
         name_token_contentful=env.ssm_parameter_name_token_contentful,
         name_notion_database_id=env.ssm_parameter_name_notion_database_id,
         name_notion_token=env.ssm_parameter_name_notion_token,
         client=client_ssm,
     )
-    cached_data = CachedData.load(bucket=env.bucket_name_data, client=client_s3)
-    articles = get_articles(
-        cached_data=cached_data, token_contentful=params.token_contentful
+    codec = Codec.parse(env.cached_data_codec)
+    throttled_start = {
+        "Contentful": limiter_contentful.throttled_seconds,
+        "Notion": limiter_notion.throttled_seconds,
+    }
+    with metrics.timer("CachedDataLoadLatency"):
+        cached_data = CachedData.load(
+            bucket=env.bucket_name_data,
+            client=client_s3,
+            warm=True,
+            spill_dir=env.cached_data_spill_dir,
+        )
+    if cached_data.is_missing():
+        # every article would look new without the cache, so what the database
+        # already holds is read back before anything is inserted
+        logger.warning("cached data is missing, rebuild from the database")
+        rebuild_from_database(
+            cached_data=cached_data,
+            notion_database_id=params.notion_database_id,
+            notion_token=params.notion_token,
+            workers=env.notion_rebuild_workers,
+            partitions=create_partitions(
+                since=datetime.fromisoformat(env.notion_rebuild_since),
+                until=datetime.now(timezone.utc),
+                count=env.notion_rebuild_partitions,
+            ),
+        )
+    checkpointer = Checkpointer(
+        cached_data=cached_data,
+        bucket=env.bucket_name_data,
+        client=client_s3,
+        every_inserts=env.checkpoint_every_inserts,
+        every_seconds=env.checkpoint_every_seconds,
+        codec=codec,
+    )
+    pages, state = open_listing(
+        cached_data=cached_data,
+        token_contentful=params.token_contentful,
+        sync_mode=env.sync_mode,
+        page_workers=env.contentful_page_workers,
+        watermark_overlap_seconds=env.watermark_overlap_seconds,
     )
+    articles = iter_new_articles(
+        pages=pages,
+        cached_data=cached_data,
+        token_contentful=params.token_contentful,
+        state=state,
+    )
+    # deadline is a monotonic() time, no new insert starts within the margin
+    # before it and the run ends early with a resume point instead
+    stop_at = None if deadline is None else deadline - env.deadline_margin_seconds
     try:
-        for ar in articles:
-            insert_to_database(
-                article=ar,
-                notion_database_id=params.notion_database_id,
-                notion_token=params.notion_token,
+        result = insert_articles(
+            articles=articles,
+            cached_data=cached_data,
+            notion_database_id=params.notion_database_id,
+            notion_token=params.notion_token,
+            workers=env.notion_insert_workers,
+            max_in_flight=env.insert_queue_depth,
+            checkpointer=checkpointer,
+            deadline=stop_at,
+        )
+        update_cursors(
+            cached_data=cached_data, state=state, interrupted=result.interrupted
+        )
+        logger.debug(
+            "listed articles",
+            data={"Pages": state.pages, "Items": state.items, "New": state.new_items},
+        )
+        metrics.add("ContentfulListingPages", state.pages)
+        metrics.add("ContentfulListingItems", state.items)
+        metrics.add("NewArticles", state.new_items)
+        if result.interrupted:
+            metrics.add("DeadlineInterrupted")
+            logger.warning(
+                "stopped before the deadline",
+                data={"ResumePoint": cached_data.resume_point, "Depth": depth},
             )
-            cached_data.articles[ar.url] = ar
     finally:
-        cached_data.save(bucket=env.bucket_name_data, client=client_s3)
-    if len(articles) > 0:
-        notify(sns_topic_arn=env.sns_topic_arn, client=client_sns)
+        # closed on every exit, a listing left unfinished by the deadline or an
+        # error stops prefetching pages here
+        articles.close()
+        pages.close()
+        checkpointer.flush()
+        metrics.add(
+            "ContentfulThrottleSeconds",
+            limiter_contentful.throttled_seconds - throttled_start["Contentful"],
+            unit="Seconds",
+        )
+        metrics.add(
+            "NotionThrottleSeconds",
+            limiter_notion.throttled_seconds - throttled_start["Notion"],
+            unit="Seconds",
+        )
+        logger.debug(
+            "rate limiter throttled",
+            data={
+                "Contentful": {
+                    "Seconds": limiter_contentful.throttled_seconds,
+                    "Count": limiter_contentful.throttled_count,
+                },
+                "Notion": {
+                    "Seconds": limiter_notion.throttled_seconds,
+                    "Count": limiter_notion.throttled_count,
+                },
+            },
+        )
+    # compaction runs beside the notification, off the insert path
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        compaction = executor.submit(
+            cached_data.compact,
+            bucket=env.bucket_name_data,
+            client=client_s3,
+            min_segments=env.compaction_min_segments,
+            codec=codec,
+        )
+        if result.inserted > 0:
+            notify(
+                sns_topic_arn=env.sns_topic_arn,
+                client=get_client("sns") if client_sns is None else client_sns,
+            )
+        try:
+            compaction.result()
+        except Exception as e:
+            logger.warning(
+                f"error occurred in compaction: {e}",
+                exc_info=True,
+                data={"ErrorType": str(type(e)), "ErrorMessage": str(e)},
+            )
+    # the backlog keeps draining right away instead of waiting for the schedule
+    if (
+        result.interrupted
+        and env.self_invoke
+        and function_name is not None
+        and depth < env.self_invoke_max_depth
+    ):
+        invoke_self(
+            function_name=function_name,
+            depth=depth + 1,
+            client=get_client("lambda") if client_lambda is None else client_lambda,
+        )
 
 
 @logging_function(logger)
-def internal_get_ssm_parameters(
+def get_ssm_parameters(
     *,
     name_token_contentful: str,
     name_notion_database_id: str,
     name_notion_token: str,
     client: SSMClient,
 ) -> SsmParameters:
-    resp = client.get_parameters(
-        Names=[name_token_contentful, name_notion_database_id, name_notion_token],
-        WithDecryption=True,
+    mapping = parameter_cache.get_parameters(
+        [name_token_contentful, name_notion_database_id, name_notion_token],
+        client=client,
+    )
+    logger.debug(
+        "parameter cache",
+        data={
+            "Hit": parameter_cache.hit_count,
+            "Stale": parameter_cache.stale_count,
+            "Miss": parameter_cache.miss_count,
+        },
     )
-    mapping = {x["Name"]: x["Value"] for x in resp["Parameters"]}
     return SsmParameters(
         token_contentful=mapping[name_token_contentful],
         notion_database_id=mapping[name_notion_database_id],
@@ -94,40 +321,84 @@ def internal_get_ssm_parameters(
 
 
 @logging_function(logger)
-@cache
-def get_ssm_parameters(
-    *,
-    name_token_contentful: str,
-    name_notion_database_id: str,
-    name_notion_token: str,
-    client: SSMClient,
-) -> SsmParameters:
-    return internal_get_ssm_parameters(
-        name_token_contentful=name_token_contentful,
-        name_notion_database_id=name_notion_database_id,
-        name_notion_token=name_notion_token,
-        client=client,
-    )
+def update_cursors(*, cached_data: CachedData, state: ListingState, interrupted: bool):
+    if not interrupted:
+        cached_data.sync_cursor = state.sync_cursor
+        cached_data.watermark = state.watermark
+        if state.resumable:
+            cached_data.resume_point = None
+    elif state.resumable and state.position is not None:
+        # the cursors move on only once the scan has completed
+        cached_data.resume_point = ResumePoint(
+            created_before=state.position,
+            sync_cursor=state.sync_cursor,
+            watermark=state.watermark,
+        )
 
 
 @logging_function(logger)
 def get_thumbnail_url(*, thumbnail_id: str, token_contentful: str) -> str:
-    url = f"https://api.contentful.com/spaces/ct0aopd36mqt/environments/master/assets/{thumbnail_id}"
+    url = f"{URL_CONTENTFUL_SPACE}/assets/{thumbnail_id}"
     req = Request(url=url, headers={"Authorization": f"Bearer {token_contentful}"})
     resp = client_contentful(req)
     binary = resp.read()
     data = json.loads(binary)
-    return data["fields"]["file"]["en-US"]["url"]
+    return convert_thumbnail_url(item=data)
 
 
 @logging_function(logger)
 def get_author(*, author_id: str, token_contentful: str) -> Author:
-    url = f"https://api.contentful.com/spaces/ct0aopd36mqt/environments/master/entries?sys.id={author_id}&content_type=authorProfile"
+    url = (
+        f"{URL_CONTENTFUL_SPACE}/entries?sys.id={author_id}&content_type=authorProfile"
+    )
     req = Request(url=url, headers={"Authorization": f"Bearer {token_contentful}"})
     resp = client_contentful(req)
     binary = resp.read()
     data = json.loads(binary)
-    item = data["items"][0]
+    return convert_author(item=data["items"][0])
+
+
+@logging_function(logger)
+def get_thumbnail_urls(
+    *, thumbnail_ids: list[str], token_contentful: str
+) -> dict[str, str]:
+    result = {}
+    for i in range(0, len(thumbnail_ids), BATCH_SIZE_LINKED):
+        ids = ",".join(thumbnail_ids[i : i + BATCH_SIZE_LINKED])
+        url = (
+            f"{URL_CONTENTFUL_SPACE}/assets?sys.id[in]={ids}&limit={BATCH_SIZE_LINKED}"
+        )
+        req = Request(url=url, headers={"Authorization": f"Bearer {token_contentful}"})
+        resp = client_contentful(req)
+        binary = resp.read()
+        data = json.loads(binary)
+        for item in data["items"]:
+            result[item["sys"]["id"]] = convert_thumbnail_url(item=item)
+    return result
+
+
+@logging_function(logger)
+def get_authors(*, author_ids: list[str], token_contentful: str) -> dict[str, Author]:
+    result = {}
+    for i in range(0, len(author_ids), BATCH_SIZE_LINKED):
+        ids = ",".join(author_ids[i : i + BATCH_SIZE_LINKED])
+        url = f"{URL_CONTENTFUL_SPACE}/entries?sys.id[in]={ids}&content_type=authorProfile&limit={BATCH_SIZE_LINKED}"
+        req = Request(url=url, headers={"Authorization": f"Bearer {token_contentful}"})
+        resp = client_contentful(req)
+        binary = resp.read()
+        data = json.loads(binary)
+        for item in data["items"]:
+            result[item["sys"]["id"]] = convert_author(item=item)
+    return result
+
+
+@logging_function(logger)
+def convert_thumbnail_url(*, item: dict) -> str:
+    return item["fields"]["file"]["en-US"]["url"]
+
+
+@logging_function(logger)
+def convert_author(*, item: dict) -> Author:
     return Author(
         url="https://dev.classmethod.jp/author/{}/".format(
             item["fields"]["slug"]["en-US"]
@@ -137,6 +408,58 @@ def get_author(*, author_id: str, token_contentful: str) -> Author:
     )
 
 
+@logging_function(logger)
+def resolve_linked(
+    *,
+    items: list[dict],
+    includes: dict | None,
+    cached_data: CachedData,
+    token_contentful: str,
+):
+    author_ids = set()
+    thumbnail_ids = set()
+    for item in items:
+        is_thumbnail_id, thumbnail_value = resolve_thumbnail_url(item=item)
+        if is_thumbnail_id:
+            if thumbnail_value in cached_data.thumbnails:
+                metrics.add("ThumbnailCacheHits")
+            else:
+                thumbnail_ids.add(thumbnail_value)
+        author_id = item["fields"]["author"]["en-US"]["sys"]["id"]
+        if author_id in cached_data.authors:
+            metrics.add("AuthorCacheHits")
+        else:
+            author_ids.add(author_id)
+    metrics.add("ThumbnailCacheMisses", len(thumbnail_ids))
+    metrics.add("AuthorCacheMisses", len(author_ids))
+
+    # linked records shipped with the listing response need no extra request
+    includes = {} if includes is None else includes
+    for asset in includes.get("Asset", []):
+        if asset["sys"]["id"] in thumbnail_ids:
+            cached_data.thumbnails[asset["sys"]["id"]] = convert_thumbnail_url(
+                item=asset
+            )
+            thumbnail_ids.discard(asset["sys"]["id"])
+    for entry in includes.get("Entry", []):
+        if entry["sys"]["id"] in author_ids:
+            cached_data.authors[entry["sys"]["id"]] = convert_author(item=entry)
+            author_ids.discard(entry["sys"]["id"])
+
+    if len(thumbnail_ids) > 0:
+        cached_data.thumbnails.update(
+            get_thumbnail_urls(
+                thumbnail_ids=sorted(thumbnail_ids), token_contentful=token_contentful
+            )
+        )
+    if len(author_ids) > 0:
+        cached_data.authors.update(
+            get_authors(
+                author_ids=sorted(author_ids), token_contentful=token_contentful
+            )
+        )
+
+
 @logging_function(logger)
 def resolve_thumbnail_url(*, item: dict) -> tuple[bool, str]:
     try:
@@ -170,9 +493,7 @@ def convert_article(
         cached_data.authors[author_id] = info_author
 
     return Article(
-        url="https://dev.classmethod.jp/articles/{}/".format(
-            item["fields"]["slug"]["en-US"]
-        ),
+        url=create_article_url(slug=item["fields"]["slug"]["en-US"]),
         thumbnail=thumbnail_value,
         title=item["fields"]["title"]["en-US"],
         raw_date=str(dt_jst),
@@ -182,48 +503,640 @@ def convert_article(
 
 
 @logging_function(logger)
-def get_articles(*, cached_data: CachedData, token_contentful: str) -> list[Article]:
-    count = 0
-    limit = 100
-    headers = {"Authorization": f"Bearer {token_contentful}"}
-    result = []
-    error_count = 0
-    while True:
-        url = f"https://api.contentful.com/spaces/ct0aopd36mqt/environments/master/public/entries?fields.referenceCategory.en-US.sys.id=1DdS3IwWwqYx0N3Vwtn0e6&content_type=blogPost&limit={limit}&skip={limit * count}"
-        req = Request(url=url, headers=headers)
+def create_article_url(*, slug: str) -> str:
+    return f"https://dev.classmethod.jp/articles/{slug}/"
+
+
+@logging_function(logger)
+def is_valid_sync_cursor(*, sync_cursor: str | None) -> bool:
+    if sync_cursor is None:
+        return False
+    try:
+        datetime.strptime(sync_cursor, "%Y-%m-%dT%H:%M:%S.%f%z")
+    except ValueError:
+        return False
+    return True
+
+
+@logging_function(logger)
+def create_listing_url(
+    *,
+    limit: int,
+    skip: int,
+    sync_cursor: str | None,
+    newest_first: bool = False,
+    created_before: str | None = None,
+) -> str:
+    url = f"{URL_CONTENTFUL_SPACE}/public/entries?{QUERY_BLOG_POST}&limit={limit}&skip={skip}"
+    if newest_first:
+        if created_before is not None:
+            url = f"{url}&sys.createdAt[lte]={created_before}"
+        return f"{url}&order=-sys.createdAt"
+    if sync_cursor is None:
+        return url
+    # sys.id breaks the ties, so pages of one updatedAt keep their order
+    return f"{url}&sys.updatedAt[gte]={sync_cursor}&order=sys.updatedAt,sys.id"
+
+
+@logging_function(logger)
+def open_listing(
+    *,
+    cached_data: CachedData,
+    token_contentful: str,
+    sync_mode: SyncMode,
+    page_workers: int,
+    watermark_overlap_seconds: float = 86400.0,
+) -> tuple[Generator[dict, None, None], ListingState]:
+    if sync_mode == "watermark":
+        return open_watermark_listing(
+            cached_data=cached_data,
+            token_contentful=token_contentful,
+            page_workers=page_workers,
+            overlap_seconds=watermark_overlap_seconds,
+        )
+    # the first page is fetched here so a rejected cursor can still fall back
+    # to a full rescan before anything downstream has started
+    watermark = cached_data.watermark
+    if not is_valid_sync_cursor(sync_cursor=watermark):
+        watermark = None
+    sync_cursor = cached_data.sync_cursor if sync_mode == "incremental" else None
+    if is_valid_sync_cursor(sync_cursor=sync_cursor):
         try:
-            resp = client_contentful(req)
-        except HTTPError:
-            if error_count == 3:
-                raise
-            else:
-                error_count += 1
-                sleep(3)
-                continue
-        binary = resp.read()
-        data = json.loads(binary)
-        all_items = data["items"]
-        for item in all_items:
-            article = convert_article(
-                item=item, cached_data=cached_data, token_contentful=token_contentful
+            first = get_listing_page(
+                token_contentful=token_contentful,
+                sync_cursor=sync_cursor,
+                limit=LIMIT_LISTING,
+                skip=0,
+            )
+            pages = iter_listing_pages(
+                first=first,
+                token_contentful=token_contentful,
+                sync_cursor=sync_cursor,
+                page_workers=page_workers,
             )
-            if article.url not in cached_data.articles:
+            return pages, ListingState(sync_cursor=sync_cursor, watermark=watermark)
+        except InvalidSyncCursorError:
+            logger.warning(
+                "sync cursor was rejected, fall back to full rescan",
+                data={"SyncCursor": sync_cursor},
+            )
+    elif sync_cursor is not None:
+        logger.warning(
+            "sync cursor is invalid, fall back to full rescan",
+            data={"SyncCursor": sync_cursor},
+        )
+    return open_full_scan(
+        cached_data=cached_data,
+        token_contentful=token_contentful,
+        page_workers=page_workers,
+        watermark=watermark,
+    )
+
+
+@logging_function(logger)
+def open_full_scan(
+    *,
+    cached_data: CachedData,
+    token_contentful: str,
+    page_workers: int,
+    watermark: str | None,
+) -> tuple[Generator[dict, None, None], ListingState]:
+    # newest posts come first, so a run cut short by the deadline has inserted
+    # the most recent ones and the next run continues below where it stopped
+    resume_point = cached_data.resume_point
+    created_before = None
+    if resume_point is not None:
+        if is_valid_sync_cursor(sync_cursor=resume_point.created_before):
+            created_before = resume_point.created_before
+            watermark = max(
+                [x for x in (watermark, resume_point.watermark) if x is not None],
+                default=None,
+            )
+        else:
+            logger.warning(
+                "resume point is invalid, start the scan over",
+                data={"ResumePoint": resume_point},
+            )
+            resume_point = None
+    first = get_listing_page(
+        token_contentful=token_contentful,
+        sync_cursor=None,
+        limit=LIMIT_LISTING,
+        skip=0,
+        newest_first=True,
+        created_before=created_before,
+    )
+    pages = iter_listing_pages(
+        first=first,
+        token_contentful=token_contentful,
+        sync_cursor=None,
+        page_workers=page_workers,
+        newest_first=True,
+        created_before=created_before,
+    )
+    return pages, ListingState(
+        sync_cursor=None if resume_point is None else resume_point.sync_cursor,
+        watermark=watermark,
+        resumable=True,
+    )
+
+
+@logging_function(logger)
+def open_watermark_listing(
+    *,
+    cached_data: CachedData,
+    token_contentful: str,
+    page_workers: int,
+    overlap_seconds: float,
+) -> tuple[Generator[dict, None, None], ListingState]:
+    # newest posts come first, so pagination can stop once a page holds only
+    # posts older than the watermark minus the overlap
+    watermark = cached_data.watermark
+    stop_at = None
+    if is_valid_sync_cursor(sync_cursor=watermark):
+        stop_at = datetime.fromisoformat(watermark) - timedelta(seconds=overlap_seconds)
+    elif watermark is not None:
+        logger.warning(
+            "watermark is invalid, fall back to full rescan",
+            data={"Watermark": watermark},
+        )
+    if stop_at is None:
+        return open_full_scan(
+            cached_data=cached_data,
+            token_contentful=token_contentful,
+            page_workers=page_workers,
+            watermark=None,
+        )
+    first = get_listing_page(
+        token_contentful=token_contentful,
+        sync_cursor=None,
+        limit=LIMIT_LISTING,
+        skip=0,
+        newest_first=True,
+    )
+    pages = iter_listing_pages(
+        first=first,
+        token_contentful=token_contentful,
+        sync_cursor=None,
+        # prefetching ahead would only fetch pages the stop check discards
+        page_workers=1,
+        newest_first=True,
+        stop_at=stop_at,
+    )
+    # an early stop leaves older updates unseen, so the cursor only moves on
+    # after a complete pass
+    return pages, ListingState(
+        sync_cursor=cached_data.sync_cursor, watermark=watermark, partial=True
+    )
+
+
+def iter_new_articles(
+    *,
+    pages: Generator[dict, None, None],
+    cached_data: CachedData,
+    token_contentful: str,
+    state: ListingState,
+) -> Generator[Article, None, None]:
+    seen = set()
+    try:
+        for data in pages:
+            state.pages += 1
+            new_items = []
+            for item in data["items"]:
+                state.items += 1
+                updated_at = item["sys"]["updatedAt"]
+                if not state.partial and (
+                    state.sync_cursor is None or state.sync_cursor < updated_at
+                ):
+                    state.sync_cursor = updated_at
+                created_at = item["sys"]["createdAt"]
+                if state.watermark is None or state.watermark < created_at:
+                    state.watermark = created_at
+                # dedup on the slug before any author or thumbnail lookup
+                url = create_article_url(slug=item["fields"]["slug"]["en-US"])
+                if url in seen or cached_data.has_article(url):
+                    continue
+                seen.add(url)
+                new_items.append(item)
+            if len(new_items) > 0:
+                state.new_items += len(new_items)
+                resolve_linked(
+                    items=new_items,
+                    includes=data.get("includes"),
+                    cached_data=cached_data,
+                    token_contentful=token_contentful,
+                )
+                for item in new_items:
+                    state.position = item["sys"]["createdAt"]
+                    yield convert_article(
+                        item=item,
+                        cached_data=cached_data,
+                        token_contentful=token_contentful,
+                    )
+            if len(data["items"]) > 0:
+                state.position = data["items"][-1]["sys"]["createdAt"]
+    finally:
+        # the page prefetch of the listing stops with this generator
+        pages.close()
+
+
+def iter_listing_pages(
+    *,
+    first: dict,
+    token_contentful: str,
+    sync_cursor: str | None,
+    page_workers: int,
+    limit: int = LIMIT_LISTING,
+    newest_first: bool = False,
+    stop_at: datetime | None = None,
+    created_before: str | None = None,
+) -> Generator[dict, None, None]:
+    def fetch(skip: int) -> dict:
+        return get_listing_page(
+            token_contentful=token_contentful,
+            sync_cursor=sync_cursor,
+            limit=limit,
+            skip=skip,
+            newest_first=newest_first,
+            created_before=created_before,
+        )
+
+    if sync_cursor is not None:
+        yield from iter_keyset_pages(
+            first=first,
+            limit=limit,
+            fetch=lambda cursor, skip: get_listing_page(
+                token_contentful=token_contentful,
+                sync_cursor=cursor,
+                limit=limit,
+                skip=skip,
+            ),
+        )
+        return
+
+    data = first
+    yield data
+    if page_workers <= 1:
+        skip = 0
+        while skip + limit < data["total"]:
+            if stop_at is not None and is_page_below(
+                data=data, limit=limit, stop_at=stop_at
+            ):
+                logger.debug(
+                    "listing stopped at watermark",
+                    data={"Pages": skip // limit + 1, "Total": data["total"]},
+                )
+                return
+            skip += limit
+            data = fetch(skip)
+            yield data
+        return
+
+    # remaining pages are known from the first response, a sliding window of
+    # page_workers requests keeps page order and bounds the prefetched pages
+    skips = iter(range(limit, data["total"], limit))
+    with ThreadPoolExecutor(max_workers=page_workers) as executor:
+        window = deque(executor.submit(fetch, x) for x in islice(skips, page_workers))
+        while len(window) > 0:
+            data = window.popleft().result()
+            for x in islice(skips, 1):
+                window.append(executor.submit(fetch, x))
+            yield data
+
+
+def iter_keyset_pages(
+    *, first: dict, limit: int, fetch: Callable[[str, int], dict]
+) -> Generator[dict, None, None]:
+    # ordered by updatedAt, an entry updated during the scan moves to the end
+    # and would shift every later skip offset past an unseen entry, so each
+    # page continues from the last updatedAt seen instead and drops the
+    # entries already seen at it
+    data = first
+    yield data
+    cursor = None
+    seen: set[str] = set()
+    skip = 0
+    while len(data["items"]) == limit:
+        last = data["items"][-1]["sys"]["updatedAt"]
+        if last != cursor:
+            cursor, seen, skip = last, set(), 0
+        seen.update(
+            x["sys"]["id"] for x in data["items"] if x["sys"]["updatedAt"] == cursor
+        )
+        data = fetch(cursor, skip)
+        items = [
+            x
+            for x in data["items"]
+            if x["sys"]["updatedAt"] != cursor or x["sys"]["id"] not in seen
+        ]
+        if len(items) == 0 and len(data["items"]) == limit:
+            # more than a page share this updatedAt, skip into them with half
+            # a page of overlap for entries of it updated meanwhile
+            skip = max(skip + 1, len(seen) - limit // 2)
+            continue
+        yield {**data, "items": items}
+
+
+def is_page_below(*, data: dict, limit: int, stop_at: datetime) -> bool:
+    items = data["items"]
+    return len(items) == limit and all(
+        datetime.fromisoformat(x["sys"]["createdAt"]) <= stop_at for x in items
+    )
+
+
+@logging_function(logger)
+def get_listing_page(
+    *,
+    token_contentful: str,
+    sync_cursor: str | None,
+    limit: int,
+    skip: int,
+    newest_first: bool = False,
+    created_before: str | None = None,
+) -> dict:
+    url = create_listing_url(
+        limit=limit,
+        skip=skip,
+        sync_cursor=sync_cursor,
+        newest_first=newest_first,
+        created_before=created_before,
+    )
+    req = Request(url=url, headers={"Authorization": f"Bearer {token_contentful}"})
+    # transient failures are retried by the client
+    try:
+        resp = client_contentful(req)
+    except HTTPError as e:
+        if sync_cursor is not None and e.code in (400, 422):
+            raise InvalidSyncCursorError(sync_cursor) from e
+        raise
+    binary = resp.read()
+    return json.loads(binary)
+
+
+@logging_function(logger)
+def insert_articles(
+    *,
+    articles: Iterable[Article],
+    cached_data: CachedData,
+    notion_database_id: str,
+    notion_token: str,
+    workers: int = 1,
+    max_in_flight: int | None = None,
+    checkpointer: Checkpointer | None = None,
+    deadline: float | None = None,
+) -> InsertResult:
+    # no article is pulled once monotonic() passes deadline, the ones in
+    # flight still complete
+    workers = max(1, workers)
+    max_in_flight = workers * 2 if max_in_flight is None else max(1, max_in_flight)
+    time_start = perf_counter()
+    succeeded = []
+    errors = []
+    aborted = Event()
+    in_flight: dict[Future, Article] = {}
+    interrupted = False
+
+    def insert(article: Article) -> bool:
+        if aborted.is_set():
+            return False
+        try:
+            with metrics.timer("NotionInsertLatency"):
+                insert_to_database(
+                    article=article,
+                    notion_database_id=notion_database_id,
+                    notion_token=notion_token,
+                )
+        except Exception:
+            # stop the other workers from starting new inserts right away
+            aborted.set()
+            raise
+        return True
+
+    # record each insert as soon as it completes, so a failure later in the
+    # batch never loses the progress already made
+    def record(future: Future):
+        article = in_flight.pop(future)
+        try:
+            if not future.result():
+                return
+        except Exception as e:
+            errors.append(e)
+            return
+        cached_data.articles[article.url] = article
+        succeeded.append(article)
+        if checkpointer is not None:
+            checkpointer.record()
+
+    # articles are pulled lazily, so upstream pages keep downloading while
+    # inserts run and at most max_in_flight articles wait here, closing them is
+    # up to the caller
+    iterator = iter(articles)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        try:
+            while not aborted.is_set():
+                if deadline is not None and monotonic() >= deadline:
+                    interrupted = True
+                    break
+                ar = next(iterator, None)
+                if ar is None:
+                    break
+                in_flight[executor.submit(insert, ar)] = ar
+                while len(in_flight) >= max_in_flight:
+                    done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+                    for future in done:
+                        record(future)
+        finally:
+            for future in as_completed(list(in_flight)):
+                record(future)
+
+    seconds = perf_counter() - time_start
+    metrics.add("NotionInserts", len(succeeded))
+    metrics.add("NotionInsertErrors", len(errors))
+    result = InsertResult(
+        inserted=len(succeeded),
+        seconds=seconds,
+        inserts_per_second=len(succeeded) / seconds if seconds > 0 else 0.0,
+        interrupted=interrupted,
+    )
+    logger.debug(
+        "inserted articles",
+        data={"Result": result, "Failed": len(errors), "Workers": workers},
+    )
+    if len(errors) > 0:
+        raise errors[0]
+    return result
+
+
+@logging_function(logger)
+def create_partitions(
+    *, since: datetime, until: datetime, count: int
+) -> list[Partition]:
+    # created_time windows cover the database without gaps or overlap, the
+    # first and the last one are open ended
+    count = max(1, count)
+    if until <= since or count == 1:
+        return [Partition(after=None, before=None)]
+    width = (until - since) / (count - 1)
+    bounds = [since + width * i for i in range(count - 1)]
+    return [
+        Partition(after=after, before=before)
+        for after, before in zip([None, *bounds], [*bounds, None])
+    ]
+
+
+@logging_function(logger)
+def create_partition_filter(*, partition: Partition) -> dict | None:
+    conditions = []
+    if partition.after is not None:
+        conditions.append(
+            {
+                "timestamp": "created_time",
+                "created_time": {"on_or_after": partition.after.isoformat()},
+            }
+        )
+    if partition.before is not None:
+        conditions.append(
+            {
+                "timestamp": "created_time",
+                "created_time": {"before": partition.before.isoformat()},
+            }
+        )
+    if len(conditions) == 0:
+        return None
+    if len(conditions) == 1:
+        return conditions[0]
+    return {"and": conditions}
+
+
+@logging_function(logger)
+def query_database(
+    *,
+    notion_database_id: str,
+    notion_token: str,
+    filter_: dict | None,
+    start_cursor: str | None,
+) -> dict:
+    body: dict = {"page_size": PAGE_SIZE_NOTION}
+    if filter_ is not None:
+        body["filter"] = filter_
+    if start_cursor is not None:
+        body["start_cursor"] = start_cursor
+    req = Request(
+        url=f"{URL_NOTION_API}/databases/{notion_database_id}/query",
+        method="POST",
+        headers={
+            "Content-Type": "application/json",
+            "Notion-Version": NOTION_VERSION,
+            "Authorization": f"Bearer {notion_token}",
+        },
+        data=json.dumps(body).encode(),
+    )
+    resp = client_notion(req)
+    binary = resp.read()
+    return json.loads(binary)
+
+
+@logging_function(logger)
+def get_partition_articles(
+    *, partition: Partition, notion_database_id: str, notion_token: str
+) -> list[Article]:
+    filter_ = create_partition_filter(partition=partition)
+    result = []
+    start_cursor = None
+    while True:
+        data = query_database(
+            notion_database_id=notion_database_id,
+            notion_token=notion_token,
+            filter_=filter_,
+            start_cursor=start_cursor,
+        )
+        for page in data["results"]:
+            article = convert_database_page(page=page)
+            if article is not None:
                 result.append(article)
-        total = data["total"]
-        if total < limit * (count + 1):
+        if not data.get("has_more") or data.get("next_cursor") is None:
             return result
-        else:
-            count += 1
+        start_cursor = data["next_cursor"]
+
+
+@logging_function(logger)
+def convert_database_page(*, page: dict) -> Article | None:
+    properties = page["properties"]
+
+    def read_text(name: str, kind: str = "rich_text") -> str:
+        prop = properties.get(name) or {}
+        return "".join(x.get("plain_text", "") for x in prop.get(kind) or [])
+
+    def read_url(name: str) -> str:
+        prop = properties.get(name) or {}
+        return prop.get("url") or ""
+
+    url = read_url("URL")
+    # a row without a URL cannot be matched to an article
+    if url == "":
+        return None
+    return Article(
+        url=url,
+        thumbnail=read_url("Thumbnail"),
+        title=read_text("Title", "title"),
+        date=read_text("Date"),
+        raw_date=read_text("RawDate"),
+        author=Author(
+            url=read_url("AuthorUrl"),
+            name=read_text("AuthorName"),
+            avatar=read_url("AuthorAvatar"),
+        ),
+    )
+
+
+@logging_function(logger)
+def rebuild_from_database(
+    *,
+    cached_data: CachedData,
+    notion_database_id: str,
+    notion_token: str,
+    workers: int,
+    partitions: list[Partition],
+) -> int:
+    # partitions are paged concurrently, the shared Notion limiter keeps the
+    # request rate within the API limit
+    time_start = perf_counter()
+    rebuilt = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [
+            executor.submit(
+                get_partition_articles,
+                partition=x,
+                notion_database_id=notion_database_id,
+                notion_token=notion_token,
+            )
+            for x in partitions
+        ]
+        for future in as_completed(futures):
+            for article in future.result():
+                if article.url not in cached_data.articles:
+                    cached_data.articles[article.url] = article
+                    rebuilt += 1
+    metrics.add("RebuiltArticles", rebuilt)
+    logger.debug(
+        "rebuilt cached data from the database",
+        data={
+            "Articles": rebuilt,
+            "Partitions": len(partitions),
+            "Seconds": perf_counter() - time_start,
+        },
+    )
+    return rebuilt
 
 
 @logging_function(logger)
 def insert_to_database(*, article: Article, notion_database_id: str, notion_token: str):
     req = Request(
-        url="https://api.notion.com/v1/pages",
+        url=f"{URL_NOTION_API}/pages",
         method="POST",
         headers={
             "Content-Type": "application/json",
-            "Notion-Version": "2022-06-28",
+            "Notion-Version": NOTION_VERSION,
             "Authorization": f"Bearer {notion_token}",
         },
         data=json.dumps(
@@ -249,6 +1162,15 @@ def insert_to_database(*, article: Article, notion_database_id: str, notion_toke
     client_notion(req)
 
 
+@logging_function(logger)
+def invoke_self(*, function_name: str, depth: int, client):
+    client.invoke(
+        FunctionName=function_name,
+        InvocationType="Event",
+        Payload=json.dumps({"ResumeDepth": depth}).encode(),
+    )
+
+
 @logging_function(logger)
 def notify(*, sns_topic_arn: str, client: SNSClient):
     client.publish(
@@ -1,3 +1,31 @@
-from .aws import BOTOCORE_CONFIG_DEFAULT, create_client, create_resource
+from .aws import (
+    ClientRegistry,
+    client_registry,
+    create_client,
+    create_resource,
+    get_botocore_config_default,
+    get_client,
+)
+from .parameter_cache import ParameterCache
 
-__all__ = ["BOTOCORE_CONFIG_DEFAULT", "create_client", "create_resource"]
+parameter_cache = ParameterCache(ttl=900.0, max_stale=86400.0)
+
+
+def __getattr__(name: str):
+    # the default botocore config is built on first access
+    if name == "BOTOCORE_CONFIG_DEFAULT":
+        return get_botocore_config_default()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+__all__ = [
+    "BOTOCORE_CONFIG_DEFAULT",
+    "ClientRegistry",
+    "ParameterCache",
+    "client_registry",
+    "create_client",
+    "create_resource",
+    "get_botocore_config_default",
+    "get_client",
+    "parameter_cache",
+]
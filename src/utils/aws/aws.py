@@ -1,21 +1,119 @@
-import boto3
-from boto3.resources.base import ServiceResource
-from botocore.client import BaseClient
-from botocore.config import Config
+from __future__ import annotations
+
+from functools import cache
+from threading import Lock
+from time import perf_counter
+from typing import TYPE_CHECKING
 
 from utils.logger import create_logger, logging_function
 
-BOTOCORE_CONFIG_DEFAULT = Config(
-    connect_timeout=5, read_timeout=5, retries={"mode": "standard"}
-)
+# boto3 and botocore are imported on first use, they dominate the cold start
+if TYPE_CHECKING:
+    import boto3
+    from boto3.resources.base import ServiceResource
+    from botocore.client import BaseClient
+    from botocore.config import Config
 
 logger = create_logger(__name__)
 
+type ClientKey = tuple[str, str | None, Config]
+
+
+@cache
+def get_botocore_config_default() -> Config:
+    from botocore.config import Config
+
+    return Config(connect_timeout=5, read_timeout=5, retries={"mode": "standard"})
+
+
+def __getattr__(name: str):
+    if name == "BOTOCORE_CONFIG_DEFAULT":
+        return get_botocore_config_default()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class ClientRegistry:
+    def __init__(self):
+        self.creation_seconds: dict[str, float] = {}
+        self._session: boto3.Session | None = None
+        self._clients: dict[ClientKey, BaseClient] = {}
+        self._lock = Lock()
+
+    @property
+    def session(self) -> boto3.Session:
+        # one session shares the loaded service models between all clients
+        with self._lock:
+            if self._session is None:
+                import boto3
+
+                self._session = boto3.Session()
+            return self._session
+
+    @logging_function(logger)
+    def get(
+        self, name: str, *, region_name: str | None = None, config: Config | None = None
+    ) -> BaseClient:
+        key = (
+            name,
+            region_name,
+            get_botocore_config_default() if config is None else config,
+        )
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+        session = self.session
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                return client
+            time_start = perf_counter()
+            client = session.client(name, region_name=region_name, config=key[2])
+            seconds = perf_counter() - time_start
+            self._clients[key] = client
+            self.creation_seconds[name] = seconds
+        logger.debug("created client", data={"Service": name, "Seconds": seconds})
+        return client
+
+    def register(
+        self,
+        name: str,
+        client: BaseClient,
+        *,
+        region_name: str | None = None,
+        config: Config | None = None,
+    ):
+        key = (
+            name,
+            region_name,
+            get_botocore_config_default() if config is None else config,
+        )
+        with self._lock:
+            self._clients[key] = client
+
+    def clear(self):
+        with self._lock:
+            self._clients.clear()
+            self.creation_seconds.clear()
+
+
+client_registry = ClientRegistry()
+
+
+@logging_function(logger)
+def get_client(
+    name: str, *, region_name: str | None = None, config: Config | None = None
+) -> BaseClient:
+    return client_registry.get(name, region_name=region_name, config=config)
+
 
 @logging_function(logger)
 def create_client(name: str, *, config: Config | None = None, **kwargs) -> BaseClient:
+    import boto3
+
     return boto3.client(
-        name, config=BOTOCORE_CONFIG_DEFAULT if config is None else config, **kwargs
+        name,
+        config=get_botocore_config_default() if config is None else config,
+        **kwargs,
     )
 
 
@@ -23,6 +121,10 @@ def create_client(name: str, *, config: Config | None = None, **kwargs) -> BaseC
 def create_resource(
     name: str, *, config: Config | None = None, **kwargs
 ) -> ServiceResource:
+    import boto3
+
     return boto3.resource(
-        name, config=BOTOCORE_CONFIG_DEFAULT if config is None else config, **kwargs
+        name,
+        config=get_botocore_config_default() if config is None else config,
+        **kwargs,
     )
@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+from collections.abc import Callable
+from dataclasses import dataclass
+from threading import Lock
+from time import monotonic
+from typing import TYPE_CHECKING
+
+from utils.logger import create_logger, logging_function
+
+if TYPE_CHECKING:
+    from mypy_boto3_ssm import SSMClient
+
+logger = create_logger(__name__)
+
+# GetParameters accepts at most 10 names per call
+BATCH_SIZE_GET_PARAMETERS = 10
+
+
+@dataclass(frozen=True)
+class ParameterEntry:
+    value: str
+    fetched_at: float
+
+
+class ParameterCache:
+    def __init__(
+        self,
+        *,
+        ttl: float = 900.0,
+        max_stale: float = 86400.0,
+        clock: Callable[[], float] = monotonic,
+    ):
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.clock = clock
+        self.hit_count = 0
+        self.stale_count = 0
+        self.miss_count = 0
+        self.refresh_error_count = 0
+        self._entries: dict[str, ParameterEntry] = {}
+        self._refreshing: set[str] = set()
+        self._lock = Lock()
+
+    @logging_function(logger)
+    def get_parameters(self, names: list[str], *, client: SSMClient) -> dict[str, str]:
+        now = self.clock()
+        result = {}
+        missing = []
+        stale = []
+        with self._lock:
+            for name in names:
+                entry = self._entries.get(name)
+                age = None if entry is None else now - entry.fetched_at
+                if age is None or age >= self.ttl + self.max_stale:
+                    missing.append(name)
+                    continue
+                result[name] = entry.value
+                if age < self.ttl:
+                    self.hit_count += 1
+                    continue
+                self.stale_count += 1
+                if name not in self._refreshing:
+                    self._refreshing.add(name)
+                    stale.append(name)
+            self.miss_count += len(missing)
+        if len(stale) > 0:
+            # refreshed inline, a thread left running is frozen with the
+            # environment once the handler returns, the stale value is only
+            # served when the refresh fails or another caller is refreshing
+            result.update(self._refresh(stale, client=client))
+        if len(missing) > 0:
+            result.update(self._fetch(missing, client=client))
+        return {x: result[x] for x in names}
+
+    def invalidate(self, names: list[str] | None = None):
+        with self._lock:
+            if names is None:
+                self._entries.clear()
+                return
+            for name in names:
+                self._entries.pop(name, None)
+
+    def _refresh(self, names: list[str], *, client: SSMClient) -> dict[str, str]:
+        try:
+            return self._fetch(names, client=client)
+        except Exception as e:
+            with self._lock:
+                self.refresh_error_count += 1
+            logger.warning(
+                f"failed to refresh parameters: {e}",
+                data={"Names": names, "ErrorType": str(type(e))},
+            )
+            return {}
+        finally:
+            with self._lock:
+                self._refreshing.difference_update(names)
+
+    def _fetch(self, names: list[str], *, client: SSMClient) -> dict[str, str]:
+        values = {}
+        for i in range(0, len(names), BATCH_SIZE_GET_PARAMETERS):
+            resp = client.get_parameters(
+                Names=names[i : i + BATCH_SIZE_GET_PARAMETERS], WithDecryption=True
+            )
+            if len(resp.get("InvalidParameters", [])) > 0:
+                raise KeyError(f"parameters not found: {resp['InvalidParameters']}")
+            values.update({x["Name"]: x["Value"] for x in resp["Parameters"]})
+        now = self.clock()
+        with self._lock:
+            for name, value in values.items():
+                self._entries[name] = ParameterEntry(value=value, fetched_at=now)
+        return values
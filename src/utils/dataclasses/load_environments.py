@@ -8,6 +8,15 @@ logger = create_logger(__name__)
 
 @logging_function(logger)
 def load_environments[T](*, class_dataclass: type[T]) -> T:
+    if hasattr(class_dataclass, "model_fields"):
+        # pydantic models convert the values and keep defaults for unset keys
+        return class_dataclass.model_validate(
+            {
+                k: os.environ[k.upper()]
+                for k in class_dataclass.model_fields
+                if k.upper() in os.environ
+            }
+        )
     return class_dataclass(
         **{k.name: os.environ[k.name.upper()] for k in fields(class_dataclass)}
     )
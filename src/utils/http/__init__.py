@@ -1,6 +1,44 @@
-from .interval_getter import create_interval_getter
+from .connection_pool import ConnectionPool
+from .rate_limiter import RateLimiter, TokenBucket, create_rate_limited_getter
+from .retry import (
+    RetryBudget,
+    RetryPolicy,
+    create_retrying_getter,
+    is_notion_idempotent,
+)
 
-client_contentful = create_interval_getter(0.3)
-client_notion = create_interval_getter(0.5)
+connection_pool = ConnectionPool(max_size=8, timeout=30.0)
 
-__all__ = ["create_interval_getter", "client_contentful", "client_notion"]
+limiter_contentful = RateLimiter(rate=7.0, burst=5)
+limiter_notion = RateLimiter(rate=3.0, burst=3)
+
+# one budget for all clients, the handler resets it per invocation
+retry_budget = RetryBudget(max_retries=20)
+retry_policy = RetryPolicy(budget=retry_budget)
+
+client_contentful = create_retrying_getter(
+    retry_policy,
+    send=create_rate_limited_getter(limiter_contentful, send=connection_pool.request),
+)
+client_notion = create_retrying_getter(
+    retry_policy,
+    send=create_rate_limited_getter(limiter_notion, send=connection_pool.request),
+    is_idempotent=is_notion_idempotent,
+)
+
+__all__ = [
+    "ConnectionPool",
+    "RateLimiter",
+    "RetryBudget",
+    "RetryPolicy",
+    "TokenBucket",
+    "client_contentful",
+    "client_notion",
+    "connection_pool",
+    "create_rate_limited_getter",
+    "create_retrying_getter",
+    "limiter_contentful",
+    "limiter_notion",
+    "retry_budget",
+    "retry_policy",
+]
@@ -0,0 +1,180 @@
+import ssl
+from copy import copy
+from http.client import (
+    HTTPConnection,
+    HTTPResponse,
+    HTTPSConnection,
+    RemoteDisconnected,
+)
+from io import BytesIO
+from threading import BoundedSemaphore, Lock
+from time import monotonic
+from urllib.error import HTTPError, URLError
+from urllib.request import Request
+
+from utils.logger import create_logger, logging_function
+
+logger = create_logger(__name__)
+
+STALE_CONNECTION_ERRORS = (
+    RemoteDisconnected,
+    ConnectionResetError,
+    ConnectionAbortedError,
+    BrokenPipeError,
+)
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+type PoolKey = tuple[str, str, int]
+
+
+class ConnectionPool:
+    def __init__(
+        self,
+        *,
+        max_size: int = 4,
+        timeout: float = 30.0,
+        pool_timeout: float = 60.0,
+        idle_timeout: float = 30.0,
+    ):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.pool_timeout = pool_timeout
+        self.idle_timeout = idle_timeout
+        self.created_count = 0
+        self.reused_count = 0
+        self._idle: dict[PoolKey, list[tuple[HTTPConnection, float]]] = {}
+        self._semaphores: dict[PoolKey, BoundedSemaphore] = {}
+        self._lock = Lock()
+        # loading the CA bundle is costly, it waits for the first https host
+        self._ssl_context: ssl.SSLContext | None = None
+
+    def _semaphore(self, key: PoolKey) -> BoundedSemaphore:
+        with self._lock:
+            if key not in self._semaphores:
+                self._semaphores[key] = BoundedSemaphore(self.max_size)
+            return self._semaphores[key]
+
+    def _connect(self, key: PoolKey) -> HTTPConnection:
+        scheme, host, port = key
+        with self._lock:
+            self.created_count += 1
+            if scheme == "https" and self._ssl_context is None:
+                self._ssl_context = ssl.create_default_context()
+        if scheme == "https":
+            return HTTPSConnection(
+                host, port, timeout=self.timeout, context=self._ssl_context
+            )
+        return HTTPConnection(host, port, timeout=self.timeout)
+
+    def _checkout(self, key: PoolKey) -> HTTPConnection | None:
+        with self._lock:
+            idle = self._idle.get(key, [])
+            while len(idle) > 0:
+                conn, released_at = idle.pop()
+                if monotonic() - released_at < self.idle_timeout:
+                    self.reused_count += 1
+                    return conn
+                conn.close()
+        return None
+
+    def _checkin(self, key: PoolKey, conn: HTTPConnection):
+        with self._lock:
+            self._idle.setdefault(key, []).append((conn, monotonic()))
+
+    def close(self):
+        with self._lock:
+            for idle in self._idle.values():
+                for conn, _ in idle:
+                    conn.close()
+            self._idle.clear()
+
+    def request(self, req: Request) -> HTTPResponse:
+        scheme = req.type
+        host, _, port_text = req.host.partition(":")
+        if port_text != "":
+            port = int(port_text)
+        else:
+            port = 443 if scheme == "https" else 80
+        key = (scheme, host, port)
+
+        semaphore = self._semaphore(key)
+        if not semaphore.acquire(timeout=self.pool_timeout):
+            raise URLError(f"timed out waiting for a connection to {host}:{port}")
+        try:
+            resp = None
+            conn = self._checkout(key)
+            if conn is not None:
+                resp = exchange(conn, req, reused=True)
+            if resp is None:
+                conn = self._connect(key)
+                resp = exchange(conn, req, reused=False)
+
+            try:
+                body = resp.read()
+            except Exception:
+                conn.close()
+                raise
+            if resp.will_close:
+                conn.close()
+            else:
+                self._checkin(key, conn)
+        finally:
+            semaphore.release()
+
+        # the body is buffered so the connection is back in the pool before
+        # the caller reads it, the drained original stays closed for the
+        # connection while the copy keeps the urlopen interface
+        buffered = copy(resp)
+        buffered.fp = BytesIO(body)
+        buffered.length = len(body)
+        buffered.chunked = False
+        if buffered.status >= 400:
+            raise HTTPError(
+                req.full_url,
+                buffered.status,
+                buffered.reason,
+                buffered.headers,
+                buffered,
+            )
+        return buffered
+
+
+@logging_function(logger)
+def exchange(
+    conn: HTTPConnection, req: Request, *, reused: bool
+) -> HTTPResponse | None:
+    # None means the reused keep-alive connection was already closed by the
+    # server and the request can safely be sent again on a fresh connection
+    try:
+        send_request(conn, req)
+    except STALE_CONNECTION_ERRORS:
+        conn.close()
+        if reused:
+            return None
+        raise
+    except Exception:
+        conn.close()
+        raise
+    try:
+        return conn.getresponse()
+    except STALE_CONNECTION_ERRORS:
+        conn.close()
+        # the body may already have been processed, only replay idempotent ones
+        if reused and req.get_method() in IDEMPOTENT_METHODS:
+            return None
+        raise
+    except Exception:
+        conn.close()
+        raise
+
+
+@logging_function(logger)
+def send_request(conn: HTTPConnection, req: Request):
+    headers = dict(req.header_items())
+    try:
+        conn.request(req.get_method(), req.selector, body=req.data, headers=headers)
+    except STALE_CONNECTION_ERRORS:
+        raise
+    except OSError as e:
+        raise URLError(e) from e
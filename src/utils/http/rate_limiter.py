@@ -0,0 +1,149 @@
+from collections.abc import Callable, Mapping
+from http.client import HTTPResponse
+from threading import Lock
+from time import monotonic, sleep
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from utils.logger import create_logger, logging_function
+
+logger = create_logger(__name__)
+
+HEADER_CONTENTFUL_SECOND_LIMIT = "X-Contentful-RateLimit-Second-Limit"
+HEADER_CONTENTFUL_SECOND_REMAINING = "X-Contentful-RateLimit-Second-Remaining"
+HEADER_CONTENTFUL_RESET = "X-Contentful-RateLimit-Reset"
+HEADER_RETRY_AFTER = "Retry-After"
+
+
+class TokenBucket:
+    def __init__(self, *, rate: float, burst: int, min_rate: float = 0.5):
+        self.max_rate = rate
+        self.min_rate = min_rate
+        self.rate = rate
+        self.burst = burst
+        self.throttled_seconds = 0.0
+        self.throttled_count = 0
+        self._tokens = float(burst)
+        self._updated = monotonic()
+        self._lock = Lock()
+
+    def _refill(self, now: float):
+        # while blocked after a 429 _updated lies in the future, nothing refills
+        if now <= self._updated:
+            return
+        elapsed = now - self._updated
+        self._updated = now
+        self._tokens = min(float(self.burst), self._tokens + elapsed * self.rate)
+
+    def _reserve(self, now: float) -> float:
+        # tokens may go negative: a negative balance is the queue of callers
+        # that already hold a reservation, so each one waits for its own slot
+        self._refill(now)
+        self._tokens -= 1
+        wait = max(self._updated - now, 0.0) + max(-self._tokens, 0.0) / self.rate
+        if wait > 0:
+            self.throttled_seconds += wait
+            self.throttled_count += 1
+        return wait
+
+    def reserve(self) -> float:
+        with self._lock:
+            return self._reserve(monotonic())
+
+    def reserve_again(self) -> float:
+        # a 429 observed while the caller slept blocks its reservation too, the
+        # slot is given back and taken again behind the block
+        with self._lock:
+            now = monotonic()
+            if now >= self._updated:
+                return 0.0
+            self._tokens += 1
+            return self._reserve(now)
+
+    def acquire(self) -> float:
+        waited = 0.0
+        wait = self.reserve()
+        while wait > 0:
+            sleep(wait)
+            waited += wait
+            wait = self.reserve_again()
+        return waited
+
+    def observe(self, *, status: int, headers: Mapping[str, str] | None):
+        headers = {} if headers is None else headers
+        with self._lock:
+            now = monotonic()
+            self._refill(now)
+            limit = parse_number(headers.get(HEADER_CONTENTFUL_SECOND_LIMIT))
+            if limit is not None and limit > 0:
+                self.max_rate = limit
+                self.rate = limit
+                self.burst = max(1, int(limit))
+            remaining = parse_number(headers.get(HEADER_CONTENTFUL_SECOND_REMAINING))
+            if remaining is not None and remaining <= 0:
+                self._tokens = min(self._tokens, 0.0)
+
+            if status == 429:
+                delay = parse_number(headers.get(HEADER_CONTENTFUL_RESET))
+                if delay is None:
+                    delay = parse_number(headers.get(HEADER_RETRY_AFTER))
+                if delay is None:
+                    delay = 1 / self.rate
+                if limit is None:
+                    self.rate = max(self.min_rate, self.rate / 2)
+                # one request may go when the block ends, the rest stay spaced
+                self._updated = max(self._updated, now + delay)
+                self._tokens = min(self._tokens, 1.0)
+            elif limit is None and self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.min_rate)
+
+
+class RateLimiter:
+    def __init__(self, *, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.buckets: dict[str, TokenBucket] = {}
+        self._lock = Lock()
+
+    def bucket(self, host: str) -> TokenBucket:
+        with self._lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(rate=self.rate, burst=self.burst)
+            return self.buckets[host]
+
+    @property
+    def throttled_seconds(self) -> float:
+        return sum(x.throttled_seconds for x in self.buckets.values())
+
+    @property
+    def throttled_count(self) -> int:
+        return sum(x.throttled_count for x in self.buckets.values())
+
+
+def parse_number(value: str | None) -> float | None:
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def create_rate_limited_getter(
+    limiter: RateLimiter,
+    *,
+    send: Callable[[Request], HTTPResponse] = urlopen,
+) -> Callable[[Request], HTTPResponse]:
+    @logging_function(logger)
+    def request_http_get(req: Request) -> HTTPResponse:
+        bucket = limiter.bucket(req.host)
+        bucket.acquire()
+        try:
+            resp = send(req)
+        except HTTPError as e:
+            bucket.observe(status=e.code, headers=e.headers)
+            raise
+        bucket.observe(status=resp.status, headers=resp.headers)
+        return resp
+
+    return request_http_get
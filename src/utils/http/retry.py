@@ -0,0 +1,160 @@
+from collections.abc import Callable
+from http.client import HTTPResponse
+from random import random
+from threading import Lock
+from time import monotonic, sleep
+from urllib.error import HTTPError, URLError
+from urllib.request import Request
+
+from utils.logger import create_logger, logging_function, metrics
+
+from .rate_limiter import HEADER_CONTENTFUL_RESET, HEADER_RETRY_AFTER, parse_number
+
+logger = create_logger(__name__)
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+# the server declares these were not processed, so even a POST is safe to resend
+REJECTED_STATUSES = {429, 503}
+NETWORK_ERRORS = (URLError, TimeoutError, ConnectionError)
+
+
+class RetryBudget:
+    """retries and the deadline shared by every client within one invocation"""
+
+    def __init__(self, *, max_retries: int):
+        self.max_retries = max_retries
+        self.retry_count = 0
+        self.exhausted_count = 0
+        self._deadline: float | None = None
+        self._lock = Lock()
+
+    def reset(
+        self, *, max_retries: int | None = None, remaining_seconds: float | None = None
+    ):
+        with self._lock:
+            if max_retries is not None:
+                self.max_retries = max_retries
+            self.retry_count = 0
+            self.exhausted_count = 0
+            self._deadline = (
+                None if remaining_seconds is None else monotonic() + remaining_seconds
+            )
+
+    def remaining_seconds(self) -> float | None:
+        if self._deadline is None:
+            return None
+        return self._deadline - monotonic()
+
+    def try_spend(self, *, seconds_needed: float) -> bool:
+        with self._lock:
+            remaining = None if self._deadline is None else self._deadline - monotonic()
+            if self.retry_count >= self.max_retries or (
+                remaining is not None and remaining < seconds_needed
+            ):
+                self.exhausted_count += 1
+                return False
+            self.retry_count += 1
+            return True
+
+
+class RetryPolicy:
+    def __init__(
+        self,
+        *,
+        budget: RetryBudget,
+        max_attempts: int = 4,
+        base_seconds: float = 0.5,
+        max_seconds: float = 8.0,
+        attempt_seconds: float = 5.0,
+    ):
+        self.budget = budget
+        self.max_attempts = max_attempts
+        self.base_seconds = base_seconds
+        self.max_seconds = max_seconds
+        # what one more attempt is expected to take, a retry is only started
+        # when the backoff plus this still fits before the deadline
+        self.attempt_seconds = attempt_seconds
+
+    def backoff(self, attempt: int) -> float:
+        # full jitter, concurrent callers failing together spread out
+        return random() * min(self.max_seconds, self.base_seconds * 2**attempt)
+
+
+def is_idempotent_method(req: Request) -> bool:
+    return req.get_method() in {"GET", "HEAD", "OPTIONS"}
+
+
+def is_notion_idempotent(req: Request) -> bool:
+    # a database query is sent as POST but only reads
+    return is_idempotent_method(req) or req.full_url.endswith("/query")
+
+
+def get_retry_after(e: HTTPError) -> float | None:
+    headers = {} if e.headers is None else e.headers
+    delay = parse_number(headers.get(HEADER_CONTENTFUL_RESET))
+    if delay is None:
+        delay = parse_number(headers.get(HEADER_RETRY_AFTER))
+    return delay
+
+
+def is_retryable(e: Exception, *, idempotent: bool) -> bool:
+    if isinstance(e, HTTPError):
+        statuses = RETRYABLE_STATUSES if idempotent else REJECTED_STATUSES
+        return e.code in statuses
+    # a request lost on the wire may have been processed
+    return idempotent and isinstance(e, NETWORK_ERRORS)
+
+
+def create_retrying_getter(
+    policy: RetryPolicy,
+    *,
+    send: Callable[[Request], HTTPResponse],
+    is_idempotent: Callable[[Request], bool] = is_idempotent_method,
+) -> Callable[[Request], HTTPResponse]:
+    # send is expected to be rate limited, a 429 blocks its bucket for the
+    # Retry-After period, so that wait is only counted against the deadline
+    # here and not slept a second time
+    @logging_function(logger)
+    def request_http_retrying(req: Request) -> HTTPResponse:
+        idempotent = is_idempotent(req)
+        attempt = 0
+        while True:
+            try:
+                return send(req)
+            except Exception as e:
+                attempt += 1
+                if attempt >= policy.max_attempts or not is_retryable(
+                    e, idempotent=idempotent
+                ):
+                    raise
+                delay = policy.backoff(attempt)
+                retry_after = get_retry_after(e) if isinstance(e, HTTPError) else None
+                waited = max(delay, 0.0 if retry_after is None else retry_after)
+                if not policy.budget.try_spend(
+                    seconds_needed=waited + policy.attempt_seconds
+                ):
+                    logger.warning(
+                        "no retry left within the budget or the deadline",
+                        data={
+                            "Url": req.full_url,
+                            "Attempt": attempt,
+                            "RemainingSeconds": policy.budget.remaining_seconds(),
+                        },
+                    )
+                    metrics.add("HttpRetryBudgetExhausted")
+                    raise
+                logger.debug(
+                    "retry request",
+                    data={
+                        "Url": req.full_url,
+                        "Attempt": attempt,
+                        "DelaySeconds": delay,
+                        "RetryAfterSeconds": retry_after,
+                        "ErrorType": str(type(e)),
+                        "ErrorMessage": str(e),
+                    },
+                )
+                metrics.add("HttpRetries")
+                sleep(delay)
+
+    return request_http_retrying
@@ -1,5 +1,6 @@
 from .create_logger import create_logger
 from .logging_function import logging_function
 from .logging_handler import logging_handler
+from .metrics import Metrics, metrics
 
-__all__ = ["create_logger", "logging_function", "logging_handler"]
+__all__ = ["Metrics", "create_logger", "logging_function", "logging_handler", "metrics"]
@@ -1,43 +1,93 @@
+import json
+import os
 from base64 import b64encode
-from dataclasses import asdict, is_dataclass
+from dataclasses import fields, is_dataclass
 from datetime import datetime
 from decimal import Decimal
 from gzip import compress
+from itertools import islice
 from logging import DEBUG
-from urllib.request import Request
+from sys import modules
 
 from aws_lambda_powertools import Logger
-from aws_lambda_powertools.utilities.data_classes.common import DictWrapper
-from pydantic import BaseModel
+
+# a record beyond the budget is summarized, CloudWatch Logs caps an event at
+# 256 KiB and every byte is paid for at ingestion
+MAX_RECORD_BYTES = int(os.getenv("LOG_MAX_RECORD_BYTES", "65536"))
+MAX_ITEMS = 50
+MAX_STRING = 4096
+MAX_DEPTH = 8
+PREVIEW_ITEMS = 5
+PREVIEW_BYTES = 64
+# gzip does not pay off on tiny values and costs too much on huge ones
+COMPRESS_MIN_BYTES = 512
+COMPRESS_MAX_BYTES = 64 * 1024
+REDACTED_HEADERS = {"Authorization"}
+
+
+def is_instance_lazy(obj, module: str, name: str) -> bool:
+    # an instance can only exist once its module was imported, so the module
+    # is looked up instead of imported at logger creation
+    loaded = modules.get(module)
+    return loaded is not None and isinstance(obj, getattr(loaded, name))
+
+
+def convert_bytes(obj: bytes, *, max_encoded: int | None = None) -> dict:
+    preview = {
+        "type": "bytes (base64 encoded preview)",
+        "length": len(obj),
+        "preview": b64encode(obj[:PREVIEW_BYTES]).decode(),
+    }
+    if len(obj) < COMPRESS_MIN_BYTES:
+        encoded = b64encode(obj).decode()
+        if max_encoded is not None and len(encoded) > max_encoded:
+            return preview
+        return {"type": "bytes (base64 encoded)", "value": encoded}
+    if len(obj) > COMPRESS_MAX_BYTES:
+        return preview
+    encoded = b64encode(compress(obj, compresslevel=1, mtime=0)).decode()
+    # a cut compressed value cannot be decoded, so it is never truncated
+    if max_encoded is not None and len(encoded) > max_encoded:
+        return preview
+    return {"type": "bytes (base64 encoded, gzip compressed)", "value": encoded}
 
 
 def custom_default(obj):
+    # containers are converted one level at a time, json and bound() recurse
     if isinstance(obj, tuple):
         return list(obj)
-    if isinstance(obj, set):
+    if isinstance(obj, (set, frozenset)):
         return {"type": str(type(obj)), "values": list(obj)}
     if isinstance(obj, datetime):
         return str(obj)
     if isinstance(obj, bytes):
-        compressed = compress(obj, compresslevel=7)
-        encoded = b64encode(compressed).decode()
-        return {"type": "bytes (base64 encoded, gzip compressed)", "value": encoded}
+        return convert_bytes(obj)
     if isinstance(obj, Decimal):
         return num if (num := int(obj)) == obj else float(str(obj))
-    if isinstance(obj, DictWrapper):
+    if is_instance_lazy(
+        obj, "aws_lambda_powertools.utilities.data_classes.common", "DictWrapper"
+    ):
         return obj.raw_event
-    if isinstance(obj, BaseModel):
-        return obj.model_dump()
-    if isinstance(obj, Request):
+    if is_instance_lazy(obj, "pydantic.main", "BaseModel"):
+        return {k: getattr(obj, k) for k in type(obj).model_fields}
+    if is_instance_lazy(obj, "urllib.request", "Request"):
         return {
             "type": str(type(obj)),
-            "value": obj.__dict__,
+            "value": {
+                "method": obj.get_method(),
+                "full_url": obj.full_url,
+                "headers": {
+                    k: "***" if k in REDACTED_HEADERS else v
+                    for k, v in obj.header_items()
+                },
+                "data": obj.data,
+            },
         }
     if is_dataclass(obj):
         if isinstance(obj, type):
             return {"type": str(obj)}
         else:
-            return asdict(obj)
+            return {x.name: getattr(obj, x.name) for x in fields(obj)}
     try:
         return {"type": str(type(obj)), "value": str(obj)}
     except Exception as e:
@@ -47,7 +97,79 @@ def custom_default(obj):
         }
 
 
+def bound(obj, *, max_items: int, max_string: int, depth: int = 0):
+    if obj is None or isinstance(obj, (bool, int, float)):
+        return obj
+    if isinstance(obj, str):
+        if len(obj) <= max_string:
+            return obj
+        return f"{obj[:max_string]}... ({len(obj) - max_string} chars truncated)"
+    if isinstance(obj, bytes):
+        return convert_bytes(obj, max_encoded=max_string)
+    if depth >= MAX_DEPTH:
+        return {"type": str(type(obj)), "truncated": "depth"}
+
+    def inner(x):
+        return bound(x, max_items=max_items, max_string=max_string, depth=depth + 1)
+
+    if isinstance(obj, dict):
+        if len(obj) <= max_items:
+            return {k: inner(v) for k, v in obj.items()}
+        return {
+            "type": str(type(obj)),
+            "length": len(obj),
+            "preview": {k: inner(v) for k, v in islice(obj.items(), PREVIEW_ITEMS)},
+        }
+    if isinstance(obj, (list, tuple)):
+        if len(obj) <= max_items:
+            return [inner(x) for x in obj]
+        return {
+            "type": str(type(obj)),
+            "length": len(obj),
+            "preview": [inner(x) for x in islice(obj, PREVIEW_ITEMS)],
+        }
+    if isinstance(obj, (set, frozenset)):
+        return {
+            "type": str(type(obj)),
+            "length": len(obj),
+            "values": [inner(x) for x in islice(obj, max_items)],
+        }
+    converted = custom_default(obj)
+    return inner(converted)
+
+
+def serialize_record(log: dict) -> str:
+    # large containers are summarized before serializing, so a huge payload
+    # is never walked in full
+    for max_items, max_string in [(MAX_ITEMS, MAX_STRING), (PREVIEW_ITEMS, 256)]:
+        text = json.dumps(
+            bound(log, max_items=max_items, max_string=max_string),
+            default=custom_default,
+            separators=(",", ":"),
+            ensure_ascii=False,
+        )
+        size = len(text.encode())
+        if size <= MAX_RECORD_BYTES:
+            return text
+    summarized = {k: v for k, v in log.items() if k not in ("data", "stack_trace")}
+    summarized["data"] = {
+        "truncated": "record",
+        "bytes": size,
+        "preview": text[: MAX_RECORD_BYTES // 4],
+    }
+    return json.dumps(
+        bound(summarized, max_items=MAX_ITEMS, max_string=MAX_RECORD_BYTES // 4),
+        default=custom_default,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+
+
 def create_logger(name: str) -> Logger:
     return Logger(
-        service=name, level=DEBUG, use_rfc3339=True, json_default=custom_default
+        service=name,
+        level=DEBUG,
+        use_rfc3339=True,
+        json_default=custom_default,
+        json_serializer=serialize_record,
     )
@@ -1,10 +1,38 @@
-from datetime import datetime, timezone
+import os
+from datetime import timedelta
 from functools import wraps
+from itertools import count
+from random import random
+from secrets import token_hex
+from time import perf_counter_ns
 from typing import Callable
-from uuid import uuid4
 
 from aws_lambda_powertools import Logger
 
+ENV_SAMPLE_RATE = "LOGGING_FUNCTION_SAMPLE_RATE"
+
+# call ids only need to be unique within the logs of one container
+CALL_ID_PREFIX = token_hex(4)
+call_counter = count(1)
+
+
+def create_call_id() -> str:
+    return f"{CALL_ID_PREFIX}-{next(call_counter):x}"
+
+
+def get_sample_rate() -> float:
+    try:
+        return min(1.0, max(0.0, float(os.getenv(ENV_SAMPLE_RATE, "0"))))
+    except ValueError:
+        return 0.0
+
+
+def create_duration(elapsed_ns: int) -> dict:
+    return {
+        "str": str(timedelta(microseconds=elapsed_ns // 1000)),
+        "TotalSeconds": elapsed_ns / 1e9,
+    }
+
 
 def logging_function(
     logger: Logger,
@@ -12,56 +40,83 @@ def logging_function(
     write: bool = False,
     with_return: bool = False,
     with_args: bool = False,
+    sample_rate: float | None = None,
 ) -> Callable:
+    # sample_rate is the share of calls logged as if write were set, it falls
+    # back to LOGGING_FUNCTION_SAMPLE_RATE
     def decorator(func: Callable) -> Callable:
+        name_function = func.__name__
+        rate = get_sample_rate() if sample_rate is None else sample_rate
+
+        def log_error(e: Exception, id_call: str, args, kwargs, start: int):
+            elapsed = perf_counter_ns() - start
+            logger.debug(
+                f"error occurred: {e}",
+                exc_info=True,
+                data={"ErrorType": str(type(e)), "ErrorMessage": str(e)},
+            )
+            logger.debug(
+                f'failed function "{name_function}" ({id_call})',
+                data={
+                    "FunctionName": name_function,
+                    "CallID": id_call,
+                    "Duration": create_duration(elapsed),
+                    "Args": args,
+                    "KwArgs": kwargs,
+                },
+            )
+
+        def call_logged(args, kwargs):
+            id_call = create_call_id()
+            data_start = {"FunctionName": name_function, "CallID": id_call}
+            if with_args:
+                data_start["Args"] = args
+                data_start["KwArgs"] = kwargs
+            logger.debug(
+                f'start function "{name_function}" ({id_call})', data=data_start
+            )
+            start = perf_counter_ns()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                log_error(e, id_call, args, kwargs, start)
+                raise
+            elapsed = perf_counter_ns() - start
+            data_end = {
+                "FunctionName": name_function,
+                "CallID": id_call,
+                "Duration": create_duration(elapsed),
+            }
+            if with_return:
+                data_end["Return"] = result
+            if with_args:
+                data_end["Args"] = args
+                data_end["KwArgs"] = kwargs
+            logger.debug(
+                f'succeeded function "{name_function}" ({id_call})', data=data_end
+            )
+            return result
+
+        if write:
+
+            @wraps(func)
+            def wrapper_function(*args, **kwargs):
+                return call_logged(args, kwargs)
+
+            return wrapper_function
+
+        # fast path, a successful call allocates nothing beyond the clock
+        # reading, ids and payloads are built only for errors and samples
         @wraps(func)
         def wrapper_function(*args, **kwargs):
-            name_function = func.__name__
-            id_call = str(uuid4())
-            dt_start = datetime.now(tz=timezone.utc)
-            result = None
-            is_error = False
+            if rate > 0.0 and random() < rate:
+                return call_logged(args, kwargs)
+            start = perf_counter_ns()
             try:
-                data_start = {"FunctionName": name_function, "CallID": id_call}
-                if with_args:
-                    data_start["Args"] = args
-                    data_start["KwArgs"] = kwargs
-                if write:
-                    logger.debug(
-                        f'start function "{name_function}" ({id_call})', data=data_start
-                    )
-                result = func(*args, **kwargs)
-                return result
+                return func(*args, **kwargs)
             except Exception as e:
-                is_error = True
-                logger.debug(
-                    f"error occurred: {e}",
-                    exc_info=True,
-                    data={"ErrorType": str(type(e)), "ErrorMessage": str(e)},
-                )
+                log_error(e, create_call_id(), args, kwargs, start)
                 raise
-            finally:
-                dt_end = datetime.now(tz=timezone.utc)
-                delta = dt_end - dt_start
-                data_end = {
-                    "FunctionName": name_function,
-                    "CallID": id_call,
-                    "Duration": {
-                        "str": str(delta),
-                        "TotalSeconds": delta.total_seconds(),
-                    },
-                }
-                if with_return and not is_error:
-                    data_end["Return"] = result
-                if with_args or is_error:
-                    data_end["Args"] = args
-                    data_end["KwArgs"] = kwargs
-                if write or is_error:
-                    status = "failed" if is_error else "succeeded"
-                    logger.debug(
-                        f'{status} function "{name_function}" ({id_call})',
-                        data=data_end,
-                    )
 
         return wrapper_function
 
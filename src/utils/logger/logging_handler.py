@@ -1,9 +1,15 @@
+import json
 import os
 from functools import wraps
+from itertools import count
+from threading import Event
 from typing import Callable
 
 from aws_lambda_powertools import Logger
 
+from .create_logger import MAX_ITEMS, bound, custom_default
+from .metrics import Metrics
+
 EXCLUDE_ENV_KEYS = {
     "AWS_ACCESS_KEY_ID",
     "AWS_LAMBDA_LOG_GROUP_NAME",
@@ -16,25 +22,65 @@ EXCLUDE_ENV_KEYS = {
     "_AWS_XRAY_DAEMON_ADDRESS",
     "_AWS_XRAY_DAEMON_PORT",
 }
+ENV_EVENT_SAMPLE_EVERY = "LOGGING_HANDLER_EVENT_SAMPLE_EVERY"
+ENV_MAX_EVENT_BYTES = "LOGGING_HANDLER_MAX_EVENT_BYTES"
+
+# the environment does not change within a container
+environment_logged = Event()
+
+
+def get_int_env(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.getenv(name, str(default))))
+    except ValueError:
+        return default
 
 
-def logging_handler(logger: Logger, *, with_return: bool = False) -> Callable:
+def cap_event(event, *, max_bytes: int):
+    # large containers and strings are summarized before measuring, so a huge
+    # event is never serialized in full
+    capped = bound(event, max_items=MAX_ITEMS, max_string=max_bytes)
+    text = json.dumps(capped, default=custom_default, ensure_ascii=False)
+    size = len(text.encode())
+    if size <= max_bytes:
+        return capped
+    return {"truncated": "event", "bytes": size, "preview": text[:max_bytes]}
+
+
+def logging_handler(
+    logger: Logger,
+    *,
+    with_return: bool = False,
+    event_sample_every: int | None = None,
+    max_event_bytes: int | None = None,
+    metrics: Metrics | None = None,
+) -> Callable:
+    # the event of every event_sample_every-th invocation is logged, and of
+    # every failed one, LOGGING_HANDLER_EVENT_SAMPLE_EVERY when omitted
     def decorator(handler: Callable) -> Callable:
-        @wraps(handler)
-        @logger.inject_lambda_context()
-        def wrapper_handler(event, context, *args, **kwargs):
+        sample_every = (
+            get_int_env(ENV_EVENT_SAMPLE_EVERY, 1)
+            if event_sample_every is None
+            else max(1, event_sample_every)
+        )
+        max_bytes = (
+            get_int_env(ENV_MAX_EVENT_BYTES, 8192)
+            if max_event_bytes is None
+            else max_event_bytes
+        )
+        invocations = count()
+
+        def log_event(event, *, reason: str):
             try:
-                logger.debug(
-                    "event and environment variables",
-                    data={
-                        "event": event,
-                        "env": {
-                            k: os.getenv(k)
-                            for k in sorted(os.environ.keys())
-                            if k not in EXCLUDE_ENV_KEYS
-                        },
-                    },
-                )
+                data = {"event": cap_event(event, max_bytes=max_bytes)}
+                if not environment_logged.is_set():
+                    environment_logged.set()
+                    data["env"] = {
+                        k: os.getenv(k)
+                        for k in sorted(os.environ.keys())
+                        if k not in EXCLUDE_ENV_KEYS
+                    }
+                logger.debug(f"event ({reason})", data=data)
             except Exception as e:
                 logger.warning(
                     f"error occurred in logging event and environment variables: {e}",
@@ -42,18 +88,31 @@ def logging_handler(logger: Logger, *, with_return: bool = False) -> Callable:
                     data={"ErrorType": str(type(e)), "ErrorMessage": str(e)},
                 )
 
+        @wraps(handler)
+        @logger.inject_lambda_context()
+        def wrapper_handler(event, context, *args, **kwargs):
+            sampled = next(invocations) % sample_every == 0
+            if sampled:
+                log_event(event, reason="sampled")
+
             try:
                 result = handler(event, context, *args, **kwargs)
                 if with_return:
                     logger.debug("handler return", data={"Return": result})
                 return result
             except Exception as e:
+                if not sampled:
+                    log_event(event, reason="failed")
                 logger.error(
                     f"error occurred in handler: {e}",
                     exc_info=True,
                     data={"ErrorType": str(type(e)), "ErrorMessage": str(e)},
                 )
                 raise
+            finally:
+                # metrics are aggregated per invocation and written once
+                if metrics is not None:
+                    metrics.flush(service=logger.service)
 
         return wrapper_handler
 
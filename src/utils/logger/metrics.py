@@ -0,0 +1,104 @@
+import json
+import os
+import sys
+from collections.abc import Iterator
+from contextlib import contextmanager
+from threading import Lock
+from time import perf_counter, time
+from typing import Literal
+
+type MetricUnit = Literal["Count", "Milliseconds", "Seconds", "Bytes"]
+
+ENV_NAMESPACE = "METRICS_NAMESPACE"
+# CloudWatch takes at most 100 metrics per document and 100 values per metric
+MAX_METRICS_PER_DOCUMENT = 100
+MAX_VALUES_PER_METRIC = 100
+
+
+class Metrics:
+    def __init__(self, *, namespace: str | None = None):
+        self.namespace = namespace or os.getenv(ENV_NAMESPACE, "Application")
+        self._counters: dict[str, tuple[float, MetricUnit]] = {}
+        self._distributions: dict[str, tuple[list[float], MetricUnit]] = {}
+        self._lock = Lock()
+
+    def add(self, name: str, value: float = 1, *, unit: MetricUnit = "Count"):
+        with self._lock:
+            current, _ = self._counters.get(name, (0, unit))
+            self._counters[name] = (current + value, unit)
+
+    def observe(self, name: str, value: float, *, unit: MetricUnit = "Milliseconds"):
+        with self._lock:
+            self._distributions.setdefault(name, ([], unit))[0].append(value)
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, (perf_counter() - start) * 1000)
+
+    def flush(self, *, service: str):
+        # one invocation is emitted as few documents as the limits allow, the
+        # values are aggregated in memory until here
+        with self._lock:
+            counters = self._counters
+            distributions = self._distributions
+            self._counters = {}
+            self._distributions = {}
+        for document in self.create_documents(
+            service=service, counters=counters, distributions=distributions
+        ):
+            sys.stdout.write(json.dumps(document, separators=(",", ":")) + "\n")
+        sys.stdout.flush()
+
+    def create_documents(
+        self,
+        *,
+        service: str,
+        counters: dict[str, tuple[float, MetricUnit]],
+        distributions: dict[str, tuple[list[float], MetricUnit]],
+    ) -> list[dict]:
+        rounds = max(
+            [1 if len(counters) > 0 else 0]
+            + [
+                -(-len(values) // MAX_VALUES_PER_METRIC)
+                for values, _ in distributions.values()
+            ]
+        )
+        documents = []
+        timestamp = int(time() * 1000)
+        for i in range(rounds):
+            entries: list[tuple[str, float | list[float], MetricUnit]] = []
+            if i == 0:
+                entries.extend((k, v, u) for k, (v, u) in counters.items())
+            for k, (values, unit) in distributions.items():
+                chunk = values[
+                    i * MAX_VALUES_PER_METRIC : (i + 1) * MAX_VALUES_PER_METRIC
+                ]
+                if len(chunk) > 0:
+                    entries.append((k, chunk, unit))
+            for j in range(0, len(entries), MAX_METRICS_PER_DOCUMENT):
+                chunk_entries = entries[j : j + MAX_METRICS_PER_DOCUMENT]
+                document = {
+                    "_aws": {
+                        "Timestamp": timestamp,
+                        "CloudWatchMetrics": [
+                            {
+                                "Namespace": self.namespace,
+                                "Dimensions": [["Service"]],
+                                "Metrics": [
+                                    {"Name": k, "Unit": u} for k, _, u in chunk_entries
+                                ],
+                            }
+                        ],
+                    },
+                    "Service": service,
+                }
+                document.update({k: v for k, v, _ in chunk_entries})
+                documents.append(document)
+        return documents
+
+
+metrics = Metrics()
@@ -1,3 +1,3 @@
-from .models import Article, Author, CachedData
+from .models import Article, Author, CachedData, Checkpointer, Codec, ResumePoint
 
-__all__ = ["Article", "Author", "CachedData"]
+__all__ = ["Article", "Author", "CachedData", "Checkpointer", "Codec", "ResumePoint"]
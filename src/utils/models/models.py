@@ -1,15 +1,299 @@
 from __future__ import annotations
 
+import gzip
 import json
-from gzip import compress, decompress
+import lzma
+import re
+import zlib
+from bisect import bisect_left
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import dataclass
+from functools import cache
+from hashlib import sha1
+from importlib import import_module
+from pathlib import Path
+from time import monotonic, perf_counter, time
+from typing import TYPE_CHECKING, Any, Literal, Protocol
+from uuid import uuid4
 
-from mypy_boto3_s3 import S3Client
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr
 
-from utils.logger import create_logger, logging_function
+from utils.logger import create_logger, logging_function, metrics
+
+if TYPE_CHECKING:
+    from mypy_boto3_s3 import S3Client
 
 logger = create_logger(__name__)
+_warm_cache: dict[str, CachedData] = {}
 KEY_CACHED_DATA = "data/cached_data.json.gzip"
+KEY_MANIFEST = "data/manifest.json"
+KEY_PREFIX_BASE = "data/base/"
+KEY_PREFIX_SEGMENT = "data/segments/"
+CONTENT_TYPE_LEGACY = "application/gzip"
+CONTENT_TYPE_PREFIX = "application/x-cached-data"
+CONDITIONAL_WRITE_ERROR_CODES = {"PreconditionFailed", "ConditionalRequestConflict"}
+JSON_WHITESPACE = re.compile(r"[ \t\n\r]*")
+# the separators of pydantic, so a folded object reads like one it dumped
+JSON_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+ENCODE_BLOCK_BYTES = 64 * 1024
+
+
+type CodecFormat = Literal["json", "msgpack"]
+type CodecCompression = Literal["gzip", "zlib", "lzma", "zstd", "none"]
+
+MAGIC_BYTES: dict[bytes, CodecCompression] = {
+    b"\x1f\x8b": "gzip",
+    b"\x28\xb5\x2f\xfd": "zstd",
+    b"\xfd7zXZ\x00": "lzma",
+}
+
+
+@cache
+def import_optional(name: str):
+    # optional codecs are only imported once a codec asks for them
+    try:
+        return import_module(name)
+    except ImportError:
+        return None
+
+
+@dataclass(frozen=True)
+class Codec:
+    format: CodecFormat = "json"
+    compression: CodecCompression = "gzip"
+    level: int | None = None
+
+    def __post_init__(self):
+        if self.format not in ("json", "msgpack"):
+            raise ValueError(f"unknown codec format: {self.format}")
+        if self.compression not in ("gzip", "zlib", "lzma", "zstd", "none"):
+            raise ValueError(f"unknown codec compression: {self.compression}")
+        if self.format == "msgpack" and import_optional("msgpack") is None:
+            raise ValueError("codec format msgpack requires the msgpack package")
+        if self.compression == "zstd" and import_optional("zstandard") is None:
+            raise ValueError("codec compression zstd requires the zstandard package")
+
+    @staticmethod
+    def parse(text: str) -> Codec:
+        # "<format>+<compression>[:<level>]", e.g. "msgpack+zstd:3"
+        name, _, level = text.partition(":")
+        format, _, compression = name.partition("+")
+        return Codec(
+            format=format,
+            compression=compression or "none",
+            level=int(level) if level != "" else None,
+        )
+
+    @property
+    def content_type(self) -> str:
+        if self.format == "json" and self.compression == "gzip":
+            return CONTENT_TYPE_LEGACY
+        return f"{CONTENT_TYPE_PREFIX}; format={self.format}; compression={self.compression}"
+
+    @property
+    def extension(self) -> str:
+        if self.compression == "none":
+            return self.format
+        return f"{self.format}.{self.compression}"
+
+    def compress(self, binary: bytes) -> bytes:
+        match self.compression:
+            case "gzip":
+                return gzip.compress(binary, compresslevel=self.level or 6, mtime=0)
+            case "zlib":
+                return zlib.compress(binary, level=self.level or 6)
+            case "lzma":
+                return lzma.compress(binary, preset=self.level or 6)
+            case "zstd":
+                zstandard = import_optional("zstandard")
+                return zstandard.ZstdCompressor(level=self.level or 3).compress(binary)
+        return binary
+
+    def decompress(self, binary: bytes) -> bytes:
+        match self.compression:
+            case "gzip":
+                return gzip.decompress(binary)
+            case "zlib":
+                return zlib.decompress(binary)
+            case "lzma":
+                return lzma.decompress(binary)
+            case "zstd":
+                zstandard = import_optional("zstandard")
+                # a streamed frame does not declare its content size
+                return zstandard.ZstdDecompressor().decompressobj().decompress(binary)
+        return binary
+
+    def compressor(self) -> Compressor:
+        match self.compression:
+            case "gzip":
+                return zlib.compressobj(self.level or 6, zlib.DEFLATED, 31)
+            case "zlib":
+                return zlib.compressobj(self.level or 6)
+            case "lzma":
+                return lzma.LZMACompressor(preset=self.level or 6)
+            case "zstd":
+                zstandard = import_optional("zstandard")
+                return zstandard.ZstdCompressor(level=self.level or 3).compressobj()
+        return IdentityCompressor()
+
+    def encode(self, data: BaseModel) -> bytes:
+        if self.format == "msgpack":
+            msgpack = import_optional("msgpack")
+            return self.compress(msgpack.packb(data.model_dump(mode="json")))
+        return self.compress(data.model_dump_json().encode())
+
+    def decode[T: BaseModel](self, binary: bytes, model: type[T]) -> T:
+        raw = self.decompress(binary)
+        if self.format == "msgpack":
+            msgpack = import_optional("msgpack")
+            return model.model_validate(msgpack.unpackb(raw))
+        return model.model_validate_json(raw)
+
+    def encode_entries(
+        self, data: BaseModel, field: str, entries: Iterable[tuple[str, Any]]
+    ) -> bytes:
+        """
+        encodes data with the map field taken from entries, which are serialized
+        one at a time instead of as models
+        """
+        compressor = self.compressor()
+        chunks: list[bytes] = []
+        buffer = bytearray()
+
+        def write(binary: bytes):
+            # the compressor is fed in blocks, not per entry
+            buffer.extend(binary)
+            if len(buffer) >= ENCODE_BLOCK_BYTES:
+                chunks.append(compressor.compress(bytes(buffer)))
+                buffer.clear()
+
+        fields = data.model_dump(mode="json")
+        if self.format == "msgpack":
+            msgpack = import_optional("msgpack")
+            packer = msgpack.Packer()
+            # a msgpack map starts with its length, so the entries come first
+            packed = [packer.pack(k) + packer.pack(v) for k, v in entries]
+            write(packer.pack_map_header(len(fields)))
+            for name, value in fields.items():
+                write(packer.pack(name))
+                if name != field:
+                    write(packer.pack(value))
+                    continue
+                write(packer.pack_map_header(len(packed)))
+                for x in packed:
+                    write(x)
+        else:
+            write(b"{")
+            for i, name in enumerate(fields.keys()):
+                write((b"," if i > 0 else b"") + dump_json(name) + b":")
+                if name != field:
+                    write(dump_json(fields[name]))
+                    continue
+                write(b"{")
+                for j, (k, v) in enumerate(entries):
+                    write((b"," if j > 0 else b"") + dump_json(k) + b":" + dump_json(v))
+                write(b"}")
+            write(b"}")
+        chunks.append(compressor.compress(bytes(buffer)))
+        chunks.append(compressor.flush())
+        return b"".join(chunks)
+
+    def iter_entries(
+        self, binary: bytes, field: str, rest: dict[str, Any]
+    ) -> Iterator[tuple[str, Any]]:
+        """
+        yields the entries of a top level map field one at a time, the other
+        fields are put into rest by the time the iterator is exhausted
+        """
+        if self.format == "msgpack":
+            msgpack = import_optional("msgpack")
+            unpacker = msgpack.Unpacker(raw=False)
+            unpacker.feed(self.decompress(binary))
+            for _ in range(unpacker.read_map_header()):
+                name = unpacker.unpack()
+                if name != field:
+                    rest[name] = unpacker.unpack()
+                    continue
+                for _ in range(unpacker.read_map_header()):
+                    yield unpacker.unpack(), unpacker.unpack()
+            return
+        yield from iter_json_entries(self.decompress(binary).decode(), field, rest)
+
+
+class Compressor(Protocol):
+    def compress(self, data: bytes, /) -> bytes: ...
+
+    def flush(self) -> bytes: ...
+
+
+class IdentityCompressor:
+    def compress(self, data: bytes, /) -> bytes:
+        return data
+
+    def flush(self) -> bytes:
+        return b""
+
+
+def dump_json(value: Any) -> bytes:
+    return JSON_ENCODER.encode(value).encode()
+
+
+def iter_json_entries(
+    text: str, field: str, rest: dict[str, Any]
+) -> Iterator[tuple[str, Any]]:
+    decoder = json.JSONDecoder()
+
+    def skip(pos: int) -> int:
+        return JSON_WHITESPACE.match(text, pos).end()
+
+    def expect(pos: int, char: str) -> int:
+        pos = skip(pos)
+        if text[pos : pos + 1] != char:
+            raise ValueError(f"expected {char!r} at {pos} of the json text")
+        return skip(pos + 1)
+
+    def next_member(pos: int) -> int:
+        # at the closing brace, or past the comma before the next member
+        pos = skip(pos)
+        return pos if text[pos : pos + 1] == "}" else expect(pos, ",")
+
+    pos = expect(0, "{")
+    while text[pos : pos + 1] != "}":
+        name, pos = decoder.raw_decode(text, pos)
+        pos = expect(pos, ":")
+        if name != field:
+            rest[name], pos = decoder.raw_decode(text, pos)
+        else:
+            pos = expect(pos, "{")
+            while text[pos : pos + 1] != "}":
+                key, pos = decoder.raw_decode(text, pos)
+                value, pos = decoder.raw_decode(text, expect(pos, ":"))
+                yield key, value
+                pos = next_member(pos)
+            pos += 1
+        pos = next_member(pos)
+
+
+CODEC_DEFAULT = Codec()
+
+
+@logging_function(logger)
+def detect_codec(*, content_type: str | None, binary: bytes) -> Codec:
+    if content_type is not None and content_type.startswith(CONTENT_TYPE_PREFIX):
+        params = dict(
+            x.strip().split("=", 1) for x in content_type.split(";")[1:] if "=" in x
+        )
+        return Codec(format=params["format"], compression=params["compression"])
+    # objects written before the codec existed, or without a content type
+    compression: CodecCompression = "zlib" if binary[:1] == b"\x78" else "none"
+    for magic, name in MAGIC_BYTES.items():
+        if binary.startswith(magic):
+            compression = name
+    raw_head = Codec(compression=compression).decompress(binary)[:1]
+    return Codec(
+        format="json" if raw_head in (b"{", b"[") else "msgpack",
+        compression=compression,
+    )
 
 
 class Author(BaseModel):
@@ -27,48 +311,614 @@ class Article(BaseModel):
     author: Author
 
 
+class ArticleIndex:
+    def __init__(self, urls: list[str] | None = None):
+        self.urls = [] if urls is None else sorted(urls)
+
+    def __contains__(self, url: str) -> bool:
+        i = bisect_left(self.urls, url)
+        return i < len(self.urls) and self.urls[i] == url
+
+    def __len__(self) -> int:
+        return len(self.urls)
+
+    def to_binary(self) -> bytes:
+        return gzip.compress("\n".join(self.urls).encode(), mtime=0)
+
+    @staticmethod
+    def from_binary(binary: bytes) -> ArticleIndex:
+        text = gzip.decompress(binary).decode()
+        index = ArticleIndex()
+        # written sorted, so the list is used as is
+        index.urls = text.split("\n") if text != "" else []
+        return index
+
+
+class RetiredObject(BaseModel):
+    key: str
+    retired_at: float
+
+
+class Manifest(BaseModel):
+    base: str | None = None
+    base_articles: str | None = None
+    base_index: str | None = None
+    segments: list[str] = []
+    retired: list[RetiredObject] = []
+
+
+class ResumePoint(BaseModel):
+    # an interrupted newest first scan continues at and below created_before,
+    # the cursors seen so far are adopted once the scan completes
+    created_before: str
+    sync_cursor: str | None = None
+    watermark: str | None = None
+
+
 class CachedData(BaseModel):
     articles: dict[str, Article]
     authors: dict[str, Author]
     thumbnails: dict[str, str]
     list_published: list[str]
+    sync_cursor: str | None = None
+    watermark: str | None = None
+    resume_point: ResumePoint | None = None
+    _manifest: Manifest | None = PrivateAttr(default=None)
+    _etag: str | None = PrivateAttr(default=None)
+    _persisted: dict[str, set[str]] = PrivateAttr(default_factory=dict)
+    _persisted_cursor: str | None = PrivateAttr(default=None)
+    _persisted_watermark: str | None = PrivateAttr(default=None)
+    _persisted_resume_point: ResumePoint | None = PrivateAttr(default=None)
+    _index: ArticleIndex = PrivateAttr(default_factory=ArticleIndex)
 
     @logging_function(logger)
     def to_json(self) -> str:
-        data = CachedData(
+        return self.to_sorted().model_dump_json()
+
+    @logging_function(logger)
+    def to_sorted(self) -> CachedData:
+        return CachedData(
             articles=self.articles,
             authors={k: self.authors[k] for k in sorted(self.authors.keys())},
             thumbnails={k: self.thumbnails[k] for k in sorted(self.thumbnails.keys())},
             list_published=sorted(self.list_published),
+            sync_cursor=self.sync_cursor,
+            watermark=self.watermark,
+            resume_point=self.resume_point,
+        )
+
+    @logging_function(logger)
+    def to_compressed_binary(self, codec: Codec = CODEC_DEFAULT) -> bytes:
+        return codec.encode(self.to_sorted())
+
+    @staticmethod
+    @logging_function(logger)
+    def from_compressed_binary(
+        binary: bytes, *, content_type: str | None = None
+    ) -> CachedData:
+        codec = detect_codec(content_type=content_type, binary=binary)
+        return codec.decode(binary, CachedData)
+
+    @staticmethod
+    def empty() -> CachedData:
+        return CachedData(articles={}, authors={}, thumbnails={}, list_published=[])
+
+    def has_article(self, url: str) -> bool:
+        return url in self.articles or url in self._index
+
+    def is_missing(self) -> bool:
+        """True when loaded from a bucket holding no manifest and no legacy blob"""
+        return (
+            self._manifest is not None
+            and self._etag is None
+            and self._manifest.base is None
+            and len(self._manifest.segments) == 0
         )
-        return data.model_dump_json()
 
     @logging_function(logger)
-    def to_compressed_binary(self) -> bytes:
-        text = self.to_json()
-        return compress(text.encode())
+    def apply(self, delta: CachedData):
+        self.articles.update(delta.articles)
+        self.authors.update(delta.authors)
+        self.thumbnails.update(delta.thumbnails)
+        self.list_published = sorted(
+            set(self.list_published) | set(delta.list_published)
+        )
+        if self.sync_cursor is None or (
+            delta.sync_cursor is not None and self.sync_cursor < delta.sync_cursor
+        ):
+            self.sync_cursor = delta.sync_cursor
+        if self.watermark is None or (
+            delta.watermark is not None and self.watermark < delta.watermark
+        ):
+            self.watermark = delta.watermark
+        # every delta carries the resume point as of its save, the latest wins
+        self.resume_point = delta.resume_point
+
+    def mark_persisted(self):
+        self._persisted = {
+            "articles": set(self.articles.keys()),
+            "authors": set(self.authors.keys()),
+            "thumbnails": set(self.thumbnails.keys()),
+            "list_published": set(self.list_published),
+        }
+        self._persisted_cursor = self.sync_cursor
+        self._persisted_watermark = self.watermark
+        self._persisted_resume_point = self.resume_point
+
+    @logging_function(logger)
+    def delta(self) -> CachedData | None:
+        persisted = self._persisted
+        data = CachedData(
+            articles={
+                k: v
+                for k, v in self.articles.items()
+                if k not in persisted.get("articles", set())
+            },
+            authors={
+                k: v
+                for k, v in self.authors.items()
+                if k not in persisted.get("authors", set())
+            },
+            thumbnails={
+                k: v
+                for k, v in self.thumbnails.items()
+                if k not in persisted.get("thumbnails", set())
+            },
+            list_published=[
+                x
+                for x in self.list_published
+                if x not in persisted.get("list_published", set())
+            ],
+            sync_cursor=self.sync_cursor,
+            watermark=self.watermark,
+            resume_point=self.resume_point,
+        )
+        if (
+            len(data.articles) == 0
+            and len(data.authors) == 0
+            and len(data.thumbnails) == 0
+            and len(data.list_published) == 0
+            and self.sync_cursor == self._persisted_cursor
+            and self.watermark == self._persisted_watermark
+            and self.resume_point == self._persisted_resume_point
+        ):
+            return None
+        return data
 
     @logging_function(logger)
-    def save(self, *, bucket: str, client: S3Client):
+    def save(self, *, bucket: str, client: S3Client, codec: Codec = CODEC_DEFAULT):
+        # only the changes since the last save are written, as an immutable
+        # segment that the manifest then references
+        delta = self.delta()
+        if delta is None:
+            return
+        time_start = perf_counter()
+        key = create_object_key(KEY_PREFIX_SEGMENT, codec=codec)
+        body = delta.to_compressed_binary(codec)
         client.put_object(
-            Bucket=bucket,
-            Key=KEY_CACHED_DATA,
-            Body=self.to_compressed_binary(),
-            ContentType="application/gzip",
+            Bucket=bucket, Key=key, Body=body, ContentType=codec.content_type
+        )
+        metrics.add("CachedDataSaveBytes", len(body), unit="Bytes")
+
+        def append_segment(manifest: Manifest) -> Manifest:
+            return manifest.model_copy(update={"segments": [*manifest.segments, key]})
+
+        self._manifest, self._etag = update_manifest(
+            bucket=bucket,
+            client=client,
+            manifest=self._manifest,
+            etag=self._etag,
+            change=append_segment,
+        )
+        self.mark_persisted()
+        metrics.observe("CachedDataSaveLatency", (perf_counter() - time_start) * 1000)
+
+    @logging_function(logger)
+    def compact(
+        self,
+        *,
+        bucket: str,
+        client: S3Client,
+        min_segments: int,
+        retention_seconds: float = 3600.0,
+        codec: Codec = CODEC_DEFAULT,
+    ) -> bool:
+        from botocore.exceptions import ClientError
+
+        manifest, etag = get_manifest(bucket=bucket, client=client)
+        if manifest is None:
+            return False
+        # a base without an index (the legacy blob) is always worth folding
+        if len(manifest.segments) < min_segments and (
+            manifest.base is None or manifest.base_index is not None
+        ):
+            return False
+        # fold exactly what the manifest references, not our in-memory state,
+        # the articles are streamed from each object into the new one and never
+        # held as models, newest object first so its copy of an article wins
+        sources = [
+            x
+            for x in [manifest.base_articles, manifest.base, *manifest.segments]
+            if x is not None
+        ]
+        metas: list[CachedData] = []
+        urls: set[str] = set()
+
+        def iter_articles() -> Iterator[tuple[str, Any]]:
+            for key in reversed(sources):
+                binary, content_type = read_object(
+                    bucket=bucket, key=key, client=client
+                )
+                source = detect_codec(content_type=content_type, binary=binary)
+                rest: dict[str, Any] = {}
+                for url, article in source.iter_entries(binary, "articles", rest):
+                    if url not in urls:
+                        urls.add(url)
+                        yield url, article
+                metas.append(CachedData.model_validate({**rest, "articles": {}}))
+
+        body_articles = codec.encode_entries(
+            CachedData.empty(), "articles", iter_articles()
+        )
+        # collected newest first, the cursors fold in the order they were saved
+        meta = CachedData.empty()
+        for x in reversed(metas):
+            meta.apply(x)
+        prefix = create_object_key(KEY_PREFIX_BASE)
+        keys = {
+            "base": f"{prefix}.meta.{codec.extension}",
+            "base_articles": f"{prefix}.articles.{codec.extension}",
+            "base_index": f"{prefix}.index.gzip",
+        }
+        for key, body, content_type in [
+            (keys["base"], meta.to_compressed_binary(codec), codec.content_type),
+            (keys["base_articles"], body_articles, codec.content_type),
+            (
+                keys["base_index"],
+                ArticleIndex(list(urls)).to_binary(),
+                CONTENT_TYPE_LEGACY,
+            ),
+        ]:
+            client.put_object(
+                Bucket=bucket, Key=key, Body=body, ContentType=content_type
+            )
+        now = time()
+        # the legacy blob is left as it is, a release rolled back to before the
+        # manifest still finds its cache there
+        folded = [
+            x
+            for x in [
+                manifest.base,
+                manifest.base_articles,
+                manifest.base_index,
+                *manifest.segments,
+            ]
+            if x is not None and x != KEY_CACHED_DATA
+        ]
+        expired = [
+            x for x in manifest.retired if now - x.retired_at >= retention_seconds
+        ]
+        compacted = Manifest(
+            **keys,
+            segments=[],
+            retired=[
+                *[x for x in manifest.retired if x not in expired],
+                *[RetiredObject(key=x, retired_at=now) for x in folded],
+            ],
         )
+        try:
+            etag_compacted = put_manifest(
+                bucket=bucket, client=client, manifest=compacted, etag=etag
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in CONDITIONAL_WRITE_ERROR_CODES:
+                raise
+            # a run appended a segment meanwhile, the next compaction folds it
+            for key in keys.values():
+                client.delete_object(Bucket=bucket, Key=key)
+            return False
+        # nothing else was appended since our last save, so the compacted
+        # manifest holds exactly our persisted state and a warm start can
+        # revalidate against it
+        if etag == self._etag:
+            self._manifest = compacted
+            self._etag = etag_compacted
+        # retired objects are kept for a while, a reader may still hold the
+        # previous manifest
+        for x in expired:
+            client.delete_object(Bucket=bucket, Key=x.key)
+        return True
 
     @staticmethod
     @logging_function(logger)
-    def load(*, bucket: str, client: S3Client) -> CachedData:
+    def load(
+        *,
+        bucket: str,
+        client: S3Client,
+        warm: bool = False,
+        spill_dir: str | None = None,
+    ) -> CachedData:
+        if not warm:
+            return load_cold(bucket=bucket, client=client)
+        data = load_warm(bucket=bucket, client=client, spill_dir=spill_dir)
+        _warm_cache[bucket] = data
+        return data
+
+
+class Spill(BaseModel):
+    etag: str
+    manifest: Manifest
+    data: CachedData
+    index: list[str]
+
+
+@logging_function(logger)
+def load_cold(*, bucket: str, client: S3Client) -> CachedData:
+    manifest, etag = get_manifest(bucket=bucket, client=client)
+    if manifest is None:
+        # before the first segmented save only the legacy blob exists
+        manifest = Manifest(
+            base=KEY_CACHED_DATA
+            if exists_object(bucket=bucket, key=KEY_CACHED_DATA, client=client)
+            else None
+        )
+    data = load_from_manifest(
+        bucket=bucket, client=client, manifest=manifest, with_articles=False
+    )
+    if manifest.base_index is not None:
+        resp = client.get_object(Bucket=bucket, Key=manifest.base_index)
+        binary = resp["Body"].read()
+        metrics.add("CachedDataLoadBytes", len(binary), unit="Bytes")
+        data._index = ArticleIndex.from_binary(binary)
+    data._manifest = manifest
+    data._etag = etag
+    data.mark_persisted()
+    return data
+
+
+@logging_function(logger)
+def load_warm(*, bucket: str, client: S3Client, spill_dir: str | None) -> CachedData:
+    data = _warm_cache.get(bucket)
+    if data is None and spill_dir is not None:
+        data = read_spill(bucket=bucket, spill_dir=spill_dir)
+    # unsaved changes of a failed run are not what S3 holds, start over
+    if data is not None and data._etag is not None and data.delta() is None:
+        revalidated = revalidate_manifest(bucket=bucket, client=client, etag=data._etag)
+        if revalidated is None:
+            logger.debug("cached data is not modified", data={"ETag": data._etag})
+            return data
+        manifest, etag = revalidated
+        if manifest is not None and is_fast_forward(
+            current=data._manifest, changed=manifest
+        ):
+            # other runs only appended segments, fetch just those
+            for key in manifest.segments[len(data._manifest.segments) :]:
+                data.apply(load_object(bucket=bucket, key=key, client=client))
+            data._manifest = manifest
+            data._etag = etag
+            data.mark_persisted()
+            if spill_dir is not None:
+                write_spill(bucket=bucket, spill_dir=spill_dir, data=data)
+            return data
+    data = load_cold(bucket=bucket, client=client)
+    if spill_dir is not None and data._etag is not None:
+        write_spill(bucket=bucket, spill_dir=spill_dir, data=data)
+    return data
+
+
+def is_fast_forward(*, current: Manifest | None, changed: Manifest) -> bool:
+    if current is None:
+        return False
+    return (
+        current.base == changed.base
+        and current.base_articles == changed.base_articles
+        and current.base_index == changed.base_index
+        and changed.segments[: len(current.segments)] == current.segments
+    )
+
+
+@logging_function(logger)
+def read_spill(*, bucket: str, spill_dir: str) -> CachedData | None:
+    path = Path(spill_dir) / create_spill_name(bucket)
+    try:
+        spill = Spill.model_validate_json(path.read_bytes())
+    except FileNotFoundError:
+        return None
+    except ValueError as e:
+        logger.warning(f"spilled cached data is broken: {e}", data={"Path": path})
+        return None
+    data = spill.data
+    data._manifest = spill.manifest
+    data._etag = spill.etag
+    data._index = ArticleIndex(spill.index)
+    data.mark_persisted()
+    return data
+
+
+@logging_function(logger)
+def write_spill(*, bucket: str, spill_dir: str, data: CachedData):
+    spill = Spill(
+        etag=data._etag,
+        manifest=data._manifest,
+        data=data,
+        index=data._index.urls,
+    )
+    path = Path(spill_dir) / create_spill_name(bucket)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # written aside and renamed, a killed run never leaves half a file
+        temp = path.with_suffix(f".{uuid4().hex}.tmp")
+        temp.write_text(spill.model_dump_json())
+        temp.replace(path)
+    except OSError as e:
+        logger.warning(f"failed to spill cached data: {e}", data={"Path": path})
+
+
+def create_spill_name(bucket: str) -> str:
+    return f"cached_data.{sha1(bucket.encode()).hexdigest()}.json"
+
+
+@logging_function(logger)
+def create_object_key(prefix: str, *, codec: Codec | None = None) -> str:
+    key = f"{prefix}{int(time() * 1000):013}-{uuid4().hex}"
+    return key if codec is None else f"{key}.{codec.extension}"
+
+
+@logging_function(logger)
+def exists_object(*, bucket: str, key: str, client: S3Client) -> bool:
+    from botocore.exceptions import ClientError
+
+    try:
+        client.head_object(Bucket=bucket, Key=key)
+        return True
+    except ClientError as e:
+        if e.response["Error"]["Code"] in {"404", "NoSuchKey", "NotFound"}:
+            return False
+        raise
+
+
+@logging_function(logger)
+def load_from_manifest(
+    *, bucket: str, client: S3Client, manifest: Manifest, with_articles: bool = True
+) -> CachedData:
+    # the articles of a base carry no cursors, applied first they cannot
+    # reset the ones of the base meta
+    keys = [
+        manifest.base_articles if with_articles else None,
+        manifest.base,
+        *manifest.segments,
+    ]
+    data = CachedData.empty()
+    for key in [x for x in keys if x is not None]:
+        data.apply(load_object(bucket=bucket, key=key, client=client))
+    return data
+
+
+@logging_function(logger)
+def load_object(*, bucket: str, key: str, client: S3Client) -> CachedData:
+    binary, content_type = read_object(bucket=bucket, key=key, client=client)
+    return CachedData.from_compressed_binary(binary, content_type=content_type)
+
+
+@logging_function(logger)
+def read_object(*, bucket: str, key: str, client: S3Client) -> tuple[bytes, str | None]:
+    resp = client.get_object(Bucket=bucket, Key=key)
+    binary = resp["Body"].read()
+    metrics.add("CachedDataLoadBytes", len(binary), unit="Bytes")
+    return binary, resp.get("ContentType")
+
+
+@logging_function(logger)
+def get_manifest(
+    *, bucket: str, client: S3Client
+) -> tuple[Manifest | None, str | None]:
+    try:
+        resp = client.get_object(Bucket=bucket, Key=KEY_MANIFEST)
+    except client.exceptions.NoSuchKey:
+        return None, None
+    return Manifest(**json.loads(resp["Body"].read())), resp["ETag"]
+
+
+@logging_function(logger)
+def revalidate_manifest(
+    *, bucket: str, client: S3Client, etag: str
+) -> tuple[Manifest | None, str | None] | None:
+    """returns None while the manifest still has the given etag"""
+    from botocore.exceptions import ClientError
+
+    try:
+        resp = client.get_object(Bucket=bucket, Key=KEY_MANIFEST, IfNoneMatch=etag)
+    except client.exceptions.NoSuchKey:
+        return None, None
+    except ClientError as e:
+        if e.response["Error"]["Code"] in {"304", "NotModified"}:
+            return None
+        raise
+    return Manifest(**json.loads(resp["Body"].read())), resp["ETag"]
+
+
+@logging_function(logger)
+def put_manifest(
+    *, bucket: str, client: S3Client, manifest: Manifest, etag: str | None
+) -> str:
+    condition = {"IfNoneMatch": "*"} if etag is None else {"IfMatch": etag}
+    resp = client.put_object(
+        Bucket=bucket,
+        Key=KEY_MANIFEST,
+        Body=manifest.model_dump_json().encode(),
+        ContentType="application/json",
+        **condition,
+    )
+    return resp["ETag"]
+
+
+@logging_function(logger)
+def update_manifest(
+    *,
+    bucket: str,
+    client: S3Client,
+    manifest: Manifest | None,
+    etag: str | None,
+    change: Callable[[Manifest], Manifest],
+    max_attempts: int = 5,
+) -> tuple[Manifest, str]:
+    from botocore.exceptions import ClientError
+
+    current = Manifest() if manifest is None else manifest
+    attempt = 0
+    while True:
+        attempt += 1
+        changed = change(current)
         try:
-            resp = client.get_object(Bucket=bucket, Key=KEY_CACHED_DATA)
-            binary = resp["Body"].read()
-            decompressed = decompress(binary)
-            return CachedData(**json.loads(decompressed))
-        except client.exceptions.NoSuchKey:
-            return CachedData(
-                articles={},
-                authors={},
-                thumbnails={},
-                list_published=[],
+            etag = put_manifest(
+                bucket=bucket, client=client, manifest=changed, etag=etag
+            )
+            return changed, etag
+        except ClientError as e:
+            code = e.response["Error"]["Code"]
+            if code not in CONDITIONAL_WRITE_ERROR_CODES or attempt == max_attempts:
+                raise
+            # another run updated the manifest since we read it, reapply our
+            # change on top of its version and retry against the new ETag
+            logger.warning(
+                "manifest changed underneath, retry on the latest version",
+                data={"Attempt": attempt, "ErrorCode": code},
             )
+            latest, etag = get_manifest(bucket=bucket, client=client)
+            current = Manifest() if latest is None else latest
+
+
+class Checkpointer:
+    def __init__(
+        self,
+        *,
+        cached_data: CachedData,
+        bucket: str,
+        client: S3Client,
+        every_inserts: int,
+        every_seconds: float,
+        codec: Codec = CODEC_DEFAULT,
+    ):
+        self.cached_data = cached_data
+        self.codec = codec
+        self.bucket = bucket
+        self.client = client
+        self.every_inserts = every_inserts
+        self.every_seconds = every_seconds
+        self.saved_count = 0
+        self._pending = 0
+        self._saved_at = monotonic()
+
+    def record(self, count: int = 1):
+        self._pending += count
+        if (
+            self._pending >= self.every_inserts
+            or monotonic() - self._saved_at >= self.every_seconds
+        ):
+            self.flush()
+
+    def flush(self):
+        self.cached_data.save(bucket=self.bucket, client=self.client, codec=self.codec)
+        self.saved_count += 1
+        self._pending = 0
+        self._saved_at = monotonic()
@@ -72,6 +72,27 @@ resource "aws_iam_policy" "event_bridge_invoke_api_destination" {
   policy = data.aws_iam_policy_document.policy_event_bridge_invoke_api_destination.json
 }
 
+# ================================================================
+# Policy Lambda Invoke Inserter
+# ================================================================
+
+data "aws_iam_policy_document" "policy_lambda_invoke_inserter" {
+  policy_id = "policy_lambda_invoke_inserter"
+  statement {
+    sid     = "PolicyLambdaInvokeInserter"
+    effect  = local.iam.effect.allow
+    actions = ["lambda:InvokeFunction"]
+    resources = [
+      module.lambda_inserter.function_arn,
+      "${module.lambda_inserter.function_arn}:*",
+    ]
+  }
+}
+
+resource "aws_iam_policy" "lambda_invoke_inserter" {
+  policy = data.aws_iam_policy_document.policy_lambda_invoke_inserter.json
+}
+
 # ================================================================
 # Policy KMS Decrypt
 # ================================================================
@@ -122,6 +143,7 @@ resource "aws_iam_role_policy_attachment" "lambda_inserter" {
     c = "arn:aws:iam::aws:policy/AmazonS3FullAccess"
     d = "arn:aws:iam::aws:policy/AmazonSSMReadOnlyAccess"
     e = "arn:aws:iam::aws:policy/AmazonSNSFullAccess"
+    f = aws_iam_policy.lambda_invoke_inserter.arn
   }
   policy_arn = each.value
   role       = aws_iam_role.lambda_inserter.name
@@ -34,8 +34,10 @@ module "lambda_error_processor" {
   layers     = [data.aws_ssm_parameter.layer_arn_base.value]
 
   environment_variables = {
-    SYSTEM_NAME    = var.system_name
-    EVENT_BUS_NAME = aws_cloudwatch_event_bus.slack_error_notifier.name
+    SYSTEM_NAME                        = var.system_name
+    EVENT_BUS_NAME                     = aws_cloudwatch_event_bus.slack_error_notifier.name
+    LOGGING_HANDLER_EVENT_SAMPLE_EVERY = 10
+    METRICS_NAMESPACE                  = var.system_name
   }
 
   s3_bucket_deploy_package = aws_s3_object.lambda_deploy_package.bucket
@@ -66,12 +68,19 @@ module "lambda_inserter" {
   memory_size = 256
   timeout     = 900
 
+  # one run at a time, a self-invoked run and the next scheduled one would
+  # insert the same backlog, an invocation throttled meanwhile is retried
+  reserved_concurrent_executions = 1
+
   environment_variables = {
     SSM_PARAMETER_NAME_TOKEN_CONTENTFUL   = aws_ssm_parameter.contentful_token.name
     SSM_PARAMETER_NAME_NOTION_DATABASE_ID = aws_ssm_parameter.notion_database_id.name
     SSM_PARAMETER_NAME_NOTION_TOKEN       = aws_ssm_parameter.notion_token.name
     BUCKET_NAME_DATA                      = var.s3_bucket_data
     SNS_TOPIC_ARN                         = aws_sns_topic.notification_insert.arn
+    CACHED_DATA_SPILL_DIR                 = "/tmp/cached_data"
+    METRICS_NAMESPACE                     = var.system_name
+    SELF_INVOKE                           = true
   }
 
   s3_bucket_deploy_package = aws_s3_object.lambda_deploy_package.bucket
@@ -0,0 +1,86 @@
+import gc
+import os
+import sys
+import tracemalloc
+from time import perf_counter
+
+from fakes.s3 import FakeS3Client
+
+import utils.models.models as models
+from benchmark.synthetic import create_synthetic_cached_data
+from utils.models import CachedData
+
+SIZES = [1_000, 10_000, 50_000, 100_000]
+BUCKET = "benchmark"
+# the inserter runs with 256 MB, a peak near it leaves no room for the rest
+MEMORY_LIMIT_MB = 256
+
+
+def measure(func):
+    gc.collect()
+    tracemalloc.start()
+    start = perf_counter()
+    result = func()
+    seconds = perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def stored_bytes(client: FakeS3Client) -> int:
+    return sum(len(x.body) for x in client.objects.values())
+
+
+def main(sizes: list[int]):
+    # the debug records of load, save and compact are not what this measures
+    for handler in models.logger.handlers:
+        handler.setStream(open(os.devnull, "w"))
+    # size_kb is the output of to_json and to_compressed_binary, and what the
+    # bucket holds after save and compact
+    print("articles\toperation\tseconds\tpeak_mb\tsize_kb\tover_limit")
+    for size in sizes:
+        synthetic = create_synthetic_cached_data(size=size)
+        client = FakeS3Client()
+        data = CachedData.load(bucket=BUCKET, client=client)
+        data.apply(synthetic)
+        del synthetic
+
+        def save():
+            data.save(bucket=BUCKET, client=client)
+            return stored_bytes(client)
+
+        def compact():
+            data.compact(
+                bucket=BUCKET, client=client, min_segments=1, retention_seconds=0
+            )
+            return stored_bytes(client)
+
+        # each load starts cold, the warm cache would skip the work measured
+        operations = [
+            ("to_json", lambda: len(data.to_json().encode())),
+            ("to_compressed_binary", lambda: len(data.to_compressed_binary())),
+            ("save", save),
+            ("load_segments", lambda: CachedData.load(bucket=BUCKET, client=client)),
+            ("compact", compact),
+            ("load_compacted", lambda: CachedData.load(bucket=BUCKET, client=client)),
+        ]
+        for name, func in operations:
+            result, seconds, peak = measure(func)
+            peak_mb = peak / 1024 / 1024
+            print(
+                "\t".join(
+                    [
+                        str(size),
+                        name,
+                        f"{seconds:.3f}",
+                        f"{peak_mb:.1f}",
+                        f"{result / 1024:.1f}" if isinstance(result, int) else "",
+                        "yes" if peak_mb > MEMORY_LIMIT_MB else "",
+                    ]
+                )
+            )
+            del result
+
+
+if __name__ == "__main__":
+    main([int(x) for x in sys.argv[1:]] or SIZES)
@@ -0,0 +1,73 @@
+import sys
+import tracemalloc
+from time import perf_counter
+
+from benchmark.synthetic import create_synthetic_cached_data
+from utils.models import CachedData, Codec
+
+SIZES = [1_000, 10_000, 100_000]
+CODECS = [
+    "json+gzip:9",
+    "json+gzip:6",
+    "json+gzip:1",
+    "json+zlib:1",
+    "json+lzma:0",
+    "json+zstd:3",
+    "msgpack+gzip:1",
+    "msgpack+zstd:3",
+    "msgpack+none",
+]
+
+
+def measure(func):
+    tracemalloc.start()
+    start = perf_counter()
+    result = func()
+    seconds = perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def available_codecs() -> list[Codec]:
+    result = []
+    for text in CODECS:
+        try:
+            result.append(Codec.parse(text))
+        except ValueError as e:
+            print(f"skip {text}: {e}", file=sys.stderr)
+    return result
+
+
+def main(sizes: list[int]):
+    print(
+        "articles\tcodec\tencode_s\tdecode_s\tencode_peak_mb\tdecode_peak_mb\tsize_kb"
+    )
+    for size in sizes:
+        data = create_synthetic_cached_data(size=size)
+        for codec in available_codecs():
+            binary, encode_seconds, encode_peak = measure(
+                lambda: data.to_compressed_binary(codec)
+            )
+            _, decode_seconds, decode_peak = measure(
+                lambda: CachedData.from_compressed_binary(
+                    binary, content_type=codec.content_type
+                )
+            )
+            print(
+                "\t".join(
+                    [
+                        str(size),
+                        f"{codec.format}+{codec.compression}:{codec.level}",
+                        f"{encode_seconds:.3f}",
+                        f"{decode_seconds:.3f}",
+                        f"{encode_peak / 1024 / 1024:.1f}",
+                        f"{decode_peak / 1024 / 1024:.1f}",
+                        f"{len(binary) / 1024:.1f}",
+                    ]
+                )
+            )
+
+
+if __name__ == "__main__":
+    main([int(x) for x in sys.argv[1:]] or SIZES)
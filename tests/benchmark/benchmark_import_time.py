@@ -0,0 +1,95 @@
+import os
+import subprocess
+import sys
+from argparse import ArgumentParser
+from dataclasses import dataclass
+from pathlib import Path
+
+# milliseconds, the cumulative import time of each handler module
+BUDGETS = {
+    "handlers.inserter.inserter": 450,
+    "handlers.error_processor.error_processor": 250,
+}
+REPEAT = 5
+TOP = 15
+
+
+@dataclass(frozen=True)
+class ImportTime:
+    module: str
+    depth: int
+    self_us: int
+    cumulative_us: int
+
+
+def parse_import_time(stderr: str) -> list[ImportTime]:
+    result = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line.removeprefix("import time:").split("|")
+        result.append(
+            ImportTime(
+                module=name.strip(),
+                depth=(len(name) - len(name.lstrip()) - 1) // 2,
+                self_us=int(self_us),
+                cumulative_us=int(cumulative_us),
+            )
+        )
+    return result
+
+
+def measure(module: str) -> list[ImportTime]:
+    src = Path(__file__).resolve().parents[2] / "src"
+    resp = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env={
+            **os.environ,
+            "PYTHONPATH": str(src),
+            "AWS_DEFAULT_REGION": os.getenv("AWS_DEFAULT_REGION", "ap-northeast-1"),
+        },
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return parse_import_time(resp.stderr)
+
+
+def main(modules: list[str], *, budget_ms: float | None, repeat: int) -> int:
+    exceeded = []
+    for module in modules:
+        # the fastest run is the least disturbed by the page cache and noise
+        times = min(
+            (measure(module) for _ in range(repeat)),
+            key=lambda x: x[-1].cumulative_us,
+        )
+        total_ms = times[-1].cumulative_us / 1000
+        budget = BUDGETS.get(module) if budget_ms is None else budget_ms
+        print(f"# {module}: {total_ms:.1f} ms (budget {budget} ms)")
+        print("module\tdepth\tself_ms\tcumulative_ms")
+        for x in sorted(times, key=lambda x: x.cumulative_us, reverse=True)[:TOP]:
+            print(
+                "\t".join(
+                    [
+                        x.module,
+                        str(x.depth),
+                        f"{x.self_us / 1000:.1f}",
+                        f"{x.cumulative_us / 1000:.1f}",
+                    ]
+                )
+            )
+        print()
+        if budget is not None and total_ms > budget:
+            exceeded.append(module)
+    for module in exceeded:
+        print(f"import budget exceeded: {module}", file=sys.stderr)
+    return 1 if len(exceeded) > 0 else 0
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("modules", nargs="*", default=list(BUDGETS.keys()))
+    parser.add_argument("--budget-ms", type=float, default=None)
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    args = parser.parse_args()
+    sys.exit(main(args.modules, budget_ms=args.budget_ms, repeat=args.repeat))
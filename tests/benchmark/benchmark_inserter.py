@@ -0,0 +1,186 @@
+import json
+import os
+import resource
+import subprocess
+import sys
+from argparse import SUPPRESS, ArgumentParser
+from pathlib import Path
+from time import perf_counter
+from urllib.request import Request, urlopen
+
+from fakes.http_stub import Fixtures, StubServer, create_synthetic_fixtures
+from fakes.s3 import FakeS3Client
+from fakes.sns import FakeSnsClient
+from fakes.ssm import FakeSsmClient
+
+SIZES = [100, 1_000, 10_000]
+PARAMETERS = {
+    "token-contentful": "token",
+    "notion-database-id": "database",
+    "notion-token": "token",
+}
+ENVIRONMENTS = {
+    "SSM_PARAMETER_NAME_TOKEN_CONTENTFUL": "token-contentful",
+    "SSM_PARAMETER_NAME_NOTION_DATABASE_ID": "notion-database-id",
+    "SSM_PARAMETER_NAME_NOTION_TOKEN": "notion-token",
+    "BUCKET_NAME_DATA": "benchmark",
+    "SNS_TOPIC_ARN": "topic",
+}
+COLUMNS = [
+    "articles",
+    "phase",
+    "seconds",
+    "inserted",
+    "requests_contentful",
+    "requests_notion",
+    "throttled",
+    "peak_rss_mb",
+]
+
+
+def record(path: str, *, token: str, pages: int):
+    # the listing is saved with its includes, so a replay needs no other call
+    from handlers.inserter.inserter import LIMIT_LISTING, create_listing_url
+
+    fixtures = Fixtures()
+    authors, assets = {}, {}
+    for page in range(pages):
+        url = create_listing_url(
+            limit=LIMIT_LISTING,
+            skip=page * LIMIT_LISTING,
+            sync_cursor=None,
+            newest_first=True,
+        )
+        req = Request(url=url, headers={"Authorization": f"Bearer {token}"})
+        with urlopen(req) as resp:
+            data = json.loads(resp.read())
+        fixtures.items.extend(data["items"])
+        includes = data.get("includes", {})
+        authors.update({x["sys"]["id"]: x for x in includes.get("Entry", [])})
+        assets.update({x["sys"]["id"]: x for x in includes.get("Asset", [])})
+        if (page + 1) * LIMIT_LISTING >= data["total"]:
+            break
+    fixtures.authors = list(authors.values())
+    fixtures.assets = list(assets.values())
+    fixtures.save(path)
+    print(f"recorded {len(fixtures.items)} items to {path}", file=sys.stderr)
+
+
+def run_child(size: int, *, fixtures_path: str | None, latency: float, throttle: int):
+    # handler logs go to stdout, the result is written to the saved descriptor
+    output = os.fdopen(os.dup(1), "w")
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    os.environ.update(ENVIRONMENTS)
+
+    import handlers.inserter.inserter as index
+    from utils.http import limiter_contentful, limiter_notion, retry_budget
+
+    if fixtures_path is None:
+        fixtures = create_synthetic_fixtures(size=size)
+    else:
+        fixtures = Fixtures.load(fixtures_path)
+        fixtures.items = fixtures.items[:size]
+    # the code path is measured, not the API limits
+    limiter_contentful.rate = limiter_notion.rate = 10_000.0
+    limiter_contentful.burst = limiter_notion.burst = 100
+    retry_budget.reset(max_retries=size)
+
+    client_s3 = FakeS3Client()
+    rows = []
+    with StubServer(fixtures, latency=latency, throttle_every=throttle) as stub:
+        index.URL_CONTENTFUL_SPACE = stub.url_contentful
+        index.URL_NOTION_API = stub.url_notion
+        for phase in ["initial", "rerun"]:
+            stub.counts.clear()
+            pages_before = len(stub.notion.pages)
+            start = perf_counter()
+            index.main(
+                client_ssm=FakeSsmClient(PARAMETERS),
+                client_s3=client_s3,
+                client_sns=FakeSnsClient(),
+            )
+            seconds = perf_counter() - start
+            rows.append(
+                {
+                    "articles": len(fixtures.items),
+                    "phase": phase,
+                    "seconds": round(seconds, 3),
+                    "inserted": len(stub.notion.pages) - pages_before,
+                    "requests_contentful": stub.counts["contentful"],
+                    "requests_notion": stub.counts["notion"],
+                    "throttled": stub.counts["throttled"],
+                    # ru_maxrss is in KiB on Linux
+                    "peak_rss_mb": round(
+                        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+                    ),
+                }
+            )
+    output.write(json.dumps(rows) + "\n")
+    output.flush()
+
+
+def main(sizes: list[int], *, fixtures_path: str | None, latency: float, throttle: int):
+    # one process per size, the peak RSS of a run is not hidden by a bigger one
+    root = Path(__file__).resolve().parents[2]
+    print("\t".join(COLUMNS))
+    for size in sizes:
+        command = [
+            sys.executable,
+            __file__,
+            str(size),
+            "--child",
+            f"--latency={latency}",
+            f"--throttle-every={throttle}",
+        ]
+        if fixtures_path is not None:
+            command.append(f"--fixtures={fixtures_path}")
+        resp = subprocess.run(
+            command,
+            env={
+                **os.environ,
+                "PYTHONPATH": f"{root / 'src'}:{root / 'tests'}",
+                "AWS_DEFAULT_REGION": os.getenv("AWS_DEFAULT_REGION", "ap-northeast-1"),
+            },
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        for row in json.loads(resp.stdout.splitlines()[-1]):
+            print("\t".join(str(row[x]) for x in COLUMNS))
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        description="run inserter.main end to end against a local API stub"
+    )
+    parser.add_argument("sizes", nargs="*", type=int, default=SIZES)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds")
+    parser.add_argument(
+        "--throttle-every", type=int, default=0, help="answer every n-th with 429"
+    )
+    parser.add_argument("--fixtures", help="replay fixtures recorded by --record")
+    parser.add_argument(
+        "--record", help="record the listing with CONTENTFUL_TOKEN to this path"
+    )
+    parser.add_argument("--record-pages", type=int, default=10)
+    parser.add_argument("--child", action="store_true", help=SUPPRESS)
+    args = parser.parse_args()
+    if args.record is not None:
+        record(
+            args.record, token=os.environ["CONTENTFUL_TOKEN"], pages=args.record_pages
+        )
+    elif args.child:
+        run_child(
+            args.sizes[0],
+            fixtures_path=args.fixtures,
+            latency=args.latency,
+            throttle=args.throttle_every,
+        )
+    else:
+        main(
+            args.sizes,
+            fixtures_path=args.fixtures,
+            latency=args.latency,
+            throttle=args.throttle_every,
+        )
@@ -0,0 +1,65 @@
+import json
+import sys
+from base64 import b64encode
+from dataclasses import asdict, is_dataclass
+from gzip import compress
+from time import perf_counter
+
+from pydantic import BaseModel
+
+from benchmark.synthetic import create_synthetic_cached_data
+from utils.logger.create_logger import serialize_record
+
+SIZES = [1_000, 10_000]
+REPEAT = 3
+
+
+def legacy_default(obj):
+    # the serializer before budgets, kept here as the baseline
+    if isinstance(obj, tuple):
+        return list(obj)
+    if isinstance(obj, bytes):
+        encoded = b64encode(compress(obj, compresslevel=7)).decode()
+        return {"type": "bytes (base64 encoded, gzip compressed)", "value": encoded}
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    if is_dataclass(obj) and not isinstance(obj, type):
+        return asdict(obj)
+    return {"type": str(type(obj)), "value": str(obj)}
+
+
+def legacy_serialize(log: dict) -> str:
+    return json.dumps(
+        log, default=legacy_default, separators=(",", ":"), ensure_ascii=False
+    )
+
+
+def measure(func, log: dict) -> tuple[float, int]:
+    seconds = []
+    for _ in range(REPEAT):
+        start = perf_counter()
+        text = func(log)
+        seconds.append(perf_counter() - start)
+    return min(seconds), len(text.encode())
+
+
+def main(sizes: list[int]):
+    print("payload\tserializer\tseconds\tbytes")
+    for size in sizes:
+        payloads = {
+            f"cached_data_{size}": create_synthetic_cached_data(size=size),
+            f"bytes_{size}kb": bytes(range(256)) * 4 * size,
+            f"list_{size}": [{"i": i, "s": "x" * 100} for i in range(size)],
+        }
+        for name, payload in payloads.items():
+            log = {"message": "failed function", "data": {"Args": (payload,)}}
+            for serializer, func in [
+                ("legacy", legacy_serialize),
+                ("bounded", serialize_record),
+            ]:
+                seconds, length = measure(func, log)
+                print(f"{name}\t{serializer}\t{seconds:.4f}\t{length}")
+
+
+if __name__ == "__main__":
+    main([int(x) for x in sys.argv[1:]] or SIZES)
@@ -0,0 +1,40 @@
+import sys
+from timeit import repeat
+
+from utils.logger import create_logger, logging_function
+
+NUMBER = 100_000
+REPEAT = 5
+
+logger = create_logger(__name__)
+
+
+def add(a: int, b: int) -> int:
+    return a + b
+
+
+VARIANTS = {
+    "undecorated": add,
+    "fast_path": logging_function(logger, sample_rate=0.0)(add),
+    "sampled_1pct": logging_function(logger, sample_rate=0.01)(add),
+    "write": logging_function(logger, write=True)(add),
+}
+
+
+def main(number: int):
+    # records are formatted but not written, the cost of the handler output
+    # is not what this measures
+    for handler in logger.handlers:
+        handler.setStream(open("/dev/null", "w"))
+    print("variant\tns_per_call\toverhead_ns")
+    baseline = None
+    for name, func in VARIANTS.items():
+        n = number if name != "write" else max(1, number // 100)
+        seconds = min(repeat(lambda: func(1, 2), number=n, repeat=REPEAT))
+        per_call = seconds / n * 1e9
+        baseline = per_call if baseline is None else baseline
+        print(f"{name}\t{per_call:.0f}\t{per_call - baseline:.0f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else NUMBER)
@@ -0,0 +1,34 @@
+from utils.models import Article, Author, CachedData
+
+
+def create_synthetic_cached_data(*, size: int, authors: int = 500) -> CachedData:
+    list_authors = {
+        f"author-{i}": Author(
+            url=f"https://dev.classmethod.jp/author/author-{i}/",
+            name=f"Author {i}",
+            avatar=f"https://images.ctfassets.net/avatar/{i:08}.png",
+        )
+        for i in range(authors)
+    }
+    articles = {}
+    thumbnails = {}
+    for i in range(size):
+        author = list_authors[f"author-{i % authors}"]
+        url = f"https://dev.classmethod.jp/articles/synthetic-article-{i:07}/"
+        thumbnail = f"//images.ctfassets.net/ct0aopd36mqt/{i:012}/thumbnail.png"
+        thumbnails[f"asset-{i:012}"] = thumbnail
+        articles[url] = Article(
+            url=url,
+            thumbnail=thumbnail,
+            title=f"Synthetic article number {i} about re:Invent 2024",
+            date=f"2024.12.{i % 28 + 1:02}",
+            raw_date=f"2024-12-{i % 28 + 1:02} 09:{i % 60:02}:00.000000+09:00",
+            author=author,
+        )
+    return CachedData(
+        articles=articles,
+        authors=list_authors,
+        thumbnails=thumbnails,
+        list_published=[],
+        sync_cursor="2024-12-31T00:00:00.000Z",
+    )
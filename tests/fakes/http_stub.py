@@ -0,0 +1,246 @@
+import json
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from threading import Lock, Thread
+from time import sleep
+from urllib.parse import parse_qsl, urlsplit
+from urllib.request import Request
+
+from fakes.notion import FakeNotion
+
+PREFIX_CONTENTFUL = "/spaces/stub/environments/master"
+PREFIX_NOTION = "/v1"
+
+
+@dataclass
+class Fixtures:
+    """Contentful records as the API returns them, recorded or synthetic"""
+
+    items: list[dict] = field(default_factory=list)
+    authors: list[dict] = field(default_factory=list)
+    assets: list[dict] = field(default_factory=list)
+
+    def save(self, path: str):
+        Path(path).write_text(json.dumps(asdict(self)))
+
+    @staticmethod
+    def load(path: str) -> "Fixtures":
+        return Fixtures(**json.loads(Path(path).read_text()))
+
+
+def create_synthetic_fixtures(*, size: int, authors: int = 50) -> Fixtures:
+    start = datetime(2024, 12, 31, tzinfo=timezone.utc)
+    fixtures = Fixtures(
+        authors=[
+            {
+                "sys": {"id": f"author-{i}"},
+                "fields": {
+                    "slug": {"en-US": f"author-{i}"},
+                    "displayName": {"en-US": f"Author {i}"},
+                    "thumbnail": {"en-US": f"https://images.example.com/a/{i}.png"},
+                },
+            }
+            for i in range(authors)
+        ]
+    )
+    for i in range(size):
+        created_at = (start - timedelta(hours=i)).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+        fixtures.assets.append(
+            {
+                "sys": {"id": f"asset-{i}"},
+                "fields": {"file": {"en-US": {"url": f"//images.example.com/{i}.png"}}},
+            }
+        )
+        fixtures.items.append(
+            {
+                "sys": {
+                    "id": f"entry-{i}",
+                    "createdAt": created_at,
+                    "updatedAt": created_at,
+                },
+                "fields": {
+                    "slug": {"en-US": f"synthetic-{i:07}"},
+                    "title": {"en-US": f"Synthetic article {i}"},
+                    "thumbnail": {"en-US": {"sys": {"id": f"asset-{i}"}}},
+                    "author": {"en-US": {"sys": {"id": f"author-{i % authors}"}}},
+                },
+            }
+        )
+    return fixtures
+
+
+class StubServer:
+    """
+    serves the Contentful listing, asset and entry endpoints and the Notion
+    pages and query endpoints on localhost, every throttle_every-th request
+    of an API is answered with a 429
+    """
+
+    def __init__(
+        self,
+        fixtures: Fixtures,
+        *,
+        latency: float = 0.0,
+        throttle_every: int = 0,
+        retry_after: float = 0.1,
+        with_includes: bool = True,
+    ):
+        self.fixtures = fixtures
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.with_includes = with_includes
+        self.notion = FakeNotion()
+        self.counts: Counter[str] = Counter()
+        self._authors = {x["sys"]["id"]: x for x in fixtures.authors}
+        self._assets = {x["sys"]["id"]: x for x in fixtures.assets}
+        self._lock = Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._create_handler())
+        self._server.daemon_threads = True
+        self._thread: Thread | None = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    @property
+    def url_contentful(self) -> str:
+        return f"{self.url}{PREFIX_CONTENTFUL}"
+
+    @property
+    def url_notion(self) -> str:
+        return f"{self.url}{PREFIX_NOTION}"
+
+    def __enter__(self) -> "StubServer":
+        self._thread = Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def count(self, endpoint: str) -> bool:
+        # returns whether this request is throttled
+        with self._lock:
+            self.counts[endpoint] += 1
+            api = endpoint.split(" ", 1)[0]
+            self.counts[api] += 1
+            throttled = (
+                self.throttle_every > 0 and self.counts[api] % self.throttle_every == 0
+            )
+            if throttled:
+                self.counts["throttled"] += 1
+            return throttled
+
+    def handle(self, method: str, path: str, body: bytes) -> tuple[int, dict, bytes]:
+        parts = urlsplit(path)
+        params = dict(parse_qsl(parts.query))
+        if parts.path.startswith(PREFIX_NOTION):
+            endpoint = (
+                "notion query" if parts.path.endswith("/query") else "notion pages"
+            )
+            if self.count(endpoint):
+                return 429, {"Retry-After": str(self.retry_after)}, b"{}"
+            req = Request(f"{self.url}{path}", data=body, method=method)
+            return 200, {}, self.notion(req).read()
+
+        route = parts.path.removeprefix(PREFIX_CONTENTFUL)
+        if route == "/public/entries":
+            endpoint = "contentful listing"
+        elif route.startswith("/assets"):
+            endpoint = "contentful assets"
+        elif route == "/entries":
+            endpoint = "contentful entries"
+        else:
+            return 404, {}, b"{}"
+        if self.count(endpoint):
+            headers = {"X-Contentful-RateLimit-Reset": str(self.retry_after)}
+            return 429, headers, b"{}"
+        if endpoint == "contentful listing":
+            return 200, {}, json.dumps(self.list_items(params)).encode()
+        if route.startswith("/assets/"):
+            asset = self._assets.get(route.removeprefix("/assets/"))
+            if asset is None:
+                return 404, {}, b"{}"
+            return 200, {}, json.dumps(asset).encode()
+        records = self._assets if endpoint == "contentful assets" else self._authors
+        ids = params.get("sys.id[in]", params.get("sys.id", "")).split(",")
+        items = [records[x] for x in ids if x in records]
+        return 200, {}, json.dumps({"items": items, "total": len(items)}).encode()
+
+    def list_items(self, params: dict) -> dict:
+        items = self.fixtures.items
+        if "sys.updatedAt[gte]" in params:
+            items = [
+                x
+                for x in items
+                if x["sys"]["updatedAt"] >= params["sys.updatedAt[gte]"]
+            ]
+        if "sys.createdAt[lte]" in params:
+            items = [
+                x
+                for x in items
+                if x["sys"]["createdAt"] <= params["sys.createdAt[lte]"]
+            ]
+        order = params.get("order")
+        if order is not None:
+            keys = [x.removeprefix("-").removeprefix("sys.") for x in order.split(",")]
+            items = sorted(
+                items,
+                key=lambda x: tuple(x["sys"][k] for k in keys),
+                reverse=order.startswith("-"),
+            )
+        skip = int(params.get("skip", 0))
+        limit = int(params.get("limit", 100))
+        page = items[skip : skip + limit]
+        body = {"items": page, "total": len(items)}
+        if self.with_includes:
+            body["includes"] = {
+                "Entry": [
+                    self._authors[x]
+                    for x in {y["fields"]["author"]["en-US"]["sys"]["id"] for y in page}
+                    if x in self._authors
+                ],
+                "Asset": [
+                    self._assets[y["fields"]["thumbnail"]["en-US"]["sys"]["id"]]
+                    for y in page
+                    if "thumbnail" in y["fields"]
+                    and y["fields"]["thumbnail"]["en-US"]["sys"]["id"] in self._assets
+                ],
+            }
+        return body
+
+    def _create_handler(self) -> type[BaseHTTPRequestHandler]:
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # headers and body go out in separate writes, with Nagle each
+            # response would wait for the delayed ACK of the client
+            disable_nagle_algorithm = True
+
+            def respond(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length) if length > 0 else b""
+                if stub.latency > 0:
+                    sleep(stub.latency)
+                status, headers, data = stub.handle(self.command, self.path, body)
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for k, v in headers.items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = respond
+            do_POST = respond
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,84 @@
+import json
+from datetime import datetime
+from io import BytesIO
+from threading import Lock
+from urllib.request import Request
+
+
+def create_page(*, url: str, created_time: str, title: str = "title") -> dict:
+    def rich_text(value: str) -> list[dict]:
+        return [{"plain_text": value, "text": {"content": value}}]
+
+    return {
+        "object": "page",
+        "created_time": created_time,
+        "properties": {
+            "Title": {"title": rich_text(title)},
+            "URL": {"url": url},
+            "Date": {"rich_text": rich_text("2024.12.01")},
+            "RawDate": {"rich_text": rich_text("2024-12-01 09:00:00+09:00")},
+            "AuthorName": {"rich_text": rich_text("author")},
+            "AuthorUrl": {"url": "https://example.com/author/"},
+            "AuthorAvatar": {"url": "https://example.com/author.png"},
+            "Thumbnail": {"url": "https://example.com/thumbnail.png"},
+        },
+    }
+
+
+def parse_time(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def matches(page: dict, filter_: dict | None) -> bool:
+    if filter_ is None:
+        return True
+    if "and" in filter_:
+        return all(matches(page, x) for x in filter_["and"])
+    condition = filter_["created_time"]
+    created = parse_time(page["created_time"])
+    if "on_or_after" in condition and created < parse_time(condition["on_or_after"]):
+        return False
+    if "before" in condition and created >= parse_time(condition["before"]):
+        return False
+    return True
+
+
+class FakeNotion:
+    """serves the query and create endpoints of a single database"""
+
+    def __init__(self, pages: list[dict] | None = None):
+        self.pages = [] if pages is None else pages
+        self.requests: list[tuple[str, dict]] = []
+        self._lock = Lock()
+
+    def __call__(self, req: Request):
+        body = json.loads(req.data)
+        path = req.full_url.split("/v1", 1)[1]
+        with self._lock:
+            self.requests.append((path, body))
+            if path == "/pages":
+                self.pages.append(
+                    {
+                        "object": "page",
+                        "created_time": datetime.now().astimezone().isoformat(),
+                        "properties": body["properties"],
+                    }
+                )
+                return BytesIO(b"{}")
+            pages = sorted(
+                [x for x in self.pages if matches(x, body.get("filter"))],
+                key=lambda x: parse_time(x["created_time"]),
+            )
+        start = int(body.get("start_cursor") or 0)
+        end = start + body.get("page_size", 100)
+        has_more = end < len(pages)
+        return BytesIO(
+            json.dumps(
+                {
+                    "object": "list",
+                    "results": pages[start:end],
+                    "has_more": has_more,
+                    "next_cursor": str(end) if has_more else None,
+                }
+            ).encode()
+        )
@@ -0,0 +1,91 @@
+from dataclasses import dataclass
+from hashlib import md5
+from io import BytesIO
+from threading import Lock
+
+from botocore.exceptions import ClientError
+
+
+def create_client_error(code: str, operation_name: str) -> ClientError:
+    return ClientError({"Error": {"Code": code, "Message": code}}, operation_name)
+
+
+class NoSuchKey(ClientError):
+    pass
+
+
+class FakeS3Exceptions:
+    NoSuchKey = NoSuchKey
+
+
+@dataclass
+class FakeS3Object:
+    body: bytes
+    etag: str
+    content_type: str | None
+
+
+class FakeS3Client:
+    exceptions = FakeS3Exceptions
+
+    def __init__(self):
+        self.objects: dict[tuple[str, str], FakeS3Object] = {}
+        self.calls: list[tuple[str, str]] = []
+        self._lock = Lock()
+
+    def put_object(
+        self,
+        *,
+        Bucket: str,
+        Key: str,
+        Body: bytes,
+        ContentType: str | None = None,
+        IfMatch: str | None = None,
+        IfNoneMatch: str | None = None,
+        **kwargs,
+    ) -> dict:
+        with self._lock:
+            self.calls.append(("put_object", Key))
+            current = self.objects.get((Bucket, Key))
+            if IfNoneMatch == "*" and current is not None:
+                raise create_client_error("PreconditionFailed", "PutObject")
+            if IfMatch is not None and (current is None or current.etag != IfMatch):
+                raise create_client_error("PreconditionFailed", "PutObject")
+            etag = f'"{md5(Body).hexdigest()}-{len(self.calls)}"'
+            self.objects[(Bucket, Key)] = FakeS3Object(
+                body=Body, etag=etag, content_type=ContentType
+            )
+            return {"ETag": etag}
+
+    def get_object(
+        self, *, Bucket: str, Key: str, IfNoneMatch: str | None = None, **kwargs
+    ) -> dict:
+        with self._lock:
+            self.calls.append(("get_object", Key))
+            current = self.objects.get((Bucket, Key))
+            if current is None:
+                raise NoSuchKey(
+                    {"Error": {"Code": "NoSuchKey", "Message": Key}}, "GetObject"
+                )
+            if IfNoneMatch is not None and IfNoneMatch == current.etag:
+                raise create_client_error("304", "GetObject")
+            return {
+                "Body": BytesIO(current.body),
+                "ETag": current.etag,
+                "ContentType": current.content_type,
+                "ContentLength": len(current.body),
+            }
+
+    def head_object(self, *, Bucket: str, Key: str, **kwargs) -> dict:
+        with self._lock:
+            self.calls.append(("head_object", Key))
+            current = self.objects.get((Bucket, Key))
+            if current is None:
+                raise create_client_error("404", "HeadObject")
+            return {"ETag": current.etag, "ContentLength": len(current.body)}
+
+    def delete_object(self, *, Bucket: str, Key: str, **kwargs) -> dict:
+        with self._lock:
+            self.calls.append(("delete_object", Key))
+            self.objects.pop((Bucket, Key), None)
+            return {}
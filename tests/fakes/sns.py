@@ -0,0 +1,7 @@
+class FakeSnsClient:
+    def __init__(self):
+        self.messages: list[dict] = []
+
+    def publish(self, **kwargs):
+        self.messages.append(kwargs)
+        return {"MessageId": str(len(self.messages))}
@@ -0,0 +1,16 @@
+class FakeSsmClient:
+    def __init__(self, values: dict[str, str]):
+        self.values = values
+        self.calls: list[list[str]] = []
+        self.error: Exception | None = None
+
+    def get_parameters(self, *, Names: list[str], WithDecryption: bool = False) -> dict:
+        self.calls.append(Names)
+        if self.error is not None:
+            raise self.error
+        return {
+            "Parameters": [
+                {"Name": x, "Value": self.values[x]} for x in Names if x in self.values
+            ],
+            "InvalidParameters": [x for x in Names if x not in self.values],
+        }
@@ -2,6 +2,7 @@ from dataclasses import dataclass, field
 from uuid import uuid4
 
 import boto3
+from fakes.s3 import FakeS3Client
 from mypy_boto3_events import EventBridgeClient
 from pytest import MonkeyPatch, fixture
 
@@ -49,3 +50,8 @@ def events_event_bus(request, client_events):
     client_events.create_event_bus(Name=event_bus_name)
     yield
     client_events.delete_event_bus(Name=event_bus_name)
+
+
+@fixture(scope="function")
+def fake_s3() -> FakeS3Client:
+    return FakeS3Client()
@@ -0,0 +1,750 @@
+import json
+from datetime import datetime, timezone
+from inspect import GEN_CLOSED, getgeneratorstate
+from io import BytesIO
+from time import sleep
+from urllib.error import HTTPError
+from urllib.request import Request
+
+import pytest
+from fakes.http_stub import StubServer, create_synthetic_fixtures
+from fakes.notion import FakeNotion, create_page
+from fakes.sns import FakeSnsClient
+from fakes.ssm import FakeSsmClient
+
+import handlers.inserter.inserter as index
+import utils.http.retry as retry
+from utils.aws import parameter_cache
+from utils.http import limiter_contentful, limiter_notion, retry_budget
+from utils.models import Article, Author, CachedData
+
+
+def create_item(*, slug: str, created_at: str, updated_at: str) -> dict:
+    return {
+        "sys": {"id": slug, "createdAt": created_at, "updatedAt": updated_at},
+        "fields": {
+            "slug": {"en-US": slug},
+            "title": {"en-US": f"title {slug}"},
+            "wpThumbnail": {"en-US": f"https://example.com/{slug}.png"},
+            "author": {"en-US": {"sys": {"id": "author-1"}}},
+        },
+    }
+
+
+def create_linked_item(*, slug: str, author_id: str, asset_id: str) -> dict:
+    item = create_item(
+        slug=slug,
+        created_at="2024-12-01T00:00:00.000Z",
+        updated_at="2024-12-01T00:00:00.000Z",
+    )
+    del item["fields"]["wpThumbnail"]
+    item["fields"]["thumbnail"] = {"en-US": {"sys": {"id": asset_id}}}
+    item["fields"]["author"] = {"en-US": {"sys": {"id": author_id}}}
+    return item
+
+
+def create_author_entry(author_id: str) -> dict:
+    return {
+        "sys": {"id": author_id},
+        "fields": {
+            "slug": {"en-US": author_id},
+            "displayName": {"en-US": f"name {author_id}"},
+            "thumbnail": {"en-US": f"https://example.com/{author_id}.png"},
+        },
+    }
+
+
+def create_asset(asset_id: str) -> dict:
+    return {
+        "sys": {"id": asset_id},
+        "fields": {"file": {"en-US": {"url": f"//images.example.com/{asset_id}"}}},
+    }
+
+
+def create_cached_data(**kwargs) -> CachedData:
+    return CachedData(
+        articles={},
+        authors={
+            "author-1": Author(
+                url="https://dev.classmethod.jp/author/author-1/",
+                name="author 1",
+                avatar="https://example.com/author-1.png",
+            )
+        },
+        thumbnails={},
+        list_published=[],
+        **kwargs,
+    )
+
+
+def list_new_articles(
+    *,
+    cached_data: CachedData,
+    sync_mode: index.SyncMode = "incremental",
+    page_workers: int = 1,
+    watermark_overlap_seconds: float = 86400.0,
+) -> tuple[list[Article], index.ListingState]:
+    pages, state = index.open_listing(
+        cached_data=cached_data,
+        token_contentful="token",
+        sync_mode=sync_mode,
+        page_workers=page_workers,
+        watermark_overlap_seconds=watermark_overlap_seconds,
+    )
+    articles = index.iter_new_articles(
+        pages=pages, cached_data=cached_data, token_contentful="token", state=state
+    )
+    return list(articles), state
+
+
+class FakeContentful:
+    def __init__(
+        self,
+        items: list[dict],
+        *,
+        status_with_cursor: int | None = None,
+        linked: list[dict] | None = None,
+        includes: dict | None = None,
+    ):
+        self.items = items
+        self.status_with_cursor = status_with_cursor
+        self.linked = {x["sys"]["id"]: x for x in ([] if linked is None else linked)}
+        self.includes = includes
+        self.urls: list[str] = []
+
+    def __call__(self, req: Request):
+        url = req.full_url
+        self.urls.append(url)
+        if self.status_with_cursor is not None and "sys.updatedAt[gte]" in url:
+            raise HTTPError(url, self.status_with_cursor, "error", {}, BytesIO())
+        params = dict(x.split("=", 1) for x in url.split("?", 1)[1].split("&"))
+        if "sys.id[in]" in params:
+            ids = params["sys.id[in]"].split(",")
+            items = [self.linked[x] for x in ids if x in self.linked]
+            return BytesIO(json.dumps({"items": items, "total": len(items)}).encode())
+        limit = int(params["limit"])
+        skip = int(params["skip"])
+        items = self.items
+        if "sys.updatedAt[gte]" in params:
+            items = sorted(
+                [
+                    x
+                    for x in items
+                    if x["sys"]["updatedAt"] >= params["sys.updatedAt[gte]"]
+                ],
+                key=lambda x: (x["sys"]["updatedAt"], x["sys"]["id"]),
+            )
+        if "sys.createdAt[lte]" in params:
+            items = [
+                x
+                for x in items
+                if x["sys"]["createdAt"] <= params["sys.createdAt[lte]"]
+            ]
+        if params.get("order") == "-sys.createdAt":
+            items = sorted(items, key=lambda x: x["sys"]["createdAt"], reverse=True)
+        body = {"items": items[skip : skip + limit], "total": len(items)}
+        if self.includes is not None:
+            body["includes"] = self.includes
+        return BytesIO(json.dumps(body).encode())
+
+
+ITEMS = [
+    create_item(
+        slug=f"slug-{i}",
+        created_at=f"2024-12-{i + 1:02}T00:00:00.000Z",
+        updated_at=f"2024-12-{i + 1:02}T12:00:00.000Z",
+    )
+    for i in range(5)
+]
+
+
+class TestGetArticles:
+    @pytest.mark.parametrize(
+        "sync_mode, sync_cursor, status_with_cursor, expected",
+        [
+            ("incremental", "2024-12-04T12:00:00.000Z", None, [[3, 4], True]),
+            # a full scan lists the newest first
+            ("incremental", None, None, [[4, 3, 2, 1, 0], False]),
+            ("incremental", "invalid", None, [[4, 3, 2, 1, 0], False]),
+            ("incremental", "2024-12-04T12:00:00.000Z", 400, [[4, 3, 2, 1, 0], True]),
+            ("full", "2024-12-04T12:00:00.000Z", None, [[4, 3, 2, 1, 0], False]),
+        ],
+    )
+    def test_normal(
+        self, monkeypatch, sync_mode, sync_cursor, status_with_cursor, expected
+    ):
+        fake = FakeContentful(ITEMS, status_with_cursor=status_with_cursor)
+        monkeypatch.setattr(index, "client_contentful", fake)
+        actual, state = list_new_articles(
+            cached_data=create_cached_data(sync_cursor=sync_cursor),
+            sync_mode=sync_mode,
+        )
+        assert state.sync_cursor == "2024-12-05T12:00:00.000Z"
+        assert [x.url for x in actual] == [
+            f"https://dev.classmethod.jp/articles/slug-{i}/" for i in expected[0]
+        ]
+        assert any("sys.updatedAt[gte]" in x for x in fake.urls) == expected[1]
+
+    @pytest.mark.parametrize("page_workers", [1, 4])
+    def test_page_order(self, monkeypatch, page_workers):
+        items = [
+            create_item(
+                slug=f"slug-{i}",
+                created_at="2024-12-01T00:00:00.000Z",
+                updated_at="2024-12-01T00:00:00.000Z",
+            )
+            for i in range(450)
+        ]
+        fake = FakeContentful(items)
+
+        def slow_first_pages(req: Request):
+            skip = int(req.full_url.split("skip=")[1].split("&")[0])
+            sleep(0.05 if skip == 100 else 0)
+            return fake(req)
+
+        monkeypatch.setattr(index, "client_contentful", slow_first_pages)
+        actual, _ = list_new_articles(
+            cached_data=create_cached_data(), page_workers=page_workers
+        )
+        assert len(fake.urls) == 5
+        assert [x.url for x in actual] == [
+            f"https://dev.classmethod.jp/articles/slug-{i}/" for i in range(450)
+        ]
+
+    def test_skip_cached(self, monkeypatch):
+        monkeypatch.setattr(index, "client_contentful", FakeContentful(ITEMS * 30))
+        cached_data = create_cached_data()
+        for item in ITEMS[:3]:
+            article = index.convert_article(
+                item=item, cached_data=cached_data, token_contentful="token"
+            )
+            cached_data.articles[article.url] = article
+        actual, _ = list_new_articles(cached_data=cached_data)
+        assert [x.url for x in actual] == [
+            "https://dev.classmethod.jp/articles/slug-4/",
+            "https://dev.classmethod.jp/articles/slug-3/",
+        ]
+
+    def test_updated_during_scan(self, monkeypatch):
+        items = [
+            create_item(
+                slug=f"slug-{i:03}",
+                created_at="2024-12-01T00:00:00.000Z",
+                updated_at=f"2024-12-02T00:{i // 60:02}:{i % 60:02}.000Z",
+            )
+            for i in range(250)
+        ]
+        fake = FakeContentful(items)
+
+        def update_listed(req: Request):
+            resp = fake(req)
+            # an entry of the first page is edited while the scan goes on
+            items[0]["sys"]["updatedAt"] = "2024-12-03T00:00:00.000Z"
+            return resp
+
+        monkeypatch.setattr(index, "client_contentful", update_listed)
+        actual, state = list_new_articles(
+            cached_data=create_cached_data(sync_cursor="2024-12-01T00:00:00.000Z"),
+            page_workers=4,
+        )
+        assert sorted(x.url for x in actual) == [
+            f"https://dev.classmethod.jp/articles/slug-{i:03}/" for i in range(250)
+        ]
+        assert state.sync_cursor == "2024-12-03T00:00:00.000Z"
+
+    def test_same_updated_at(self, monkeypatch):
+        items = [
+            create_item(
+                slug=f"slug-{i:03}",
+                created_at="2024-12-01T00:00:00.000Z",
+                updated_at="2024-12-02T00:00:00.000Z",
+            )
+            for i in range(250)
+        ]
+        fake = FakeContentful(items)
+        monkeypatch.setattr(index, "client_contentful", fake)
+        actual, _ = list_new_articles(
+            cached_data=create_cached_data(sync_cursor="2024-12-01T00:00:00.000Z")
+        )
+        assert [x.url for x in actual] == [
+            f"https://dev.classmethod.jp/articles/slug-{i:03}/" for i in range(250)
+        ]
+        assert all("order=sys.updatedAt,sys.id" in x for x in fake.urls)
+
+    def test_close(self, monkeypatch):
+        monkeypatch.setattr(index, "client_contentful", FakeContentful(ITEMS * 100))
+        pages, state = index.open_listing(
+            cached_data=create_cached_data(),
+            token_contentful="token",
+            sync_mode="full",
+            page_workers=4,
+        )
+        articles = index.iter_new_articles(
+            pages=pages,
+            cached_data=create_cached_data(),
+            token_contentful="token",
+            state=state,
+        )
+        next(articles)
+        articles.close()
+        assert getgeneratorstate(pages) == GEN_CLOSED
+
+
+class TestWatermark:
+    ITEMS = [
+        create_item(
+            slug=f"slug-{i}",
+            created_at=f"2024-{i // 28 + 1:02}-{i % 28 + 1:02}T00:00:00.000Z",
+            updated_at="2024-12-31T00:00:00.000Z",
+        )
+        for i in range(300)
+    ]
+
+    @pytest.mark.parametrize(
+        "watermark, expected_requests, expected_new",
+        [
+            (None, 3, 300),
+            ("invalid", 3, 300),
+            # newest page covers the overlap, the second page is fully below
+            ("2024-11-20T00:00:00.000Z", 2, 0),
+            ("2024-08-01T00:00:00.000Z", 3, 0),
+        ],
+    )
+    def test_normal(self, monkeypatch, watermark, expected_requests, expected_new):
+        fake = FakeContentful(self.ITEMS)
+        monkeypatch.setattr(index, "client_contentful", fake)
+        cached_data = create_cached_data(
+            sync_cursor="2024-06-01T00:00:00.000Z", watermark=watermark
+        )
+        if expected_new == 0:
+            for x in self.ITEMS:
+                url = index.create_article_url(slug=x["fields"]["slug"]["en-US"])
+                cached_data.articles[url] = None
+        actual, state = list_new_articles(
+            cached_data=cached_data,
+            sync_mode="watermark",
+            page_workers=4,
+            watermark_overlap_seconds=86400 * 7,
+        )
+        assert len(fake.urls) == expected_requests
+        assert all("order=-sys.createdAt" in x for x in fake.urls)
+        assert len(actual) == expected_new
+        assert state.watermark == "2024-11-20T00:00:00.000Z"
+        if watermark in (None, "invalid"):
+            assert state.sync_cursor == "2024-12-31T00:00:00.000Z"
+        else:
+            assert state.sync_cursor == "2024-06-01T00:00:00.000Z"
+
+    def test_new_within_overlap(self, monkeypatch):
+        monkeypatch.setattr(index, "client_contentful", FakeContentful(self.ITEMS))
+        cached_data = create_cached_data(watermark="2024-11-20T00:00:00.000Z")
+        for x in self.ITEMS[:-3]:
+            url = index.create_article_url(slug=x["fields"]["slug"]["en-US"])
+            cached_data.articles[url] = None
+        actual, _ = list_new_articles(cached_data=cached_data, sync_mode="watermark")
+        assert [x.url for x in actual] == [
+            f"https://dev.classmethod.jp/articles/slug-{i}/" for i in (299, 298, 297)
+        ]
+
+
+class TestResolveLinked:
+    LINKED_ITEMS = [
+        create_linked_item(slug=f"slug-{i}", author_id=f"a-{i % 3}", asset_id=f"t-{i}")
+        for i in range(10)
+    ]
+
+    @pytest.mark.parametrize(
+        "linked, includes, expected_requests",
+        [
+            (
+                [create_author_entry(f"a-{i}") for i in range(3)]
+                + [create_asset(f"t-{i}") for i in range(10)],
+                None,
+                3,
+            ),
+            (
+                [create_asset(f"t-{i}") for i in range(10)],
+                {"Entry": [create_author_entry(f"a-{i}") for i in range(3)]},
+                2,
+            ),
+        ],
+    )
+    def test_normal(self, monkeypatch, linked, includes, expected_requests):
+        fake = FakeContentful(self.LINKED_ITEMS, linked=linked, includes=includes)
+        monkeypatch.setattr(index, "client_contentful", fake)
+        cached_data = create_cached_data()
+        actual, _ = list_new_articles(cached_data=cached_data)
+        assert len(fake.urls) == expected_requests
+        assert [x.thumbnail for x in actual] == [
+            f"//images.example.com/t-{i}" for i in range(10)
+        ]
+        assert [x.author.name for x in actual] == [f"name a-{i % 3}" for i in range(10)]
+        assert sorted(cached_data.thumbnails.keys()) == sorted(
+            f"t-{i}" for i in range(10)
+        )
+
+    def test_skip_cached(self, monkeypatch):
+        fake = FakeContentful(
+            self.LINKED_ITEMS,
+            linked=[create_author_entry(f"a-{i}") for i in range(3)]
+            + [create_asset(f"t-{i}") for i in range(10)],
+        )
+        monkeypatch.setattr(index, "client_contentful", fake)
+        cached_data = create_cached_data()
+        articles, _ = list_new_articles(cached_data=create_cached_data())
+        for article in articles[:9]:
+            cached_data.articles[article.url] = article
+        fake.urls.clear()
+        actual, _ = list_new_articles(cached_data=cached_data)
+        assert [x.url for x in actual] == [
+            "https://dev.classmethod.jp/articles/slug-9/"
+        ]
+        assert sorted(
+            x.split("sys.id[in]=")[1].split("&")[0] for x in fake.urls[1:]
+        ) == [
+            "a-0",
+            "t-9",
+        ]
+
+
+class TestInsertArticles:
+    @pytest.mark.parametrize("workers", [1, 3])
+    def test_normal(self, monkeypatch, workers):
+        requests = []
+        monkeypatch.setattr(index, "client_notion", requests.append)
+        cached_data = create_cached_data()
+        articles = [
+            index.convert_article(
+                item=x, cached_data=cached_data, token_contentful="token"
+            )
+            for x in ITEMS
+        ]
+        actual = index.insert_articles(
+            articles=articles,
+            cached_data=cached_data,
+            notion_database_id="database",
+            notion_token="token",
+            workers=workers,
+        )
+        assert actual.inserted == 5
+        assert len(requests) == 5
+        assert set(cached_data.articles.keys()) == {x.url for x in articles}
+
+    def test_partial_failure(self, monkeypatch):
+        def client_notion(req: Request):
+            body = json.loads(req.data)
+            if body["properties"]["URL"]["url"].endswith("/slug-2/"):
+                raise HTTPError(req.full_url, 500, "error", {}, BytesIO())
+
+        monkeypatch.setattr(index, "client_notion", client_notion)
+        cached_data = create_cached_data()
+        articles = [
+            index.convert_article(
+                item=x, cached_data=cached_data, token_contentful="token"
+            )
+            for x in ITEMS
+        ]
+        with pytest.raises(HTTPError):
+            index.insert_articles(
+                articles=articles,
+                cached_data=cached_data,
+                notion_database_id="database",
+                notion_token="token",
+                workers=1,
+            )
+        assert set(cached_data.articles.keys()) == {
+            "https://dev.classmethod.jp/articles/slug-0/",
+            "https://dev.classmethod.jp/articles/slug-1/",
+        }
+
+    def test_streaming(self, monkeypatch):
+        events = []
+        monkeypatch.setattr(
+            index,
+            "client_notion",
+            lambda req: events.append(("insert", json.loads(req.data))),
+        )
+        cached_data = create_cached_data()
+
+        def iter_articles():
+            for x in ITEMS:
+                events.append(("fetch", x))
+                yield index.convert_article(
+                    item=x, cached_data=cached_data, token_contentful="token"
+                )
+                sleep(0.02)
+
+        actual = index.insert_articles(
+            articles=iter_articles(),
+            cached_data=cached_data,
+            notion_database_id="database",
+            notion_token="token",
+            workers=2,
+            max_in_flight=2,
+        )
+        assert actual.inserted == 5
+        kinds = [x[0] for x in events]
+        assert kinds.index("insert") < len(kinds) - 1 - kinds[::-1].index("fetch")
+
+    def test_upstream_failure(self, monkeypatch):
+        requests = []
+        monkeypatch.setattr(index, "client_notion", requests.append)
+        cached_data = create_cached_data()
+
+        def iter_articles():
+            for x in ITEMS[:3]:
+                yield index.convert_article(
+                    item=x, cached_data=cached_data, token_contentful="token"
+                )
+            raise HTTPError("https://example.com", 500, "error", {}, BytesIO())
+
+        with pytest.raises(HTTPError):
+            index.insert_articles(
+                articles=iter_articles(),
+                cached_data=cached_data,
+                notion_database_id="database",
+                notion_token="token",
+                workers=3,
+            )
+        assert len(requests) == 3
+        assert len(cached_data.articles) == 3
+
+
+class TestRebuildFromDatabase:
+    PAGES = [
+        create_page(
+            url=f"https://dev.classmethod.jp/articles/slug-{i}/",
+            created_time=f"{2019 + i % 6}-{i % 12 + 1:02}-01T00:00:00.000Z",
+        )
+        for i in range(250)
+    ]
+
+    @pytest.mark.parametrize(
+        "count, workers, expected_requests",
+        [(1, 1, 3), (4, 3, 5)],
+    )
+    def test_normal(self, monkeypatch, count, workers, expected_requests):
+        fake = FakeNotion(list(self.PAGES))
+        monkeypatch.setattr(index, "client_notion", fake)
+        cached_data = create_cached_data()
+        actual = index.rebuild_from_database(
+            cached_data=cached_data,
+            notion_database_id="database",
+            notion_token="token",
+            workers=workers,
+            partitions=index.create_partitions(
+                since=datetime(2020, 1, 1, tzinfo=timezone.utc),
+                until=datetime(2024, 1, 1, tzinfo=timezone.utc),
+                count=count,
+            ),
+        )
+        assert actual == 250
+        assert set(cached_data.articles.keys()) == {
+            x["properties"]["URL"]["url"] for x in self.PAGES
+        }
+        assert len(fake.requests) == expected_requests
+        # the rebuilt articles are not listed as new again
+        monkeypatch.setattr(index, "client_contentful", FakeContentful(ITEMS))
+        fetched, _ = list_new_articles(cached_data=cached_data)
+        assert fetched == []
+
+    def test_partitions(self):
+        since = datetime(2020, 1, 1, tzinfo=timezone.utc)
+        actual = index.create_partitions(
+            since=since, until=datetime(2024, 1, 1, tzinfo=timezone.utc), count=5
+        )
+        assert len(actual) == 5
+        assert actual[0].after is None and actual[-1].before is None
+        assert actual[1].after == since
+        for a, b in zip(actual, actual[1:]):
+            assert a.before == b.after
+
+
+class TestDeadline:
+    ITEMS = [
+        create_item(
+            slug=f"slug-{i}",
+            created_at=f"2024-{i // 28 + 1:02}-{i % 28 + 1:02}T00:00:00.000Z",
+            updated_at=f"2024-12-01T00:00:{i % 60:02}.000Z",
+        )
+        for i in range(250)
+    ]
+
+    @pytest.fixture
+    def clock(self, monkeypatch) -> list[float]:
+        now = [0.0]
+        monkeypatch.setattr(index, "monotonic", lambda: now[0])
+        return now
+
+    def run(self, *, cached_data: CachedData, clock: list[float], stop_after: int):
+        pages, state = index.open_listing(
+            cached_data=cached_data,
+            token_contentful="token",
+            sync_mode="incremental",
+            page_workers=2,
+        )
+        articles = index.iter_new_articles(
+            pages=pages,
+            cached_data=cached_data,
+            token_contentful="token",
+            state=state,
+        )
+
+        def iter_articles():
+            for i, x in enumerate(articles, start=1):
+                if i == stop_after:
+                    clock[0] = 100.0
+                yield x
+
+        try:
+            result = index.insert_articles(
+                articles=iter_articles(),
+                cached_data=cached_data,
+                notion_database_id="database",
+                notion_token="token",
+                workers=2,
+                deadline=50.0,
+            )
+        finally:
+            articles.close()
+        index.update_cursors(
+            cached_data=cached_data, state=state, interrupted=result.interrupted
+        )
+        return result
+
+    def test_insert_articles(self, monkeypatch, clock):
+        requests = []
+        monkeypatch.setattr(index, "client_notion", requests.append)
+        clock[0] = 100.0
+        cached_data = create_cached_data()
+        actual = index.insert_articles(
+            articles=iter(
+                index.convert_article(
+                    item=x, cached_data=cached_data, token_contentful="token"
+                )
+                for x in ITEMS
+            ),
+            cached_data=cached_data,
+            notion_database_id="database",
+            notion_token="token",
+            deadline=50.0,
+        )
+        assert actual.interrupted
+        assert actual.inserted == 0
+        assert requests == []
+
+    def test_resume(self, monkeypatch, clock):
+        requests = []
+        monkeypatch.setattr(index, "client_notion", requests.append)
+        fake = FakeContentful(self.ITEMS)
+        monkeypatch.setattr(index, "client_contentful", fake)
+        cached_data = create_cached_data()
+
+        first = self.run(cached_data=cached_data, clock=clock, stop_after=120)
+        assert first.interrupted
+        assert first.inserted == 120
+        # the newest ones went first, the cursors wait for the complete scan
+        assert set(cached_data.articles.keys()) == {
+            f"https://dev.classmethod.jp/articles/slug-{i}/" for i in range(130, 250)
+        }
+        assert cached_data.sync_cursor is None
+        assert (
+            cached_data.resume_point.created_before
+            == (self.ITEMS[130]["sys"]["createdAt"])
+        )
+
+        clock[0] = 0.0
+        fake.urls.clear()
+        second = self.run(cached_data=cached_data, clock=clock, stop_after=-1)
+        assert not second.interrupted
+        assert second.inserted == 130
+        assert len(requests) == 250
+        assert all("sys.createdAt[lte]" in x for x in fake.urls)
+        assert cached_data.resume_point is None
+        assert cached_data.sync_cursor == "2024-12-01T00:00:59.000Z"
+
+
+class TestMain:
+    PARAMETERS = {
+        "token-contentful": "token",
+        "notion-database-id": "database",
+        "notion-token": "token",
+    }
+
+    @pytest.fixture(autouse=True)
+    def environments(self, monkeypatch, fake_s3):
+        monkeypatch.setenv("SSM_PARAMETER_NAME_TOKEN_CONTENTFUL", "token-contentful")
+        monkeypatch.setenv(
+            "SSM_PARAMETER_NAME_NOTION_DATABASE_ID", "notion-database-id"
+        )
+        monkeypatch.setenv("SSM_PARAMETER_NAME_NOTION_TOKEN", "notion-token")
+        monkeypatch.setenv("BUCKET_NAME_DATA", f"bucket-{id(fake_s3)}")
+        monkeypatch.setenv("SNS_TOPIC_ARN", "topic")
+        # the stub answers at once, the real API limits would only slow this
+        monkeypatch.setattr(limiter_contentful, "rate", 1000.0)
+        monkeypatch.setattr(limiter_notion, "rate", 1000.0)
+        monkeypatch.setattr(retry, "sleep", lambda _: None)
+        monkeypatch.setattr(retry_budget, "max_retries", 100)
+        parameter_cache.invalidate()
+        retry_budget.reset()
+
+    def run(self, stub: StubServer, fake_s3) -> FakeSnsClient:
+        client_sns = FakeSnsClient()
+        index.main(
+            client_ssm=FakeSsmClient(self.PARAMETERS),
+            client_s3=fake_s3,
+            client_sns=client_sns,
+        )
+        return client_sns
+
+    @pytest.mark.parametrize(
+        "throttle_every, with_includes", [(0, True), (0, False), (20, True)]
+    )
+    def test_normal(self, monkeypatch, fake_s3, throttle_every, with_includes):
+        fixtures = create_synthetic_fixtures(size=150, authors=5)
+        with StubServer(
+            fixtures,
+            throttle_every=throttle_every,
+            retry_after=0.01,
+            with_includes=with_includes,
+        ) as stub:
+            monkeypatch.setattr(index, "URL_CONTENTFUL_SPACE", stub.url_contentful)
+            monkeypatch.setattr(index, "URL_NOTION_API", stub.url_notion)
+            client_sns = self.run(stub, fake_s3)
+            assert len(stub.notion.pages) == 150
+            assert len(client_sns.messages) == 1
+            assert (stub.counts["contentful assets"] > 0) != with_includes
+            cached_data = CachedData.load(
+                bucket=f"bucket-{id(fake_s3)}", client=fake_s3
+            )
+            assert len(cached_data.articles) == 150
+            assert cached_data.sync_cursor == fixtures.items[0]["sys"]["updatedAt"]
+
+            # nothing is new on the next run
+            client_sns = self.run(stub, fake_s3)
+            assert len(stub.notion.pages) == 150
+            assert client_sns.messages == []
+
+    def test_listing_closed_on_error(self, monkeypatch, fake_s3):
+        listings = []
+        open_listing = index.open_listing
+
+        def record_listing(**kwargs):
+            pages, state = open_listing(**kwargs)
+            listings.append(pages)
+            return pages, state
+
+        # the rebuild of the missing cache still queries the database
+        def client_notion(req: Request):
+            if req.full_url.endswith("/pages"):
+                raise HTTPError(req.full_url, 400, "error", {}, BytesIO())
+            return stub.notion(req)
+
+        monkeypatch.setattr(index, "open_listing", record_listing)
+        monkeypatch.setattr(index, "client_notion", client_notion)
+        fixtures = create_synthetic_fixtures(size=450, authors=5)
+        with StubServer(fixtures) as stub:
+            monkeypatch.setattr(index, "URL_CONTENTFUL_SPACE", stub.url_contentful)
+            with pytest.raises(HTTPError):
+                self.run(stub, fake_s3)
+        assert [getgeneratorstate(x) for x in listings] == [GEN_CLOSED]
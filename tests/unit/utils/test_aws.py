@@ -0,0 +1,99 @@
+import pytest
+from botocore.config import Config
+from fakes.ssm import FakeSsmClient
+
+from utils.aws import ClientRegistry, ParameterCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestParameterCache:
+    def test_batched(self):
+        client = FakeSsmClient({f"/p/{i}": f"v{i}" for i in range(25)})
+        cache = ParameterCache()
+        actual = cache.get_parameters([f"/p/{i}" for i in range(25)], client=client)
+        assert actual == {f"/p/{i}": f"v{i}" for i in range(25)}
+        assert [len(x) for x in client.calls] == [10, 10, 5]
+        assert cache.miss_count == 25
+
+    def test_hit(self):
+        client = FakeSsmClient({"/a": "1", "/b": "2"})
+        cache = ParameterCache(ttl=60.0, clock=Clock())
+        cache.get_parameters(["/a", "/b"], client=client)
+        # a different client instance still hits
+        actual = cache.get_parameters(["/b", "/a"], client=FakeSsmClient({}))
+        assert list(actual.items()) == [("/b", "2"), ("/a", "1")]
+        assert len(client.calls) == 1
+        assert (cache.hit_count, cache.miss_count) == (2, 2)
+
+    def test_stale_while_revalidate(self):
+        client = FakeSsmClient({"/a": "1"})
+        clock = Clock()
+        cache = ParameterCache(ttl=60.0, max_stale=600.0, clock=clock)
+        cache.get_parameters(["/a"], client=client)
+        client.values["/a"] = "rotated"
+        clock.now = 120.0
+        # the refresh finishes before the call returns, nothing is left running
+        assert cache.get_parameters(["/a"], client=client) == {"/a": "rotated"}
+        assert cache.get_parameters(["/a"], client=client) == {"/a": "rotated"}
+        assert (cache.stale_count, cache.hit_count) == (1, 1)
+        assert len(client.calls) == 2
+
+    def test_expired(self):
+        client = FakeSsmClient({"/a": "1"})
+        clock = Clock()
+        cache = ParameterCache(ttl=60.0, max_stale=600.0, clock=clock)
+        cache.get_parameters(["/a"], client=client)
+        client.values["/a"] = "rotated"
+        clock.now = 1000.0
+        assert cache.get_parameters(["/a"], client=client) == {"/a": "rotated"}
+        assert cache.miss_count == 2
+
+    def test_refresh_error_keeps_value(self):
+        client = FakeSsmClient({"/a": "1"})
+        clock = Clock()
+        cache = ParameterCache(ttl=60.0, max_stale=600.0, clock=clock)
+        cache.get_parameters(["/a"], client=client)
+        client.error = RuntimeError("throttled")
+        clock.now = 120.0
+        assert cache.get_parameters(["/a"], client=client) == {"/a": "1"}
+        assert cache.refresh_error_count == 1
+        # the next caller tries again
+        client.error = None
+        client.values["/a"] = "rotated"
+        assert cache.get_parameters(["/a"], client=client) == {"/a": "rotated"}
+
+    def test_not_found(self):
+        cache = ParameterCache()
+        with pytest.raises(KeyError):
+            cache.get_parameters(["/missing"], client=FakeSsmClient({}))
+
+
+class TestClientRegistry:
+    def test_cached(self):
+        registry = ClientRegistry()
+        client = registry.get("s3")
+        assert registry.get("s3") is client
+        assert registry.get("s3", config=Config(read_timeout=1)) is not client
+        assert registry.get("s3", region_name="us-east-1") is not client
+        assert set(registry.creation_seconds.keys()) == {"s3"}
+
+    def test_shared_session(self):
+        registry = ClientRegistry()
+        registry.get("s3")
+        registry.get("sns")
+        assert registry.session is registry.session
+        assert set(registry.creation_seconds.keys()) == {"s3", "sns"}
+
+    def test_register(self):
+        registry = ClientRegistry()
+        stub = object()
+        registry.register("ssm", stub)
+        assert registry.get("ssm") is stub
+        assert registry.creation_seconds == {}
@@ -0,0 +1,315 @@
+import json
+import socket
+from concurrent.futures import ThreadPoolExecutor
+from http.client import RemoteDisconnected
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from threading import Thread
+from time import monotonic
+from urllib.error import HTTPError, URLError
+from urllib.request import Request
+
+import pytest
+from pytest import fixture
+
+import utils.http.rate_limiter as rate_limiter
+import utils.http.retry as retry
+from utils.http import (
+    ConnectionPool,
+    RateLimiter,
+    RetryBudget,
+    RetryPolicy,
+    TokenBucket,
+    create_rate_limited_getter,
+    create_retrying_getter,
+)
+from utils.http.retry import is_notion_idempotent
+
+
+class DummyResponse(BytesIO):
+    def __init__(self, *, status: int = 200, headers: dict | None = None):
+        super().__init__(b"{}")
+        self.status = status
+        self.headers = {} if headers is None else headers
+
+
+class TestTokenBucket:
+    def test_burst(self):
+        bucket = TokenBucket(rate=10.0, burst=3)
+        waits = [bucket.reserve() for _ in range(5)]
+        assert waits[:3] == [0, 0, 0]
+        assert waits[3] == pytest.approx(0.1, abs=0.01)
+        assert waits[4] == pytest.approx(0.2, abs=0.01)
+        assert bucket.throttled_count == 2
+        assert bucket.throttled_seconds == pytest.approx(0.3, abs=0.02)
+
+    def test_concurrent(self):
+        bucket = TokenBucket(rate=50.0, burst=1)
+        start = monotonic()
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda _: bucket.acquire(), range(11)))
+        assert monotonic() - start >= 0.19
+
+    @pytest.mark.parametrize(
+        "status, headers, expected",
+        [
+            (200, {"X-Contentful-RateLimit-Second-Limit": "10"}, [10.0, 0.0]),
+            (429, {"X-Contentful-RateLimit-Reset": "2"}, [4.0, 2.0]),
+            (429, {"Retry-After": "1"}, [4.0, 1.0]),
+            (200, {}, [8.0, 0.0]),
+        ],
+    )
+    def test_observe(self, status, headers, expected):
+        bucket = TokenBucket(rate=8.0, burst=8)
+        bucket.observe(status=status, headers=headers)
+        assert bucket.rate == expected[0]
+        assert bucket.reserve() == pytest.approx(expected[1], abs=0.01)
+
+    def test_spaced_after_429(self):
+        bucket = TokenBucket(rate=8.0, burst=8)
+        bucket.observe(status=429, headers={"X-Contentful-RateLimit-Reset": "2"})
+        waits = [bucket.reserve() for _ in range(4)]
+        assert waits == pytest.approx([2.0, 2.25, 2.5, 2.75], abs=0.01)
+
+    def test_blocked_after_reserve(self, monkeypatch):
+        now = [0.0]
+        monkeypatch.setattr(rate_limiter, "monotonic", lambda: now[0])
+        bucket = TokenBucket(rate=10.0, burst=1)
+        bucket.acquire()
+
+        def sleep(seconds: float):
+            if now[0] == 0.0:
+                # another request gets a 429 while this one waits for its slot
+                bucket.observe(status=429, headers={"Retry-After": "2"})
+            now[0] += seconds
+
+        monkeypatch.setattr(rate_limiter, "sleep", sleep)
+        bucket.acquire()
+        # behind the block, spaced at the halved rate
+        assert now[0] == pytest.approx(2.2)
+
+
+class TestCreateRateLimitedGetter:
+    def test_observe_error(self):
+        limiter = RateLimiter(rate=8.0, burst=8)
+
+        def send(req: Request):
+            raise HTTPError(req.full_url, 429, "", {"Retry-After": "3"}, None)
+
+        getter = create_rate_limited_getter(limiter, send=send)
+        with pytest.raises(HTTPError):
+            getter(Request("https://api.notion.com/v1/pages"))
+        assert limiter.buckets["api.notion.com"].rate == 4.0
+
+    def test_per_host(self):
+        limiter = RateLimiter(rate=8.0, burst=1)
+        getter = create_rate_limited_getter(limiter, send=lambda _: DummyResponse())
+        getter(Request("https://a.example.com/"))
+        getter(Request("https://b.example.com/"))
+        assert set(limiter.buckets.keys()) == {"a.example.com", "b.example.com"}
+        assert limiter.throttled_count == 0
+
+
+class FlakySend:
+    def __init__(self, errors: list[Exception]):
+        self.errors = errors
+        self.count = 0
+
+    def __call__(self, req: Request):
+        self.count += 1
+        if len(self.errors) > 0:
+            raise self.errors.pop(0)
+        return DummyResponse()
+
+
+def create_http_error(status: int, headers: dict | None = None) -> HTTPError:
+    return HTTPError("https://example.com", status, "", headers or {}, None)
+
+
+class TestCreateRetryingGetter:
+    @pytest.fixture(autouse=True)
+    def sleeps(self, monkeypatch) -> list[float]:
+        sleeps = []
+        monkeypatch.setattr(retry, "sleep", sleeps.append)
+        return sleeps
+
+    @pytest.mark.parametrize(
+        "method, url, error, expected_count",
+        [
+            ("GET", "https://example.com/", create_http_error(503), 2),
+            ("GET", "https://example.com/", create_http_error(500), 2),
+            ("GET", "https://example.com/", URLError("timed out"), 2),
+            ("GET", "https://example.com/", create_http_error(404), 1),
+            ("POST", "https://api.notion.com/v1/pages", create_http_error(429), 2),
+            # a POST may have been applied, only an explicit rejection is resent
+            ("POST", "https://api.notion.com/v1/pages", create_http_error(500), 1),
+            ("POST", "https://api.notion.com/v1/pages", TimeoutError(), 1),
+            ("POST", "https://api.notion.com/v1/databases/x/query", TimeoutError(), 2),
+        ],
+    )
+    def test_classify(self, method, url, error, expected_count):
+        send = FlakySend([error])
+        getter = create_retrying_getter(
+            RetryPolicy(budget=RetryBudget(max_retries=10)),
+            send=send,
+            is_idempotent=is_notion_idempotent,
+        )
+        req = Request(url, method=method)
+        if expected_count == 1:
+            with pytest.raises(type(error)):
+                getter(req)
+        else:
+            getter(req)
+        assert send.count == expected_count
+
+    def test_backoff(self, sleeps):
+        send = FlakySend([create_http_error(503) for _ in range(3)])
+        policy = RetryPolicy(
+            budget=RetryBudget(max_retries=10), base_seconds=1.0, max_seconds=3.0
+        )
+        create_retrying_getter(policy, send=send)(Request("https://example.com/"))
+        assert send.count == 4
+        for attempt, actual in enumerate(sleeps, start=1):
+            assert 0 <= actual <= min(3.0, 2**attempt)
+
+    def test_max_attempts(self):
+        send = FlakySend([create_http_error(503) for _ in range(5)])
+        policy = RetryPolicy(budget=RetryBudget(max_retries=10), max_attempts=3)
+        with pytest.raises(HTTPError):
+            create_retrying_getter(policy, send=send)(Request("https://example.com/"))
+        assert send.count == 3
+
+    def test_budget(self):
+        budget = RetryBudget(max_retries=2)
+        send = FlakySend([create_http_error(503) for _ in range(3)])
+        getter = create_retrying_getter(RetryPolicy(budget=budget), send=send)
+        with pytest.raises(HTTPError):
+            getter(Request("https://example.com/"))
+        assert send.count == 3
+        assert budget.exhausted_count == 1
+        # the budget is shared until the next invocation resets it
+        send = FlakySend([create_http_error(503)])
+        with pytest.raises(HTTPError):
+            create_retrying_getter(RetryPolicy(budget=budget), send=send)(
+                Request("https://example.com/")
+            )
+        budget.reset()
+        send = FlakySend([create_http_error(503)])
+        create_retrying_getter(RetryPolicy(budget=budget), send=send)(
+            Request("https://example.com/")
+        )
+        assert send.count == 2
+
+    @pytest.mark.parametrize(
+        "remaining_seconds, headers, expected_count",
+        [
+            (60.0, {}, 2),
+            (3.0, {}, 1),
+            # the wait announced by the server counts against the deadline
+            (60.0, {"Retry-After": "58"}, 1),
+        ],
+    )
+    def test_deadline(self, remaining_seconds, headers, expected_count):
+        budget = RetryBudget(max_retries=10)
+        budget.reset(remaining_seconds=remaining_seconds)
+        send = FlakySend([create_http_error(429, headers)])
+        getter = create_retrying_getter(
+            RetryPolicy(budget=budget, attempt_seconds=5.0), send=send
+        )
+        if expected_count == 1:
+            with pytest.raises(HTTPError):
+                getter(Request("https://example.com/"))
+        else:
+            getter(Request("https://example.com/"))
+        assert send.count == expected_count
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    received_posts: list[str] = []
+
+    def do_GET(self):
+        status = 404 if self.path.startswith("/missing") else 200
+        body = json.dumps({"path": self.path}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers["Content-Length"])
+        body = self.rfile.read(length)
+        self.received_posts.append(self.path)
+        if self.path.startswith("/drop"):
+            self.close_connection = True
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@fixture(scope="function")
+def local_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+class TestConnectionPool:
+    def test_reuse(self, local_server):
+        pool = ConnectionPool(max_size=2)
+        for i in range(5):
+            resp = pool.request(Request(f"{local_server}/items?i={i}"))
+            assert json.loads(resp.read()) == {"path": f"/items?i={i}"}
+        resp = pool.request(Request(local_server, data=b"body", method="POST"))
+        assert resp.read() == b"body"
+        assert pool.created_count == 1
+        assert pool.reused_count == 5
+
+    def test_concurrent(self, local_server):
+        pool = ConnectionPool(max_size=3)
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            bodies = list(
+                executor.map(
+                    lambda i: pool.request(Request(f"{local_server}/{i}")).read(),
+                    range(30),
+                )
+            )
+        assert [json.loads(x)["path"] for x in bodies] == [f"/{i}" for i in range(30)]
+        assert pool.created_count <= 3
+
+    def test_http_error(self, local_server):
+        pool = ConnectionPool()
+        with pytest.raises(HTTPError) as e:
+            pool.request(Request(f"{local_server}/missing"))
+        assert e.value.code == 404
+        assert json.loads(e.value.read()) == {"path": "/missing"}
+        pool.request(Request(f"{local_server}/found"))
+        assert pool.created_count == 1
+
+    def test_stale_connection(self, local_server):
+        pool = ConnectionPool()
+        pool.request(Request(f"{local_server}/first"))
+        for idle in pool._idle.values():
+            for conn, _ in idle:
+                conn.sock.shutdown(socket.SHUT_RDWR)
+        resp = pool.request(Request(f"{local_server}/second"))
+        assert json.loads(resp.read()) == {"path": "/second"}
+        assert pool.created_count == 2
+
+    def test_stale_post_not_replayed(self, local_server):
+        KeepAliveHandler.received_posts.clear()
+        pool = ConnectionPool()
+        pool.request(Request(f"{local_server}/first"))
+        with pytest.raises(RemoteDisconnected):
+            pool.request(Request(f"{local_server}/drop", data=b"body", method="POST"))
+        assert KeepAliveHandler.received_posts == ["/drop"]
+        assert pool.created_count == 1
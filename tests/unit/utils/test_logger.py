@@ -0,0 +1,245 @@
+import json
+from importlib import import_module
+from threading import Event
+from urllib.request import Request
+
+import pytest
+
+from utils.logger import Metrics, create_logger, logging_function, logging_handler
+from utils.logger.create_logger import serialize_record
+
+logger = create_logger(__name__)
+
+
+def read_records(caplog) -> list[dict]:
+    return [{"message": x.getMessage(), "data": x.data} for x in caplog.records]
+
+
+class TestLoggingFunction:
+    def test_fast_path(self, caplog, monkeypatch):
+        monkeypatch.delenv("LOGGING_FUNCTION_SAMPLE_RATE", raising=False)
+
+        @logging_function(logger)
+        def add(a: int, b: int) -> int:
+            return a + b
+
+        assert add(1, b=2) == 3
+        assert read_records(caplog) == []
+
+    def test_error(self, caplog):
+        @logging_function(logger)
+        def fail(a: int):
+            raise ValueError(f"error {a}")
+
+        with pytest.raises(ValueError):
+            fail(1)
+        records = read_records(caplog)
+        assert [x["message"] for x in records] == [
+            "error occurred: error 1",
+            f'failed function "fail" ({records[1]["data"]["CallID"]})',
+        ]
+        assert records[1]["data"]["Args"] == (1,)
+        assert records[1]["data"]["Duration"]["TotalSeconds"] >= 0
+
+    @pytest.mark.parametrize(
+        "kwargs, env, expected",
+        [
+            ({"write": True}, None, 2),
+            ({"sample_rate": 1.0}, None, 2),
+            ({"sample_rate": 0.0}, "1.0", 0),
+            ({}, "1.0", 2),
+            ({}, "invalid", 0),
+        ],
+    )
+    def test_write(self, caplog, monkeypatch, kwargs, env, expected):
+        if env is None:
+            monkeypatch.delenv("LOGGING_FUNCTION_SAMPLE_RATE", raising=False)
+        else:
+            monkeypatch.setenv("LOGGING_FUNCTION_SAMPLE_RATE", env)
+
+        @logging_function(logger, with_return=True, **kwargs)
+        def add(a: int, b: int) -> int:
+            return a + b
+
+        assert add(1, 2) == 3
+        records = read_records(caplog)
+        assert len(records) == expected
+        if expected > 0:
+            assert records[0]["data"]["CallID"] == records[1]["data"]["CallID"]
+            assert records[1]["data"]["Return"] == 3
+
+    def test_call_id_unique(self, caplog):
+        @logging_function(logger, write=True)
+        def noop():
+            pass
+
+        noop()
+        noop()
+        ids = {x["data"]["CallID"] for x in read_records(caplog)}
+        assert len(ids) == 2
+
+
+class TestSerializeRecord:
+    def test_small(self):
+        log = {"message": "m", "data": {"a": [1, 2], "b": (3,), "c": None}}
+        assert json.loads(serialize_record(log)) == {
+            "message": "m",
+            "data": {"a": [1, 2], "b": [3], "c": None},
+        }
+
+    def test_large_containers(self):
+        log = {"data": {"list": list(range(1000)), "text": "x" * 10000}}
+        actual = json.loads(serialize_record(log))["data"]
+        assert actual["list"]["length"] == 1000
+        assert actual["list"]["preview"] == [0, 1, 2, 3, 4]
+        assert actual["text"].endswith("(5904 chars truncated)")
+
+    @pytest.mark.parametrize(
+        "size, expected_type",
+        [
+            (100, "bytes (base64 encoded)"),
+            (2000, "bytes (base64 encoded, gzip compressed)"),
+            (1024 * 1024, "bytes (base64 encoded preview)"),
+        ],
+    )
+    def test_bytes(self, size, expected_type):
+        actual = json.loads(serialize_record({"data": b"a" * size}))["data"]
+        assert actual["type"] == expected_type
+
+    def test_request_redacted(self):
+        req = Request("https://example.com", headers={"Authorization": "Bearer secret"})
+        text = serialize_record({"data": req})
+        assert "secret" not in text
+        assert json.loads(text)["data"]["value"]["full_url"] == "https://example.com"
+
+    @pytest.mark.parametrize("budget", [2048, 600])
+    def test_budget(self, monkeypatch, budget):
+        # the package exports a function of the same name as the module
+        module = import_module("utils.logger.create_logger")
+        monkeypatch.setattr(module, "MAX_RECORD_BYTES", budget)
+        log = {"message": "m", "data": [f"{i}" * 200 for i in range(40)]}
+        text = serialize_record(log)
+        assert len(text.encode()) <= budget
+        actual = json.loads(text)
+        assert actual["message"] == "m"
+        if budget == 2048:
+            assert actual["data"]["length"] == 40
+        else:
+            assert actual["data"]["truncated"] == "record"
+
+
+class TestLoggingHandler:
+    @pytest.fixture(autouse=True)
+    def environment_logged(self, monkeypatch):
+        module = import_module("utils.logger.logging_handler")
+        monkeypatch.setattr(module, "environment_logged", Event())
+
+    def events_logged(self, caplog) -> list[dict]:
+        return [x.data for x in caplog.records if x.getMessage().startswith("event")]
+
+    def test_sampled(self, caplog, dummy_context):
+        @logging_handler(logger, event_sample_every=3)
+        def handler(event, context):
+            return event["i"]
+
+        for i in range(7):
+            handler({"i": i}, dummy_context)
+        logged = self.events_logged(caplog)
+        assert [x["event"]["i"] for x in logged] == [0, 3, 6]
+        # the environment is logged once per container
+        assert ["env" in x for x in logged] == [True, False, False]
+
+    def test_failed(self, caplog, dummy_context):
+        @logging_handler(logger, event_sample_every=100)
+        def handler(event, context):
+            if event["i"] > 0:
+                raise ValueError("error")
+
+        handler({"i": 0}, dummy_context)
+        with pytest.raises(ValueError):
+            handler({"i": 1}, dummy_context)
+        assert [x["event"]["i"] for x in self.events_logged(caplog)] == [0, 1]
+
+    def test_size_cap(self, caplog, dummy_context):
+        @logging_handler(logger, max_event_bytes=100)
+        def handler(event, context):
+            pass
+
+        handler({"payload": "x" * 1000}, dummy_context)
+        (logged,) = self.events_logged(caplog)
+        assert logged["event"]["truncated"] == "event"
+        assert len(logged["event"]["preview"]) == 100
+
+    def test_size_cap_summarized(self, caplog, dummy_context):
+        serialized = []
+
+        class Tail:
+            def __str__(self):
+                serialized.append(self)
+                return "tail"
+
+        @logging_handler(logger, max_event_bytes=1000)
+        def handler(event, context):
+            pass
+
+        handler({"records": [*range(100000), Tail()]}, dummy_context)
+        (logged,) = self.events_logged(caplog)
+        assert logged["event"]["records"]["length"] == 100001
+        # the event is summarized before it is measured, never walked in full
+        assert serialized == []
+
+    def test_metrics(self, capsys, dummy_context):
+        metrics = Metrics(namespace="test")
+
+        @logging_handler(logger, metrics=metrics)
+        def handler(event, context):
+            metrics.add("Calls")
+            raise ValueError("error")
+
+        with pytest.raises(ValueError):
+            handler({}, dummy_context)
+        # metrics are flushed also when the invocation fails
+        (document,) = [json.loads(x) for x in capsys.readouterr().out.splitlines()]
+        assert document["Calls"] == 1
+
+
+class TestMetrics:
+    def read_documents(self, capsys) -> list[dict]:
+        return [json.loads(x) for x in capsys.readouterr().out.splitlines()]
+
+    def test_flush(self, capsys):
+        metrics = Metrics(namespace="test")
+        metrics.add("Inserts")
+        metrics.add("Inserts", 2)
+        metrics.add("Bytes", 10, unit="Bytes")
+        with metrics.timer("Latency"):
+            pass
+        metrics.flush(service="service")
+        (document,) = self.read_documents(capsys)
+        (directive,) = document["_aws"]["CloudWatchMetrics"]
+        assert directive["Namespace"] == "test"
+        assert directive["Dimensions"] == [["Service"]]
+        assert {x["Name"]: x["Unit"] for x in directive["Metrics"]} == {
+            "Inserts": "Count",
+            "Bytes": "Bytes",
+            "Latency": "Milliseconds",
+        }
+        assert document["Service"] == "service"
+        assert document["Inserts"] == 3
+        assert len(document["Latency"]) == 1
+        # the values are reset by a flush
+        metrics.flush(service="service")
+        assert self.read_documents(capsys) == []
+
+    def test_chunked(self, capsys):
+        metrics = Metrics(namespace="test")
+        for i in range(150):
+            metrics.add(f"Counter{i}")
+        for i in range(250):
+            metrics.observe("Latency", i)
+        metrics.flush(service="service")
+        documents = self.read_documents(capsys)
+        for x in documents:
+            assert len(x["_aws"]["CloudWatchMetrics"][0]["Metrics"]) <= 100
+        assert sum(len(x.get("Latency", [])) for x in documents) == 250
+        assert sum(x.get("Counter149", 0) for x in documents) == 1
@@ -0,0 +1,362 @@
+import json
+from gzip import compress
+
+import pytest
+
+import utils.models.models as models
+from utils.models import (
+    Article,
+    Author,
+    CachedData,
+    Checkpointer,
+    Codec,
+    ResumePoint,
+)
+from utils.models.models import (
+    KEY_CACHED_DATA,
+    KEY_MANIFEST,
+    detect_codec,
+    get_manifest,
+    load_from_manifest,
+)
+
+BUCKET = "test-bucket"
+
+
+def create_article(i: int) -> Article:
+    return Article(
+        url=f"https://dev.classmethod.jp/articles/slug-{i}/",
+        thumbnail=f"https://example.com/{i}.png",
+        title=f"title {i}",
+        date="2024.12.01",
+        raw_date="2024-12-01 09:00:00+09:00",
+        author=Author(url="https://example.com/a/", name="a", avatar="avatar"),
+    )
+
+
+class TestCachedDataSave:
+    def test_round_trip(self, fake_s3):
+        data = CachedData.load(bucket=BUCKET, client=fake_s3)
+        assert data.is_missing()
+        data.articles[create_article(1).url] = create_article(1)
+        data.sync_cursor = "2024-12-01T00:00:00.000Z"
+        data.save(bucket=BUCKET, client=fake_s3)
+        actual = CachedData.load(bucket=BUCKET, client=fake_s3)
+        assert actual.model_dump() == data.model_dump()
+        assert not actual.is_missing()
+        # a watermark change alone is still persisted
+        actual.watermark = "2024-11-30T00:00:00.000Z"
+        actual.save(bucket=BUCKET, client=fake_s3)
+        assert (
+            CachedData.load(bucket=BUCKET, client=fake_s3).watermark
+            == "2024-11-30T00:00:00.000Z"
+        )
+        # so is a resume point, and its removal
+        actual.resume_point = ResumePoint(created_before="2024-06-01T00:00:00.000Z")
+        actual.save(bucket=BUCKET, client=fake_s3)
+        loaded = CachedData.load(bucket=BUCKET, client=fake_s3)
+        assert loaded.resume_point == actual.resume_point
+        loaded.resume_point = None
+        loaded.save(bucket=BUCKET, client=fake_s3)
+        assert CachedData.load(bucket=BUCKET, client=fake_s3).resume_point is None
+
+    def test_concurrent_runs(self, fake_s3):
+        CachedData.load(bucket=BUCKET, client=fake_s3).save(
+            bucket=BUCKET, client=fake_s3
+        )
+        run_a = CachedData.load(bucket=BUCKET, client=fake_s3)
+        run_b = CachedData.load(bucket=BUCKET, client=fake_s3)
+        run_a.articles[create_article(1).url] = create_article(1)
+        run_a.sync_cursor = "2024-12-02T00:00:00.000Z"
+        run_b.articles[create_article(2).url] = create_article(2)
+        run_b.sync_cursor = "2024-12-01T00:00:00.000Z"
+        run_a.save(bucket=BUCKET, client=fake_s3)
+        run_b.save(bucket=BUCKET, client=fake_s3)
+        actual = CachedData.load(bucket=BUCKET, client=fake_s3)
+        assert set(actual.articles.keys()) == {
+            create_article(1).url,
+            create_article(2).url,
+        }
+        assert actual.sync_cursor == "2024-12-02T00:00:00.000Z"
+
+    def test_new_object_conflict(self, fake_s3):
+        run_a = CachedData.load(bucket=BUCKET, client=fake_s3)
+        run_b = CachedData.load(bucket=BUCKET, client=fake_s3)
+        run_a.articles[create_article(1).url] = create_article(1)
+        run_b.articles[create_article(2).url] = create_article(2)
+        run_a.save(bucket=BUCKET, client=fake_s3)
+        run_b.save(bucket=BUCKET, client=fake_s3)
+        actual = CachedData.load(bucket=BUCKET, client=fake_s3)
+        assert len(actual.articles) == 2
+
+    def test_delta_only(self, fake_s3):
+        data = CachedData.load(bucket=BUCKET, client=fake_s3)
+        for i in range(3):
+            data.articles[create_article(i).url] = create_article(i)
+            data.save(bucket=BUCKET, client=fake_s3)
+        data.save(bucket=BUCKET, client=fake_s3)
+        manifest, _ = get_manifest(bucket=BUCKET, client=fake_s3)
+        assert manifest.base is None
+        assert len(manifest.segments) == 3
+        for i, key in enumerate(manifest.segments):
+            segment = CachedData.from_compressed_binary(
+                fake_s3.objects[(BUCKET, key)].body
+            )
+            assert list(segment.articles.keys()) == [create_article(i).url]
+
+    def test_legacy(self, fake_s3):
+        legacy = CachedData.empty()
+        legacy.articles[create_article(0).url] = create_article(0)
+        fake_s3.put_object(
+            Bucket=BUCKET, Key=KEY_CACHED_DATA, Body=compress(legacy.to_json().encode())
+        )
+        data = CachedData.load(bucket=BUCKET, client=fake_s3)
+        assert data.model_dump() == legacy.model_dump()
+        assert not data.is_missing()
+        data.articles[create_article(1).url] = create_article(1)
+        data.save(bucket=BUCKET, client=fake_s3)
+        manifest, _ = get_manifest(bucket=BUCKET, client=fake_s3)
+        assert manifest.base == KEY_CACHED_DATA
+        assert len(CachedData.load(bucket=BUCKET, client=fake_s3).articles) == 2
+
+
+class TestCachedDataWarm:
+    @pytest.fixture(autouse=True)
+    def warm_cache(self, monkeypatch):
+        monkeypatch.setattr(models, "_warm_cache", {})
+
+    def test_not_modified(self, fake_s3):
+        data = CachedData.load(bucket=BUCKET, client=fake_s3, warm=True)
+        data.articles[create_article(1).url] = create_article(1)
+        data.save(bucket=BUCKET, client=fake_s3)
+        fake_s3.calls.clear()
+        actual = CachedData.load(bucket=BUCKET, client=fake_s3, warm=True)
+        assert actual is data
+        assert fake_s3.calls == [("get_object", KEY_MANIFEST)]
+
+    def test_appended_elsewhere(self, fake_s3):
+        data = CachedData.load(bucket=BUCKET, client=fake_s3, warm=True)
+        data.articles[create_article(1).url] = create_article(1)
+        data.save(bucket=BUCKET, client=fake_s3)
+        other = CachedData.load(bucket=BUCKET, client=fake_s3)
+        other.articles[create_article(2).url] = create_article(2)
+        other.save(bucket=BUCKET, client=fake_s3)
+        fake_s3.calls.clear()
+        actual = CachedData.load(bucket=BUCKET, client=fake_s3, warm=True)
+        assert actual is data
+        assert [x[1] for x in fake_s3.calls] == [
+            KEY_MANIFEST,
+            other._manifest.segments[-1],
+        ]
+        assert (
+            actual.model_dump()
+            == CachedData.load(bucket=BUCKET, client=fake_s3).model_dump()
+        )
+
+    def test_unsaved_changes(self, fake_s3):
+        data = CachedData.load(bucket=BUCKET, client=fake_s3, warm=True)
+        data.articles[create_article(1).url] = create_article(1)
+        data.save(bucket=BUCKET, client=fake_s3)
+        data.articles[create_article(2).url] = create_article(2)
+        actual = CachedData.load(bucket=BUCKET, client=fake_s3, warm=True)
+        assert actual is not data
+        assert set(actual.articles.keys()) == {create_article(1).url}
+
+    def test_compacted(self, fake_s3):
+        data = CachedData.load(bucket=BUCKET, client=fake_s3, warm=True)
+        data.articles[create_article(1).url] = create_article(1)
+        data.save(bucket=BUCKET, client=fake_s3)
+        assert data.compact(bucket=BUCKET, client=fake_s3, min_segments=1)
+        fake_s3.calls.clear()
+        assert CachedData.load(bucket=BUCKET, client=fake_s3, warm=True) is data
+        assert len(fake_s3.calls) == 1
+
+    def test_spill(self, fake_s3, tmp_path, monkeypatch):
+        data = CachedData.load(bucket=BUCKET, client=fake_s3)
+        data.articles[create_article(1).url] = create_article(1)
+        data.sync_cursor = "2024-12-01T00:00:00.000Z"
+        data.save(bucket=BUCKET, client=fake_s3)
+        data.compact(bucket=BUCKET, client=fake_s3, min_segments=1)
+        CachedData.load(
+            bucket=BUCKET, client=fake_s3, warm=True, spill_dir=str(tmp_path)
+        )
+        # a fresh runtime only has what was spilled to disk
+        monkeypatch.setattr(models, "_warm_cache", {})
+        fake_s3.calls.clear()
+        actual = CachedData.load(
+            bucket=BUCKET, client=fake_s3, warm=True, spill_dir=str(tmp_path)
+        )
+        assert fake_s3.calls == [("get_object", KEY_MANIFEST)]
+        assert actual.has_article(create_article(1).url)
+        assert actual.sync_cursor == "2024-12-01T00:00:00.000Z"
+        assert actual.delta() is None
+
+
+class TestCachedDataCompact:
+    def test_normal(self, fake_s3):
+        data = CachedData.load(bucket=BUCKET, client=fake_s3)
+        for i in range(4):
+            data.articles[create_article(i).url] = create_article(i)
+            data.save(bucket=BUCKET, client=fake_s3)
+        assert not data.compact(bucket=BUCKET, client=fake_s3, min_segments=5)
+        assert data.compact(bucket=BUCKET, client=fake_s3, min_segments=4)
+        manifest, _ = get_manifest(bucket=BUCKET, client=fake_s3)
+        assert manifest.segments == []
+        assert len(manifest.retired) == 4
+        loaded = CachedData.load(bucket=BUCKET, client=fake_s3)
+        assert loaded.articles == {}
+        assert all(loaded.has_article(create_article(i).url) for i in range(4))
+        assert not loaded.has_article(create_article(9).url)
+        folded = load_from_manifest(
+            bucket=BUCKET, client=fake_s3, manifest=loaded._manifest
+        )
+        assert folded.model_dump() == data.model_dump()
+
+        data.articles[create_article(9).url] = create_article(9)
+        data.save(bucket=BUCKET, client=fake_s3)
+        assert data.compact(
+            bucket=BUCKET, client=fake_s3, min_segments=1, retention_seconds=0
+        )
+        manifest, _ = get_manifest(bucket=BUCKET, client=fake_s3)
+        assert len(manifest.retired) == 4
+        assert sorted(k for _, k in fake_s3.objects.keys()) == sorted(
+            [
+                KEY_MANIFEST,
+                manifest.base,
+                manifest.base_articles,
+                manifest.base_index,
+                *[x.key for x in manifest.retired],
+            ]
+        )
+        folded = load_from_manifest(bucket=BUCKET, client=fake_s3, manifest=manifest)
+        assert len(folded.articles) == 5
+
+    def test_keeps_resume_point(self, fake_s3):
+        data = CachedData.load(bucket=BUCKET, client=fake_s3)
+        data.articles[create_article(0).url] = create_article(0)
+        data.resume_point = ResumePoint(created_before="2024-06-01T00:00:00.000Z")
+        data.save(bucket=BUCKET, client=fake_s3)
+        assert data.compact(bucket=BUCKET, client=fake_s3, min_segments=1)
+        # the second compaction folds a split base and no segment
+        assert data.compact(bucket=BUCKET, client=fake_s3, min_segments=0)
+        loaded = CachedData.load(bucket=BUCKET, client=fake_s3)
+        assert loaded.resume_point == data.resume_point
+
+    def test_legacy_is_split(self, fake_s3):
+        legacy = CachedData.empty()
+        legacy.articles[create_article(0).url] = create_article(0)
+        fake_s3.put_object(
+            Bucket=BUCKET, Key=KEY_CACHED_DATA, Body=compress(legacy.to_json().encode())
+        )
+        data = CachedData.load(bucket=BUCKET, client=fake_s3)
+        data.articles[create_article(1).url] = create_article(1)
+        data.save(bucket=BUCKET, client=fake_s3)
+        assert data.compact(
+            bucket=BUCKET, client=fake_s3, min_segments=24, retention_seconds=0
+        )
+        loaded = CachedData.load(bucket=BUCKET, client=fake_s3)
+        assert loaded.articles == {}
+        assert loaded.has_article(create_article(0).url)
+        assert loaded.has_article(create_article(1).url)
+        # kept for a rollback, even once the retired objects are deleted
+        assert data.compact(
+            bucket=BUCKET, client=fake_s3, min_segments=0, retention_seconds=0
+        )
+        manifest, _ = get_manifest(bucket=BUCKET, client=fake_s3)
+        assert KEY_CACHED_DATA not in [x.key for x in manifest.retired]
+        assert (BUCKET, KEY_CACHED_DATA) in fake_s3.objects
+
+
+class TestCheckpointer:
+    @pytest.mark.parametrize(
+        "every_inserts, every_seconds, expected", [(3, 600, 3), (100, 0, 10)]
+    )
+    def test_normal(self, fake_s3, every_inserts, every_seconds, expected):
+        data = CachedData.load(bucket=BUCKET, client=fake_s3)
+        checkpointer = Checkpointer(
+            cached_data=data,
+            bucket=BUCKET,
+            client=fake_s3,
+            every_inserts=every_inserts,
+            every_seconds=every_seconds,
+        )
+        for i in range(10):
+            data.articles[create_article(i).url] = create_article(i)
+            checkpointer.record()
+        assert checkpointer.saved_count == expected
+
+
+class TestCodec:
+    @pytest.mark.parametrize(
+        "text",
+        [
+            "json+gzip",
+            "json+zlib:1",
+            "json+lzma",
+            "json",
+            "msgpack+gzip",
+            "msgpack+zstd:3",
+            "json+zstd",
+        ],
+    )
+    @pytest.mark.parametrize("with_content_type", [True, False])
+    def test_round_trip(self, text, with_content_type):
+        if text.startswith("msgpack"):
+            pytest.importorskip("msgpack")
+        if "zstd" in text:
+            pytest.importorskip("zstandard")
+        codec = Codec.parse(text)
+        data = CachedData.empty()
+        for i in range(3):
+            data.articles[create_article(i).url] = create_article(i)
+        binary = data.to_compressed_binary(codec)
+        actual = CachedData.from_compressed_binary(
+            binary, content_type=codec.content_type if with_content_type else None
+        )
+        assert actual.model_dump() == data.model_dump()
+
+    @pytest.mark.parametrize("text", ["json+gzip", "json", "msgpack+zstd:3"])
+    def test_entries(self, text):
+        if text.startswith("msgpack"):
+            pytest.importorskip("msgpack")
+        if "zstd" in text:
+            pytest.importorskip("zstandard")
+        codec = Codec.parse(text)
+        data = CachedData.empty()
+        for i in range(3):
+            data.articles[create_article(i).url] = create_article(i)
+        data.sync_cursor = "2024-12-01T00:00:00.000Z"
+        rest = {}
+        entries = list(
+            codec.iter_entries(data.to_compressed_binary(codec), "articles", rest)
+        )
+        assert [k for k, _ in entries] == list(data.articles.keys())
+        assert rest["sync_cursor"] == data.sync_cursor
+        binary = codec.encode_entries(
+            CachedData.model_validate({**rest, "articles": {}}), "articles", entries
+        )
+        # the framing of a streamed compression differs, the payload does not
+        assert codec.decompress(binary) == codec.decompress(
+            data.to_compressed_binary(codec)
+        )
+
+    def test_entries_whitespace(self):
+        data = CachedData.empty()
+        data.articles[create_article(0).url] = create_article(0)
+        text = json.dumps(data.model_dump(), indent=2).encode()
+        rest = {}
+        entries = list(Codec(compression="none").iter_entries(text, "articles", rest))
+        assert entries == [(create_article(0).url, create_article(0).model_dump())]
+        assert rest["list_published"] == []
+
+    def test_legacy(self):
+        data = CachedData.empty()
+        data.articles[create_article(0).url] = create_article(0)
+        binary = compress(json.dumps(data.model_dump()).encode())
+        assert detect_codec(content_type="application/gzip", binary=binary) == Codec()
+        actual = CachedData.from_compressed_binary(binary)
+        assert actual.model_dump() == data.model_dump()
+
+    def test_unknown(self):
+        with pytest.raises(ValueError):
+            Codec.parse("yaml+gzip")